@@ -166,7 +166,7 @@ AUTH_USER_MODEL ='images_rest_api.CustomUser'
 
 
 STORAGES = {
-    "default": {"BACKEND": "storages.backends.s3boto3.S3Boto3Storage"},
+    "default": {"BACKEND": "images_rest_api.storage.PooledS3Storage"},
     "staticfiles": {"BACKEND": "storages.backends.s3boto3.S3StaticStorage"},
 }
 
@@ -181,6 +181,72 @@ AWS_QUERYSTRING_AUTH = os.environ.get("AWS_QUERYSTRING_AUTH")
 AWS_S3_CUSTOM_DOMAIN = os.environ.get("AWS_S3_CUSTOM_DOMAIN")
 AWS_CLOUDFRONT_KEY_ID = os.environ.get("AWS_CLOUDFRONT_KEY_ID")
 AWS_CLOUDFRONT_KEY = os.environ.get("AWS_CLOUDFRONT_KEY")
+AWS_S3_MAX_POOL_CONNECTIONS = int(os.environ.get("AWS_S3_MAX_POOL_CONNECTIONS", 50))
+AWS_S3_TCP_KEEPALIVE = os.environ.get("AWS_S3_TCP_KEEPALIVE", "True") == "True"
+AWS_S3_CONNECT_TIMEOUT = float(os.environ.get("AWS_S3_CONNECT_TIMEOUT", 5))
+AWS_S3_READ_TIMEOUT = float(os.environ.get("AWS_S3_READ_TIMEOUT", 60))
+AWS_S3_MAX_ATTEMPTS = int(os.environ.get("AWS_S3_MAX_ATTEMPTS", 3))
+
+TEMPORARY_LINK_SIGNER = os.environ.get(
+    "TEMPORARY_LINK_SIGNER", "images_rest_api.links.S3LinkSigner"
+)
+TEMPORARY_LINK_CACHE_SIZE = int(os.environ.get("TEMPORARY_LINK_CACHE_SIZE", 10000))
+TEMPORARY_LINK_MIN_LIFETIME = float(os.environ.get("TEMPORARY_LINK_MIN_LIFETIME", 0.9))
+TEMPORARY_LINKS_MAX_FILES = int(os.environ.get("TEMPORARY_LINKS_MAX_FILES", 500))
+STORAGE_PUBLIC_PREFIXES = [
+    prefix
+    for prefix in os.environ.get("STORAGE_PUBLIC_PREFIXES", "").split(",")
+    if prefix
+]
+
+JOBS_RUN_EAGERLY = os.environ.get("JOBS_RUN_EAGERLY", "False") == "True"
+JOBS_MAX_ATTEMPTS = int(os.environ.get("JOBS_MAX_ATTEMPTS", 5))
+JOBS_LEASE_SECONDS = int(os.environ.get("JOBS_LEASE_SECONDS", 600))
+JOBS_POLL_INTERVAL = float(os.environ.get("JOBS_POLL_INTERVAL", 1))
+JOBS_HOUSEKEEPING_INTERVAL = float(
+    os.environ.get("JOBS_HOUSEKEEPING_INTERVAL", 30)
+)
+
+THUMBNAIL_RENDER_WORKERS = int(
+    os.environ.get("THUMBNAIL_RENDER_WORKERS", os.cpu_count() or 1)
+)
+THUMBNAIL_RENDER_QUEUE_SIZE = int(
+    os.environ.get("THUMBNAIL_RENDER_QUEUE_SIZE", 2 * THUMBNAIL_RENDER_WORKERS or 1)
+)
+
+IMAGE_UPLOAD_MAX_SIZE = int(os.environ.get("IMAGE_UPLOAD_MAX_SIZE", 20 * 2**20))
+IMAGE_MAX_PIXELS = int(os.environ.get("IMAGE_MAX_PIXELS", 500_000_000))
+BATCH_UPLOAD_MAX_FILES = int(os.environ.get("BATCH_UPLOAD_MAX_FILES", 50))
+BATCH_UPLOAD_MAX_SIZE = int(os.environ.get("BATCH_UPLOAD_MAX_SIZE", 200 * 2**20))
+DATA_UPLOAD_MAX_NUMBER_FILES = max(BATCH_UPLOAD_MAX_FILES, 100)
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", 500))
+IMPORT_BATCH_MAX_BYTES = int(
+    os.environ.get("IMPORT_BATCH_MAX_BYTES", 100 * 2**20)
+)
+IMPORT_ARCHIVE_MAX_SIZE = int(
+    os.environ.get("IMPORT_ARCHIVE_MAX_SIZE", 10 * 2**30)
+)
+UPLOAD_TICKET_MAX_AGE = int(os.environ.get("UPLOAD_TICKET_MAX_AGE", 3600))
+DIRECT_UPLOAD_EXPIRES = int(os.environ.get("DIRECT_UPLOAD_EXPIRES", 3600))
+# S3 requires parts of at least 5 MiB, except the last one.
+RESUMABLE_UPLOAD_PART_SIZE = int(
+    os.environ.get("RESUMABLE_UPLOAD_PART_SIZE", 8 * 2**20)
+)
+
+DECODE_PIXEL_BUDGET = int(os.environ.get("DECODE_PIXEL_BUDGET", 200_000_000))
+DECODE_BUDGET_TIMEOUT = float(os.environ.get("DECODE_BUDGET_TIMEOUT", 10))
+
+THUMBNAIL_STRIP_MIN_PIXELS = int(
+    os.environ.get("THUMBNAIL_STRIP_MIN_PIXELS", 50_000_000)
+)
+THUMBNAIL_STRIP_PIXELS = int(os.environ.get("THUMBNAIL_STRIP_PIXELS", 4_000_000))
+
+STORAGE_UPLOAD_CONCURRENCY = int(os.environ.get("STORAGE_UPLOAD_CONCURRENCY", 8))
+EXPORT_READ_AHEAD = int(os.environ.get("EXPORT_READ_AHEAD", 8))
+EXPORT_DOWNLOAD_CONCURRENCY = int(os.environ.get("EXPORT_DOWNLOAD_CONCURRENCY", 8))
+TOMBSTONE_BATCH_SIZE = int(os.environ.get("TOMBSTONE_BATCH_SIZE", 1000))
+ACCOUNT_PURGE_CHUNK_SIZE = int(os.environ.get("ACCOUNT_PURGE_CHUNK_SIZE", 1000))
+BULK_DELETE_MAX_IMAGES = int(os.environ.get("BULK_DELETE_MAX_IMAGES", 1000))
 
 REST_KNOX = {
     'USER_SERIALIZER': 'images_rest_api.serializers.UserSerializer'
@@ -5,3 +5,6 @@ STORAGES = {
         "BACKEND": "django.core.files.storage.memory.InMemoryStorage",
     },
 }
+
+JOBS_RUN_EAGERLY = True
+THUMBNAIL_RENDER_WORKERS = 0
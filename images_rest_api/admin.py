@@ -1,7 +1,9 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.forms import UserCreationForm
-from .models import AccountType, ThumbnailSize, CustomUser, UserImage, Thumbnail
+from .jobs import enqueue_account_purge
+from .models import (AccountType, ThumbnailSize, CustomUser, UserImage, Thumbnail,
+                     Job, Blob)
 from django import forms
 
 
@@ -12,6 +14,7 @@ class AccountTypeAdmin(admin.ModelAdmin):
         "name",
         "orginal_image_link",
         "time_limited_link",
+        "max_image_pixels",
         "display_thumbs",
     )
 
@@ -78,12 +81,43 @@ class CustomUserAdmin(UserAdmin):
         ),
     )
 
+    def get_deleted_objects(self, objs, request):
+        # Listing every image of the users would load them all, they are
+        # purged by a background job instead.
+        objs = list(objs)
+        return (
+            [str(obj) for obj in objs],
+            {CustomUser._meta.verbose_name_plural: len(objs)},
+            set(),
+            [],
+        )
+
+    def delete_model(self, request, obj):
+        enqueue_account_purge(obj)
+
+    def delete_queryset(self, request, queryset):
+        for user in queryset:
+            enqueue_account_purge(user)
+
 
 @admin.register(UserImage)
 class UserImageAdmin(admin.ModelAdmin):
-    list_display = ("name", "system_name", "author")
+    list_display = ("name", "system_name", "author", "status")
 
 
 @admin.register(Thumbnail)
 class ThumbnailAdmin(admin.ModelAdmin):
     list_display = ("__str__", "system_name", "author", "size")
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "status", "attempts", "run_after", "locked_by")
+    list_filter = ("kind", "status")
+
+
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    list_display = ("name", "size", "refcount", "created_at")
+    search_fields = ("digest", "name")
+    readonly_fields = ("digest", "name", "size", "refcount", "created_at")
@@ -0,0 +1,73 @@
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from rest_framework import exceptions, status
+
+
+class DecodeBudgetExceeded(exceptions.APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "The server is busy processing other images, try again later."
+    default_code = "decode_budget_exceeded"
+
+    def __init__(self, detail=None, code=None, wait=None):
+        super().__init__(detail, code)
+        # Sent back as the Retry-After header.
+        self.wait = wait
+
+
+class PixelBudget:
+    """
+    Counting semaphore measured in decoded pixels.
+
+    Limits how many pixels all threads of a process may have decoded at the
+    same time. An image bigger than the whole budget is admitted alone.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.in_use = 0
+        self._condition = threading.Condition()
+        self._held = threading.local()
+
+    @contextmanager
+    def reserve(self, pixels, timeout=None):
+        """
+        Hold `pixels` of the budget for the duration of the block.
+
+        Waits for free budget for up to `timeout` seconds (forever if None)
+        and then raises DecodeBudgetExceeded. A reservation nested in another
+        one of the same thread only takes what the outer one doesn't cover.
+        """
+        held = getattr(self._held, "pixels", 0)
+        extra = max(min(pixels, self.capacity) - held, 0)
+
+        with self._condition:
+            admitted = self._condition.wait_for(
+                lambda: self.in_use + extra <= self.capacity, timeout
+            )
+            if not admitted:
+                raise DecodeBudgetExceeded(wait=max(int(timeout), 1))
+            self.in_use += extra
+
+        self._held.pixels = held + extra
+        try:
+            yield
+        finally:
+            self._held.pixels = held
+            with self._condition:
+                self.in_use -= extra
+                self._condition.notify_all()
+
+
+_decode_budget = None
+_decode_budget_lock = threading.Lock()
+
+
+def get_decode_budget():
+    global _decode_budget
+
+    with _decode_budget_lock:
+        if _decode_budget is None:
+            _decode_budget = PixelBudget(settings.DECODE_PIXEL_BUDGET)
+        return _decode_budget
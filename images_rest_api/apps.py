@@ -1,4 +1,6 @@
 from django.apps import AppConfig
+from django.conf import settings
+from PIL import Image
 
 
 class ImagesRestApiConfig(AppConfig):
@@ -8,3 +10,7 @@ class ImagesRestApiConfig(AppConfig):
     def ready(self):
         import images_rest_api.signals 
         import images_rest_api.scheme
+
+        # Pillow's own decompression bomb check. Per account limits are
+        # enforced by AddImageSerializer.
+        Image.MAX_IMAGE_PIXELS = settings.IMAGE_MAX_PIXELS
@@ -0,0 +1,150 @@
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from .models import Thumbnail, UserImage
+
+EXPORT_CHOICES = ["all", "originals", "thumbnails"]
+
+_download_pool = None
+_download_pool_lock = threading.Lock()
+
+
+class StreamBuffer:
+    """
+    Write-only, unseekable file for zipfile, emptied by the generator
+    streaming the archive. Unable to seek back, zipfile writes the size and
+    CRC of each member after its data.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def library_files(user, originals=True, thumbnails=True):
+    """
+    Yield (archive name, storage name) of the originals and/or thumbnails of
+    all images of `user`, fetching the rows from the database in chunks.
+    """
+    if originals:
+        rows = (
+            UserImage.objects.filter(author=user)
+            .exclude(status=UserImage.Status.UPLOADING)
+            .order_by("pk")
+            .values_list("pk", "name", "image")
+            .iterator(chunk_size=1000)
+        )
+        for pk, name, image in rows:
+            suffix = PurePosixPath(image).suffix
+            yield get_valid_filename(f"{pk}-{name}{suffix}"), image
+
+    if thumbnails:
+        rows = (
+            Thumbnail.objects.filter(system_name__author=user)
+            .order_by("system_name_id", "size")
+            .values_list(
+                "system_name_id", "system_name__name", "size", "image"
+            )
+            .iterator(chunk_size=1000)
+        )
+        for pk, name, size, image in rows:
+            suffix = PurePosixPath(image).suffix
+            archive_name = get_valid_filename(f"{pk}-{name}-{size}{suffix}")
+            yield f"thumbnails/{archive_name}", image
+
+
+def get_download_pool():
+    """
+    Process-wide thread pool downloading the files of library exports, apart
+    from the upload pool so slow exports never hold up uploads.
+    """
+    global _download_pool
+
+    with _download_pool_lock:
+        if _download_pool is None:
+            _download_pool = ThreadPoolExecutor(
+                max_workers=settings.EXPORT_DOWNLOAD_CONCURRENCY,
+                thread_name_prefix="export-download",
+            )
+        return _download_pool
+
+
+def read_file(name):
+    with default_storage.open(name) as file:
+        return file.read()
+
+
+def read_ahead(files, window):
+    """
+    Yield (archive name, content) for the (archive name, storage name) pairs
+    of `files` in order, downloading up to `window` of them at once.
+    """
+    pool = get_download_pool()
+    pending = deque()
+    for archive_name, name in files:
+        pending.append((archive_name, pool.submit(read_file, name)))
+        if len(pending) >= window:
+            archive_name, future = pending.popleft()
+            yield archive_name, future.result()
+
+    while pending:
+        archive_name, future = pending.popleft()
+        yield archive_name, future.result()
+
+
+def zip_stream(files):
+    """
+    Yield a ZIP archive of the (archive name, content) pairs of `files`
+    while it is being built.
+
+    Members are stored uncompressed, JPEG and PNG images don't compress any
+    further. Besides the members being read ahead, only the entries of the
+    central directory, a small record per member, are kept until the end.
+    """
+    buffer = StreamBuffer()
+    date_time = timezone.localtime().timetuple()[:6]
+
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+        for archive_name, content in files:
+            info = zipfile.ZipInfo(archive_name, date_time=date_time)
+            info.compress_type = zipfile.ZIP_STORED
+            archive.writestr(info, content)
+            yield buffer.drain()
+
+    yield buffer.drain()
+
+
+def export_library(user, originals=True, thumbnails=True):
+    """
+    The ZIP archive of a user's library, generated chunk by chunk.
+    """
+    return zip_stream(
+        read_ahead(
+            library_files(user, originals, thumbnails),
+            settings.EXPORT_READ_AHEAD,
+        )
+    )
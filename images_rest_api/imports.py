@@ -0,0 +1,211 @@
+import tarfile
+import tempfile
+import uuid
+import zipfile
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
+
+from .jobs import enqueue_renders
+from .models import Blob, Checkpoint, UserImage
+from .serializers import AddImageSerializer
+
+COPY_SIZE = 64 * 2**10
+
+
+def is_archive(file):
+    """
+    Whether `file` is a ZIP or TAR archive (possibly compressed).
+    """
+    try:
+        if zipfile.is_zipfile(file):
+            return True
+        file.seek(0)
+        with tarfile.open(fileobj=file, mode="r:*"):
+            return True
+    except tarfile.TarError:
+        return False
+    finally:
+        file.seek(0)
+
+
+def iter_archive(archive):
+    """
+    Yield (name, size, open) for every regular file of a ZIP or TAR
+    `archive`, in the order they are stored.
+
+    Nothing is extracted: `open()` returns a file decompressing the member
+    from the archive as it is read, and members that are never opened are
+    skipped without being read.
+    """
+    if zipfile.is_zipfile(archive):
+        archive.seek(0)
+        with zipfile.ZipFile(archive) as zip_file:
+            for info in zip_file.infolist():
+                if not info.is_dir():
+                    yield info.filename, info.file_size, (
+                        lambda info=info: zip_file.open(info)
+                    )
+        return
+
+    archive.seek(0)
+    try:
+        tar_file = tarfile.open(fileobj=archive, mode="r:*")
+    except tarfile.TarError:
+        raise ValueError("The file is not a ZIP or TAR archive.")
+    with tar_file:
+        for member in tar_file:
+            if member.isfile():
+                yield member.name, member.size, (
+                    lambda member=member: tar_file.extractfile(member)
+                )
+
+
+def read_member(name, size, open_member):
+    """
+    An archive member as an uploaded file, kept in memory up to
+    FILE_UPLOAD_MAX_MEMORY_SIZE like a received one. None if it is larger
+    than IMAGE_UPLOAD_MAX_SIZE, which is then not read any further.
+    """
+    if size > settings.IMAGE_UPLOAD_MAX_SIZE:
+        return None
+
+    file = tempfile.SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+    )
+    copied = 0
+    with open_member() as member:
+        for chunk in iter(lambda: member.read(COPY_SIZE), b""):
+            copied += len(chunk)
+            # The size in the archive's header may lie.
+            if copied > settings.IMAGE_UPLOAD_MAX_SIZE:
+                file.close()
+                return None
+            file.write(chunk)
+
+    file.seek(0)
+    return UploadedFile(file, name=PurePosixPath(name).name, size=copied)
+
+
+def create_user_images(author, images, checkpoint=None):
+    """
+    Create an image of `author` for each (name, file) pair of validated
+    `images` with a single INSERT and queue all their renders at once.
+    `checkpoint`, if given, is saved in the same transaction as the INSERT.
+
+    The files are stored with `Blob.objects.store_many`, so those without a
+    blob yet are uploaded concurrently. If any of them fails to upload,
+    `store_many` lets go of the blobs it took before the error is raised,
+    and so does this function if the INSERT fails.
+    """
+    if not images:
+        return []
+
+    blobs = Blob.objects.store_many(
+        UserImage._meta.get_field("image"), [file for _, file in images]
+    )
+    try:
+        with transaction.atomic():
+            user_images = UserImage.objects.bulk_create(
+                [
+                    UserImage(
+                        name=name,
+                        system_name=str(uuid.uuid4()),
+                        author=author,
+                        blob=blob,
+                        image=blob.name,
+                    )
+                    for (name, _), blob in zip(images, blobs)
+                ]
+            )
+            if checkpoint is not None:
+                checkpoint.save(update_fields=["position", "updated_at"])
+    except Exception:
+        Blob.objects.release([blob.pk for blob in blobs])
+        raise
+
+    # bulk_create() sends no post_save, so the renders are queued here.
+    enqueue_renders([user_image.pk for user_image in user_images])
+    return user_images
+
+
+def import_archive(user, archive, checkpoint_name, batch_size=None,
+on_batch=None):
+    """
+    Create an image of `user` for every valid image in a ZIP or TAR
+    `archive`, named after its file name.
+
+    Members are read one at a time and validated like uploads, the valid
+    ones are created `batch_size` (IMPORT_BATCH_SIZE) at a time, or as soon
+    as they add up to IMPORT_BATCH_MAX_BYTES, which bounds the memory and
+    temporary disk space a batch holds. The
+    checkpoint `checkpoint_name` is moved past every batch, so an
+    interrupted import resumes with the first member of the unfinished
+    batch. `on_batch` is called after each batch.
+
+    Returns the number of images created and a (member name, errors) pair
+    for each rejected member.
+    """
+    batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+    checkpoint, _ = Checkpoint.objects.get_or_create(name=checkpoint_name)
+    imported, rejected, batch, batch_bytes = 0, [], [], 0
+
+    def flush(position):
+        nonlocal imported, batch_bytes
+        # The checkpoint moves past the batch along with its images.
+        checkpoint.position = position
+        imported += len(create_user_images(user, batch, checkpoint))
+        for _, file in batch:
+            file.close()
+        batch.clear()
+        batch_bytes = 0
+
+        if on_batch is not None:
+            on_batch()
+
+    position = checkpoint.position
+    for position, (name, size, open_member) in enumerate(
+        iter_archive(archive), 1
+    ):
+        if position <= checkpoint.position:
+            continue
+
+        file = read_member(name, size, open_member)
+        if file is None:
+            rejected.append(
+                (
+                    name,
+                    {
+                        "image": [
+                            f"The file is too large. Maximum size is "
+                            f"{settings.IMAGE_UPLOAD_MAX_SIZE} bytes."
+                        ]
+                    },
+                )
+            )
+            continue
+
+        serializer = AddImageSerializer(
+            data={"name": PurePosixPath(name).stem[:164], "image": file},
+            context={"user": user},
+        )
+        if not serializer.is_valid():
+            file.close()
+            rejected.append((name, serializer.errors))
+            continue
+
+        batch.append((serializer.validated_data["name"], file))
+        batch_bytes += file.size
+        if (
+            len(batch) >= batch_size
+            or batch_bytes >= settings.IMPORT_BATCH_MAX_BYTES
+        ):
+            flush(position)
+
+    if batch:
+        flush(position)
+    checkpoint.delete()
+
+    return imported, rejected
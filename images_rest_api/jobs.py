@@ -0,0 +1,350 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from knox.models import AuthToken
+
+from .models import Checkpoint, CustomUser, Job, UserImage
+from .thumbnails import create_thumbnails
+
+logger = logging.getLogger(__name__)
+
+
+def render_thumbnails(payload, instance=None, source=None):
+    """
+    Render the thumbnails a single UserImage is missing.
+    """
+    if instance is None:
+        instance = (
+            UserImage.objects.select_related("author__account_type", "blob")
+            .filter(pk=payload["user_image_id"])
+            .first()
+        )
+    if instance is None:
+        # The image was deleted before the job was picked up.
+        return
+
+    UserImage.objects.filter(pk=instance.pk).update(
+        status=UserImage.Status.PROCESSING
+    )
+    create_thumbnails(instance, source=source)
+    UserImage.objects.filter(pk=instance.pk).update(
+        status=UserImage.Status.READY
+    )
+
+
+def render_thumbnails_failed(payload):
+    UserImage.objects.filter(pk=payload["user_image_id"]).update(
+        status=UserImage.Status.FAILED
+    )
+
+
+def renew_lease(dedup_key):
+    """
+    Push back the lease of the running job of `dedup_key`, for jobs taking
+    longer than JOBS_LEASE_SECONDS as a whole.
+    """
+    Job.objects.filter(dedup_key=dedup_key, status=Job.Status.RUNNING).update(
+        locked_at=timezone.now()
+    )
+
+
+def import_images(payload):
+    """
+    Import the images of an archive sent to the import endpoint, then
+    delete the archive. A retried job resumes after the last imported batch.
+    """
+    # imports.py queues the renders of what it imports through this module.
+    from .imports import import_archive
+
+    name = payload["archive"]
+    _, dedup_key = import_job(payload["user_id"], name)
+    user = (
+        CustomUser.objects.select_related("account_type")
+        .filter(pk=payload["user_id"])
+        .first()
+    )
+
+    if user is not None:
+        with default_storage.open(name) as archive:
+            imported, rejected = import_archive(
+                user,
+                archive,
+                dedup_key,
+                on_batch=lambda: renew_lease(dedup_key),
+            )
+        logger.info(
+            "Imported %s images of %s, rejected %s.",
+            imported, name, len(rejected),
+        )
+        for member, errors in rejected:
+            logger.info("Rejected %s of %s: %s", member, name, errors)
+    default_storage.delete(name)
+
+
+def import_images_failed(payload):
+    name = payload["archive"]
+    _, dedup_key = import_job(payload["user_id"], name)
+    Checkpoint.objects.filter(name=dedup_key).delete()
+    default_storage.delete(name)
+
+
+def purge_account(payload):
+    """
+    Delete a deactivated user after all their images, chunk by chunk. A
+    retried job carries on with the images left.
+    """
+    _, dedup_key = account_purge_job(payload["user_id"])
+    user = CustomUser.objects.filter(pk=payload["user_id"]).first()
+    if user is None:
+        return
+
+    user.purge_library(on_chunk=lambda: renew_lease(dedup_key))
+    user.delete()
+
+
+JOB_HANDLERS = {
+    Job.Kind.RENDER_THUMBNAILS: render_thumbnails,
+    Job.Kind.IMPORT_IMAGES: import_images,
+    Job.Kind.PURGE_ACCOUNT: purge_account,
+}
+
+FAILURE_HANDLERS = {
+    Job.Kind.RENDER_THUMBNAILS: render_thumbnails_failed,
+    Job.Kind.IMPORT_IMAGES: import_images_failed,
+}
+
+
+def enqueue(kind, payload, dedup_key="", **local):
+    """
+    Persist a new job. With JOBS_RUN_EAGERLY the job is run in the calling
+    thread instead and nothing is stored.
+
+    If a pending or running job with the same `dedup_key` exists already,
+    that job is returned and no new one is created.
+
+    `local` objects (e.g. the file just received) are only handed to eagerly
+    run handlers, a queued job gets nothing but its JSON payload.
+    """
+    if settings.JOBS_RUN_EAGERLY:
+        JOB_HANDLERS[kind](payload, **local)
+        return None
+    if not dedup_key:
+        return Job.objects.create(kind=kind, payload=payload)
+
+    # Creating a duplicate violates unique_active_job_dedup_key, upon which
+    # get_or_create() fetches the job that got there first.
+    job, _ = Job.objects.get_or_create(
+        kind=kind,
+        dedup_key=dedup_key,
+        status__in=[Job.Status.PENDING, Job.Status.RUNNING],
+        defaults={"payload": payload},
+    )
+    return job
+
+
+def enqueue_many(kind, jobs):
+    """
+    Persist a job for every (payload, dedup_key) pair of `jobs` with a
+    single query, skipping keys an active job holds already. With
+    JOBS_RUN_EAGERLY the jobs are run one after another instead.
+    """
+    if settings.JOBS_RUN_EAGERLY:
+        for payload, _ in jobs:
+            JOB_HANDLERS[kind](payload)
+        return
+
+    Job.objects.bulk_create(
+        [
+            Job(kind=kind, payload=payload, dedup_key=dedup_key)
+            for payload, dedup_key in jobs
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def render_job(user_image_id):
+    """
+    Payload and dedup key of the job rendering a UserImage's thumbnails.
+    """
+    return (
+        {"user_image_id": user_image_id},
+        f"{Job.Kind.RENDER_THUMBNAILS}:{user_image_id}",
+    )
+
+
+def enqueue_render(user_image, source=None):
+    """
+    Render the thumbnails `user_image` is missing. Concurrent calls for the
+    same image share a single job.
+    """
+    payload, dedup_key = render_job(user_image.pk)
+    return enqueue(
+        Job.Kind.RENDER_THUMBNAILS,
+        payload,
+        dedup_key=dedup_key,
+        instance=user_image,
+        source=source,
+    )
+
+
+def enqueue_renders(user_image_ids):
+    """
+    Bulk version of `enqueue_render`.
+    """
+    enqueue_many(
+        Job.Kind.RENDER_THUMBNAILS,
+        [render_job(user_image_id) for user_image_id in user_image_ids],
+    )
+
+
+def import_job(user_id, archive_name):
+    """
+    Payload and dedup key of the job importing an archive. The key also
+    names the import's checkpoint.
+    """
+    return (
+        {"user_id": user_id, "archive": archive_name},
+        f"{Job.Kind.IMPORT_IMAGES}:{archive_name}",
+    )
+
+
+def enqueue_import(user, archive_name):
+    """
+    Import the images of the archive saved to the default storage as
+    `archive_name` for `user`.
+    """
+    payload, dedup_key = import_job(user.pk, archive_name)
+    return enqueue(Job.Kind.IMPORT_IMAGES, payload, dedup_key=dedup_key)
+
+
+def account_purge_job(user_id):
+    """
+    Payload and dedup key of the job deleting a user account.
+    """
+    return (
+        {"user_id": user_id},
+        f"{Job.Kind.PURGE_ACCOUNT}:{user_id}",
+    )
+
+
+def enqueue_account_purge(user):
+    """
+    Delete `user` in the background. The account is deactivated and its
+    tokens revoked right away, its images are purged by the job.
+    """
+    with transaction.atomic():
+        CustomUser.objects.filter(pk=user.pk).update(is_active=False)
+        AuthToken.objects.filter(user=user).delete()
+    user.is_active = False
+
+    payload, dedup_key = account_purge_job(user.pk)
+    return enqueue(Job.Kind.PURGE_ACCOUNT, payload, dedup_key=dedup_key)
+
+
+def render_missing_thumbnails(user_images):
+    """
+    Enqueue a render for each of `user_images` lacking a thumbnail size of
+    its author's current account type, e.g. after an account upgrade.
+
+    `user_images` must be annotated with `missing_thumbnails`. Images whose
+    rendering failed for good or which are still being uploaded are left
+    alone.
+    """
+    for user_image in user_images:
+        if user_image.missing_thumbnails and user_image.status not in (
+            UserImage.Status.FAILED,
+            UserImage.Status.UPLOADING,
+        ):
+            enqueue_render(user_image)
+
+
+def expire_direct_uploads(limit=None):
+    """
+    Delete up to `limit` (TOMBSTONE_BATCH_SIZE) images reserved by a direct
+    upload and never completed, once their presigned POST has expired, and
+    bury their storage keys. Returns the number of images deleted.
+
+    Resumable uploads are left alone, their sessions don't expire.
+    """
+    limit = limit or settings.TOMBSTONE_BATCH_SIZE
+    expired = UserImage.objects.filter(
+        status=UserImage.Status.UPLOADING,
+        upload_session__isnull=True,
+        created_at__lt=(
+            timezone.now() - timedelta(seconds=settings.DIRECT_UPLOAD_EXPIRES)
+        ),
+    )
+    pks = list(expired.order_by("pk").values_list("pk", flat=True)[:limit])
+    # Images completed in the meantime are no longer UPLOADING once locked.
+    return UserImage.objects.filter(
+        pk__in=pks, status=UserImage.Status.UPLOADING
+    ).purge()
+
+
+def claim_jobs(worker, limit=1):
+    """
+    Lock up to `limit` runnable jobs for `worker`.
+
+    Rows are locked with SKIP LOCKED, so any number of workers can poll the
+    table concurrently without handing the same job out twice. Jobs whose
+    lease expired (the worker died mid-run) are claimable again.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.JOBS_LEASE_SECONDS)
+
+    with transaction.atomic():
+        ids = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=Job.Status.PENDING, run_after__lte=now)
+                | Q(status=Job.Status.RUNNING, locked_at__lt=stale)
+            )
+            .order_by("run_after", "id")
+            .values_list("id", flat=True)[:limit]
+        )
+        Job.objects.filter(id__in=ids).update(
+            status=Job.Status.RUNNING,
+            locked_by=worker,
+            locked_at=now,
+            attempts=F("attempts") + 1,
+        )
+
+    return list(Job.objects.filter(id__in=ids).order_by("run_after", "id"))
+
+
+def run_job(job):
+    """
+    Run a claimed job. Finished jobs are removed from the queue, failed ones
+    are retried with exponential backoff until JOBS_MAX_ATTEMPTS is reached.
+    """
+    try:
+        JOB_HANDLERS[job.kind](job.payload)
+    except Exception as e:
+        logger.exception("Job %s failed.", job)
+        job.last_error = repr(e)
+        job.locked_by = ""
+        job.locked_at = None
+
+        if job.attempts >= settings.JOBS_MAX_ATTEMPTS:
+            job.status = Job.Status.FAILED
+            on_failure = FAILURE_HANDLERS.get(job.kind)
+            if on_failure is not None:
+                on_failure(job.payload)
+        else:
+            job.status = Job.Status.PENDING
+            job.run_after = timezone.now() + timedelta(seconds=2**job.attempts)
+
+        job.save(
+            update_fields=[
+                "status", "run_after", "last_error", "locked_by", "locked_at"
+            ]
+        )
+        return False
+
+    job.delete()
+    return True
@@ -0,0 +1,233 @@
+import math
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import DEFAULT_STORAGE_ALIAS, storages
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.encoding import filepath_to_uri
+from django.utils.module_loading import import_string
+from storages.backends.s3boto3 import S3Boto3Storage
+from storages.utils import clean_name
+
+from .s3 import get_s3_client
+
+_link_signer = None
+_link_cache = None
+_storage_link_caches = weakref.WeakKeyDictionary()
+_link_signer_lock = threading.Lock()
+
+
+class S3LinkSigner:
+    """
+    Presigned S3 URLs, served by the bucket itself.
+    """
+
+    def sign(self, key, expires_in):
+        return get_s3_client().generate_presigned_url(
+            "get_object",
+            Params={"Bucket": settings.AWS_STORAGE_BUCKET_NAME, "Key": key},
+            ExpiresIn=expires_in,
+        )
+
+
+class LinkCache:
+    """
+    Signed links shared by the requests of the same time bucket, at most
+    TEMPORARY_LINK_CACHE_SIZE of them, the least recently used are evicted.
+
+    A link for `expires_in` seconds expires `expires_in` seconds after the
+    start of its bucket, which is (1 - TEMPORARY_LINK_MIN_LIFETIME) *
+    `expires_in` seconds long. A link handed out from the cache has at least
+    TEMPORARY_LINK_MIN_LIFETIME of the requested lifetime left and never
+    more than requested. Identical URLs also let browsers and CDNs cache the
+    files.
+    """
+
+    def __init__(self, signer):
+        self.signer = signer
+        self.max_size = settings.TEMPORARY_LINK_CACHE_SIZE
+        self.min_lifetime = settings.TEMPORARY_LINK_MIN_LIFETIME
+        self.links = OrderedDict()
+        self.lock = threading.Lock()
+
+    def sign(self, key, expires_in):
+        now = int(time.time())
+        window = max(1, expires_in - math.ceil(expires_in * self.min_lifetime))
+        bucket = now // window * window
+        cache_key = (key, bucket, expires_in)
+
+        with self.lock:
+            url = self.links.get(cache_key)
+            if url is not None:
+                self.links.move_to_end(cache_key)
+                return url
+
+        url = self.signer.sign(key, bucket + expires_in - now)
+        with self.lock:
+            self.links[cache_key] = url
+            self.links.move_to_end(cache_key)
+            while len(self.links) > self.max_size:
+                self.links.popitem(last=False)
+        return url
+
+
+def get_link_signer():
+    """
+    The TEMPORARY_LINK_SIGNER of the deployment, created on first use and
+    shared by all threads of the process.
+    """
+    global _link_signer
+
+    with _link_signer_lock:
+        if _link_signer is None:
+            _link_signer = import_string(settings.TEMPORARY_LINK_SIGNER)()
+        return _link_signer
+
+
+def get_link_cache():
+    """
+    The process-wide `LinkCache` of the TEMPORARY_LINK_SIGNER.
+    """
+    global _link_cache
+
+    signer = get_link_signer()
+    with _link_signer_lock:
+        if _link_cache is None or _link_cache.signer is not signer:
+            _link_cache = LinkCache(signer)
+        return _link_cache
+
+
+class StorageLinkSigner:
+    """
+    Signed links to the files of an S3 `storage`, like its url() builds
+    them: on its custom domain with its CloudFront signer, presigned by S3
+    for its bucket without a custom domain.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def sign(self, key, expires_in):
+        storage = self.storage
+        if storage.custom_domain:
+            return storage.cloudfront_signer.generate_presigned_url(
+                f"{storage.url_protocol}//{storage.custom_domain}/"
+                f"{filepath_to_uri(key)}",
+                date_less_than=(
+                    datetime.now(timezone.utc) + timedelta(seconds=expires_in)
+                ),
+            )
+        return storage.connection.meta.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": storage.bucket_name, "Key": key},
+            ExpiresIn=expires_in,
+        )
+
+
+class CloudFrontLinkSigner(StorageLinkSigner):
+    """
+    CloudFront signed URLs with a canned policy, served from the edge caches
+    of the distribution at AWS_S3_CUSTOM_DOMAIN.
+
+    URLs are signed locally by the CloudFront signer of the default storage,
+    built from AWS_CLOUDFRONT_KEY_ID and AWS_CLOUDFRONT_KEY, without calling
+    AWS.
+    """
+
+    def __init__(self, storage=None):
+        storage = storage or storages[DEFAULT_STORAGE_ALIAS]
+        if not (
+            getattr(storage, "custom_domain", None)
+            and getattr(storage, "cloudfront_signer", None)
+        ):
+            raise ImproperlyConfigured(
+                "CloudFront links need an S3 default storage with "
+                "AWS_S3_CUSTOM_DOMAIN, AWS_CLOUDFRONT_KEY_ID and "
+                "AWS_CLOUDFRONT_KEY."
+            )
+        super().__init__(storage)
+
+
+def get_storage_link_cache(storage):
+    """
+    The process-wide `LinkCache` of the files of `storage`.
+    """
+    with _link_signer_lock:
+        links = _storage_link_caches.get(storage)
+        if links is None:
+            links = _storage_link_caches[storage] = LinkCache(
+                StorageLinkSigner(storage)
+            )
+        return links
+
+
+class StorageURLs:
+    """
+    URLs of stored files for a single serialization, e.g. a page of images
+    with their thumbnails, each file's URL built once.
+
+    On an S3 storage the URLs are those of its url(): on its custom (CDN)
+    domain if it has one, signed by its CloudFront signer if it has one of
+    those, or else presigned for its bucket with query string auth. Files
+    under a STORAGE_PUBLIC_PREFIXES prefix of the custom domain are never
+    signed. Signed URLs come from a `LinkCache` of the storage, reused as
+    long as they have most of their AWS_QUERYSTRING_EXPIRE seconds left
+    instead of being signed again. Other storages build their URLs
+    themselves.
+    """
+
+    def __init__(self, storage=None):
+        self.storage = storage or storages[DEFAULT_STORAGE_ALIAS]
+        self.links = None
+        self.urls = {}
+
+    def url(self, name):
+        url = self.urls.get(name)
+        if url is None:
+            url = self.urls[name] = self.build_url(name)
+        return url
+
+    def build_url(self, name):
+        storage = self.storage
+        if not isinstance(storage, S3Boto3Storage):
+            return storage.url(name)
+
+        key = storage._normalize_name(clean_name(name))
+        if storage.custom_domain and (
+            not (storage.querystring_auth and storage.cloudfront_signer)
+            or key.startswith(tuple(settings.STORAGE_PUBLIC_PREFIXES))
+        ):
+            return (
+                f"{storage.url_protocol}//{storage.custom_domain}/"
+                f"{filepath_to_uri(key)}"
+            )
+        if not storage.querystring_auth:
+            return storage.url(name)
+
+        if self.links is None:
+            self.links = get_storage_link_cache(storage)
+        return self.links.sign(key, storage.querystring_expire)
+
+
+def reset_link_signer():
+    """
+    Drop the signer and its cached links.
+    """
+    global _link_signer, _link_cache
+
+    with _link_signer_lock:
+        _link_signer = None
+        _link_cache = None
+        _storage_link_caches.clear()
+
+
+@receiver(setting_changed)
+def link_setting_changed(setting, **kwargs):
+    if setting.startswith(("TEMPORARY_LINK_", "AWS_", "STORAGES")):
+        reset_link_signer()
@@ -0,0 +1,71 @@
+import hashlib
+import os
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from images_rest_api.imports import import_archive
+from images_rest_api.models import Checkpoint
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Import every image of a ZIP or TAR archive for a user, reading the "
+        "archive one file at a time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("archive", help="Path of the ZIP or TAR archive.")
+        parser.add_argument(
+            "--user",
+            required=True,
+            help="Username of the owner of the imported images.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=None,
+            help="Number of images stored and inserted at once, defaults to "
+            "IMPORT_BATCH_SIZE.",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Start over instead of resuming after the last checkpoint.",
+        )
+
+    def handle(self, *args, **options):
+        path = os.path.abspath(options["archive"])
+        user = (
+            User.objects.select_related("account_type")
+            .filter(username=options["user"])
+            .first()
+        )
+        if user is None:
+            raise CommandError(f"User {options['user']} does not exist.")
+
+        path_hash = hashlib.sha256(path.encode()).hexdigest()[:32]
+        checkpoint_name = f"import_images:{user.pk}:{path_hash}"
+        if options["restart"]:
+            Checkpoint.objects.filter(name=checkpoint_name).delete()
+
+        try:
+            with open(path, "rb") as archive:
+                imported, rejected = import_archive(
+                    user,
+                    archive,
+                    checkpoint_name,
+                    batch_size=options["batch_size"],
+                )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for member, errors in rejected:
+            self.stdout.write(self.style.WARNING(f"Skipped {member}: {errors}"))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {imported} images, skipped {len(rejected)} files."
+            )
+        )
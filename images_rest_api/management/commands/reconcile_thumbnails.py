@@ -0,0 +1,136 @@
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Subquery, Sum
+
+from images_rest_api.jobs import enqueue_renders
+from images_rest_api.models import Checkpoint, Thumbnail, UserImage
+from images_rest_api.thumbnails import (
+    missing_thumbnail_sizes,
+    missing_thumbnails,
+    stale_thumbnails,
+)
+
+STALE_CHECKPOINT = "reconcile_thumbnails:stale"
+MISSING_CHECKPOINT = "reconcile_thumbnails:missing"
+
+
+class Command(BaseCommand):
+    help = (
+        "Bring thumbnails in line with the sizes of their author's account "
+        "type: delete the ones no longer entitled and queue renders of the "
+        "missing ones."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Number of rows fetched and processed at once.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only count the thumbnails to delete and render.",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Start over instead of resuming after the last checkpoint.",
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+
+        if options["restart"]:
+            Checkpoint.objects.filter(
+                name__in=[STALE_CHECKPOINT, MISSING_CHECKPOINT]
+            ).delete()
+
+        if options["dry_run"]:
+            self.estimate()
+            return
+
+        deleted = self.delete_stale(chunk_size)
+        queued = self.render_missing(chunk_size)
+        Checkpoint.objects.filter(
+            name__in=[STALE_CHECKPOINT, MISSING_CHECKPOINT]
+        ).delete()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Deleted {deleted} stale thumbnails, queued renders of "
+                f"{queued} images."
+            )
+        )
+
+    def images_to_render(self):
+        # Failed images are only retried by re-uploading them.
+        return UserImage.objects.filter(missing_thumbnails()).exclude(
+            status__in=[UserImage.Status.FAILED, UserImage.Status.UPLOADING]
+        )
+
+    def estimate(self):
+        missing_count = (
+            missing_thumbnail_sizes()
+            .order_by()
+            .values("accounttype")
+            .annotate(count=Count("pk"))
+            .values("count")
+        )
+        images = self.images_to_render().annotate(
+            missing_count=Subquery(missing_count)
+        )
+        renditions = images.aggregate(total=Sum("missing_count"))["total"]
+
+        self.stdout.write(f"Thumbnails to delete: {stale_thumbnails().count()}")
+        self.stdout.write(f"Images to render: {images.count()}")
+        self.stdout.write(f"Thumbnails to render: {renditions or 0}")
+
+    def chunks(self, queryset, checkpoint_name, chunk_size):
+        """
+        Yield lists of up to `chunk_size` rows of `queryset` (values_list
+        tuples starting with the pk), in pk order, after the checkpoint.
+
+        The checkpoint is moved past each chunk once the caller is done with
+        it, so an interrupted run resumes from the first unfinished chunk.
+        """
+        checkpoint, _ = Checkpoint.objects.get_or_create(name=checkpoint_name)
+        rows = (
+            queryset.filter(pk__gt=checkpoint.position)
+            .order_by("pk")
+            .iterator(chunk_size=chunk_size)
+        )
+
+        while chunk := list(islice(rows, chunk_size)):
+            yield chunk
+            checkpoint.position = chunk[-1][0]
+            checkpoint.save(update_fields=["position", "updated_at"])
+
+    def delete_stale(self, chunk_size):
+        deleted = 0
+
+        for chunk in self.chunks(
+            stale_thumbnails().values_list("pk"), STALE_CHECKPOINT, chunk_size
+        ):
+            # Shared files go once their last thumbnail does.
+            deleted += Thumbnail.objects.filter(
+                pk__in=[pk for pk, in chunk]
+            ).purge()
+
+        return deleted
+
+    def render_missing(self, chunk_size):
+        queued = 0
+
+        # Rendered in parallel by `manage.py run_jobs` workers.
+        for chunk in self.chunks(
+            self.images_to_render().values_list("pk"),
+            MISSING_CHECKPOINT,
+            chunk_size,
+        ):
+            enqueue_renders([pk for pk, in chunk])
+            queued += len(chunk)
+
+        return queued
@@ -0,0 +1,112 @@
+import logging
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from images_rest_api.jobs import claim_jobs, expire_direct_uploads, run_job
+from images_rest_api.s3 import get_pool_metrics
+from images_rest_api.tombstones import drain_tombstones
+from images_rest_api.thumbnails import get_render_pool, shutdown_render_pool
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Process queued background jobs (thumbnail rendering etc.), delete "
+        "abandoned direct uploads and the files of deleted images from the "
+        "storage."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=max(settings.THUMBNAIL_RENDER_WORKERS, 1),
+            help="Number of jobs processed at the same time.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=None,
+            help="Number of jobs claimed per poll, defaults to --concurrency.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit as soon as the queue is empty.",
+        )
+
+    def housekeeping(self):
+        """
+        Delete a batch of abandoned direct uploads and a batch of files of
+        deleted images. Returns whether there was anything to do.
+
+        Errors are logged rather than raised, the worker keeps processing
+        jobs and tries again later.
+        """
+        busy = False
+        # Expired uploads are buried first, to be deleted in the same pass.
+        for description, task in [
+            ("Expiring direct uploads", expire_direct_uploads),
+            ("Deleting the files of deleted images", drain_tombstones),
+        ]:
+            try:
+                busy = bool(task()) or busy
+            except Exception:
+                logger.exception("%s failed.", description)
+        return busy
+
+    def handle(self, *args, **options):
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        concurrency = options["concurrency"]
+        batch_size = options["batch_size"] or concurrency
+
+        if settings.THUMBNAIL_RENDER_WORKERS:
+            # Fork the render processes before the job threads start.
+            get_render_pool()
+
+        self.stdout.write(f"Worker {worker} started.")
+
+        try:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                # A single job at a time runs on the main thread (and its DB
+                # connection).
+                job_map = executor.map if concurrency > 1 else map
+                housekeeping_due = time.monotonic()
+                while True:
+                    # Also due while the queue never runs empty.
+                    if time.monotonic() >= housekeeping_due:
+                        self.housekeeping()
+                        logger.info("S3 connection pool: %s", get_pool_metrics())
+                        housekeeping_due = (
+                            time.monotonic()
+                            + settings.JOBS_HOUSEKEEPING_INTERVAL
+                        )
+
+                    jobs = claim_jobs(worker, limit=batch_size)
+                    if not jobs:
+                        # Idle workers keep going until there is nothing
+                        # left to delete.
+                        if self.housekeeping():
+                            continue
+                        if options["once"]:
+                            break
+                        time.sleep(settings.JOBS_POLL_INTERVAL)
+                        continue
+
+                    for job, done in zip(jobs, job_map(run_job, jobs)):
+                        if done:
+                            self.stdout.write(self.style.SUCCESS(f"Done: {job}"))
+                        else:
+                            self.stdout.write(self.style.ERROR(f"Failed: {job}"))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            shutdown_render_pool()
+
+        self.stdout.write(f"Worker {worker} stopped.")
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.4 on 2026-10-16 22:33
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def mark_existing_images_ready(apps, schema_editor):
+    UserImage = apps.get_model("images_rest_api", "UserImage")
+    UserImage.objects.update(status="ready")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images_rest_api', '0008_alter_thumbnail_size'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userimage',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=16),
+        ),
+        migrations.RunPython(mark_existing_images_ready, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('render_thumbnails', 'Render thumbnails')], max_length=32)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('failed', 'Failed')], default='pending', max_length=16)),
+                ('payload', models.JSONField(default=dict)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_by', models.CharField(blank=True, max_length=128)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'run_after'], name='images_rest_status_1c3be5_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.4 on 2026-10-16 22:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images_rest_api', '0009_userimage_status_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accounttype',
+            name='max_image_pixels',
+            field=models.PositiveBigIntegerField(default=50000000, help_text='Largest accepted image, in pixels (width x height).'),
+        ),
+    ]
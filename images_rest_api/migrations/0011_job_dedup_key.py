@@ -0,0 +1,22 @@
+# Generated by Django 4.2.4 on 2026-10-16 22:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images_rest_api', '0010_accounttype_max_image_pixels'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='dedup_key',
+            field=models.CharField(blank=True, max_length=128),
+        ),
+        migrations.AddConstraint(
+            model_name='job',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['pending', 'running']), models.Q(('dedup_key', ''), _negated=True)), fields=('dedup_key',), name='unique_active_job_dedup_key'),
+        ),
+    ]
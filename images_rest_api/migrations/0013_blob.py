@@ -0,0 +1,45 @@
+# Generated by Django 4.2.4 on 2026-10-16 23:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images_rest_api', '0012_checkpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=128, unique=True)),
+                ('name', models.CharField(max_length=255)),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('refcount', models.PositiveIntegerField(default=1)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='thumbnail',
+            name='image',
+            field=models.ImageField(max_length=255, upload_to='user_images/thumbnails'),
+        ),
+        migrations.AlterField(
+            model_name='userimage',
+            name='image',
+            field=models.ImageField(max_length=255, upload_to='user_images'),
+        ),
+        migrations.AddField(
+            model_name='thumbnail',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='images_rest_api.blob'),
+        ),
+        migrations.AddField(
+            model_name='userimage',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='images_rest_api.blob'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.4 on 2026-10-16 23:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images_rest_api', '0013_blob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userimage',
+            name='status',
+            field=models.CharField(choices=[('uploading', 'Uploading'), ('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=16),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.4 on 2026-10-16 23:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images_rest_api', '0014_userimage_uploading_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('content_type', models.CharField(max_length=32)),
+                ('length', models.PositiveBigIntegerField()),
+                ('offset', models.PositiveBigIntegerField(default=0)),
+                ('part_size', models.PositiveIntegerField()),
+                ('multipart_upload_id', models.CharField(max_length=1024)),
+                ('parts', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user_image', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='upload_session', to='images_rest_api.userimage')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.4 on 2026-10-16 23:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images_rest_api', '0015_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='job',
+            name='kind',
+            field=models.CharField(choices=[('render_thumbnails', 'Render thumbnails'), ('import_images', 'Import images')], max_length=32),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.4 on 2026-10-17 09:12
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images_rest_api', '0018_job_purge_account'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userimage',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
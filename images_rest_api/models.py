@@ -1,15 +1,23 @@
 import uuid
+from collections import Counter
+
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
     PermissionsMixin,
 )
+from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.base_user import BaseUserManager
 from django.core.validators import MinValueValidator
 
+from .storage import save_files
+from .uploads import SIGNATURE_LENGTH, file_sha256, sniff_image_format
+
 
 class ThumbnailSize(models.Model):
     size = models.IntegerField()
@@ -27,6 +35,10 @@ class AccountType(models.Model):
     orginal_image_link = models.BooleanField(default=False)
     time_limited_link = models.BooleanField(default=False)
     thumbs = models.ManyToManyField(ThumbnailSize)
+    max_image_pixels = models.PositiveBigIntegerField(
+        default=50_000_000,
+        help_text=_("Largest accepted image, in pixels (width x height)."),
+    )
 
     def __str__(self):
         return self.name
@@ -91,29 +103,360 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     def __str__(self):
         return self.username
 
+    def purge_library(self, on_chunk=None):
+        """
+        Delete the user's images and thumbnails ACCOUNT_PURGE_CHUNK_SIZE at a
+        time, releasing their files. `on_chunk` is called after each chunk.
+        """
+        chunk_size = settings.ACCOUNT_PURGE_CHUNK_SIZE
+        UserImage.objects.filter(author=self).purge_in_chunks(
+            chunk_size, on_chunk
+        )
+        Thumbnail.objects.filter(author=self).purge_in_chunks(
+            chunk_size, on_chunk
+        )
+
+    def delete(self, *args, **kwargs):
+        # Left to the collector, every image would be loaded at once and its
+        # files never deleted.
+        self.purge_library()
+        return super().delete(*args, **kwargs)
+
     class Meta:
         verbose_name = "custom user"
         verbose_name_plural = "custom users"
 
 
+class StorageTombstoneManager(models.Manager):
+    def bury(self, names):
+        """
+        Schedule the files `names` for deletion from the default storage.
+        """
+        self.bulk_create([self.model(name=name) for name in names if name])
+
+    def unbury(self, names):
+        """
+        Cancel the deletion of the files `names`, before storing them again.
+
+        A drain locks the tombstones it claimed until their files are
+        deleted, so this waits for it instead of having the new upload
+        deleted along with the old file.
+        """
+        self.filter(name__in=names).delete()
+
+
+class StorageTombstone(models.Model):
+    """
+    A file left behind by deleted rows. Tombstones are written in the same
+    transaction as the deletion and cleared in batches by the job workers.
+    """
+
+    name = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = StorageTombstoneManager()
+
+    def __str__(self):
+        return self.name
+
+
+def release_files(files):
+    """
+    Let go of the files of deleted rows, given as (name, blob id) pairs:
+    release the blobs and bury the files of rows without one.
+    """
+    files = list(files)
+    with transaction.atomic():
+        Blob.objects.release([blob for _, blob in files if blob is not None])
+        StorageTombstone.objects.bury(
+            [name for name, blob in files if blob is None]
+        )
+
+
+class BlobManager(models.Manager):
+    def acquire(self, digests):
+        """
+        Take a reference to every existing blob of `digests`.
+
+        Returns a dict mapping the digests found to their Blob.
+        """
+        with transaction.atomic():
+            blobs = list(
+                self.select_for_update().filter(digest__in=digests).order_by("pk")
+            )
+            self.filter(pk__in=[blob.pk for blob in blobs]).update(
+                refcount=F("refcount") + 1
+            )
+        return {blob.digest: blob for blob in blobs}
+
+    def register(self, digest, name, size, storage):
+        """
+        Create the blob of a file just saved to `storage` as `name`, with one
+        reference.
+
+        If a concurrent upload registered `digest` first, a reference to that
+        blob is taken and returned instead, and the redundant file deleted.
+        """
+        while True:
+            try:
+                with transaction.atomic():
+                    return self.create(digest=digest, name=name, size=size)
+            except IntegrityError:
+                blob = self.acquire([digest]).get(digest)
+            # None if it got released in the meantime.
+            if blob is not None:
+                if blob.name != name:
+                    storage.delete(name)
+                return blob
+
+    def release(self, blob_ids):
+        """
+        Drop a reference to each of `blob_ids` (once per occurrence).
+
+        Blobs left without references are deleted and their files buried,
+        to be deleted by `drain_tombstones`. Returns the names of those files.
+        """
+        counts = Counter(blob_ids)
+        by_count = {}
+        for blob_id, count in counts.items():
+            by_count.setdefault(count, []).append(blob_id)
+
+        with transaction.atomic():
+            for count, ids in by_count.items():
+                self.filter(pk__in=ids).update(refcount=F("refcount") - count)
+            orphans = self.filter(pk__in=counts, refcount=0)
+            names = list(orphans.values_list("name", flat=True))
+            orphans.delete()
+            StorageTombstone.objects.bury(names)
+        return names
+
+    def store(self, field_file):
+        """
+        Reference the blob with the content of the uncommitted `field_file`,
+        saving the file under its content hash only if there is none yet.
+        """
+        file = field_file.file
+        digest = file_sha256(file)
+
+        file.seek(0)
+        head = file.read(SIGNATURE_LENGTH)
+        file.seek(0)
+        extension = (
+            sniff_image_format(head) or field_file.name.split(".")[-1]
+        ).lower()
+        name = field_file.field.generate_filename(
+            field_file.instance, f"{digest}.{extension}"
+        )
+
+        blob = self.acquire([digest]).get(digest)
+        if blob is None:
+            StorageTombstone.objects.unbury([name])
+            saved = name
+            try:
+                saved = field_file.storage.save(name, file, max_length=255)
+                file.seek(0)
+                blob = self.register(
+                    digest, saved, file.size, field_file.storage
+                )
+            except Exception:
+                # Whatever is left under the name has no blob.
+                StorageTombstone.objects.bury({name, saved})
+                raise
+        return blob
+
+    def store_many(self, field, files):
+        """
+        Bulk version of `store` for the uploaded `files` of the file `field`,
+        returning their blobs in the same order.
+
+        Existing blobs are referenced with a single query and the files
+        without one are uploaded concurrently. A file sent several times
+        takes a reference per occurrence.
+        """
+        files = list(files)
+        digests = []
+        new_files = {}
+        for file in files:
+            digest = file_sha256(file)
+            digests.append(digest)
+
+            file.seek(0)
+            head = file.read(SIGNATURE_LENGTH)
+            file.seek(0)
+            extension = (
+                sniff_image_format(head) or file.name.split(".")[-1]
+            ).lower()
+            name = field.generate_filename(None, f"{digest}.{extension}")
+            new_files.setdefault(digest, (name, file))
+
+        counts = Counter(digests)
+        blobs = self.acquire(list(counts))
+        new_files = {
+            digest: new_files[digest] for digest in counts if digest not in blobs
+        }
+        StorageTombstone.objects.unbury(
+            [name for name, _ in new_files.values()]
+        )
+        taken = [blob.pk for blob in blobs.values()]
+        acquired = len(taken)
+        saved = []
+        try:
+            saved = save_files(field.storage, new_files.values())
+            for (digest, (_, file)), name in zip(new_files.items(), saved):
+                blobs[digest] = self.register(
+                    digest, name, file.size, field.storage
+                )
+                taken.append(blobs[digest].pk)
+
+            by_count = {}
+            for digest, count in counts.items():
+                if count > 1:
+                    by_count.setdefault(count - 1, []).append(blobs[digest].pk)
+            with transaction.atomic():
+                for count, ids in by_count.items():
+                    self.filter(pk__in=ids).update(
+                        refcount=F("refcount") + count
+                    )
+        except Exception:
+            # Whatever is left under the names not registered has no blob,
+            # `release` only buries the files of blobs.
+            registered = len(taken) - acquired
+            StorageTombstone.objects.bury(
+                {name for name, _ in list(new_files.values())[registered:]}
+                .union(saved[registered:])
+            )
+            self.release(taken)
+            raise
+
+        return [blobs[digest] for digest in digests]
+
+
+class Blob(models.Model):
+    """
+    A file in the storage, addressed by its content and shared by every
+    UserImage or Thumbnail with the same content.
+
+    `digest` is the SHA-256 of an original, or "<original digest>_<height>"
+    for a thumbnail of it. The file is deleted when `refcount` drops to 0.
+    """
+
+    digest = models.CharField(max_length=128, unique=True)
+    name = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField(default=0)
+    refcount = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = BlobManager()
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount})"
+
+
+class PurgeQuerySet(models.QuerySet):
+    def purge_in_chunks(self, chunk_size, on_chunk=None):
+        """
+        `purge` the rows `chunk_size` at a time, each chunk in a transaction
+        of its own, so neither memory nor lock time grows with the number of
+        rows. `on_chunk` is called after each chunk. Returns the number of
+        rows deleted.
+        """
+        deleted = 0
+        while pks := list(
+            self.order_by("pk").values_list("pk", flat=True)[:chunk_size]
+        ):
+            deleted += self.model.objects.filter(pk__in=pks).purge()
+            if on_chunk is not None:
+                on_chunk()
+        return deleted
+
+
+class UserImageQuerySet(PurgeQuerySet):
+    def purge(self):
+        """
+        Delete the images and their thumbnails and let go of their files,
+        without touching the storage. Returns the number of images deleted.
+
+        The rows are locked first, so an image deleted by two requests at
+        once releases its files only once.
+        """
+        with transaction.atomic():
+            images = list(
+                self.select_for_update().values_list("pk", "image", "blob")
+            )
+            pks = [pk for pk, _, _ in images]
+            Thumbnail.objects.filter(system_name__in=pks).purge()
+            UserImage.objects.filter(pk__in=pks).delete()
+            release_files((name, blob) for _, name, blob in images)
+        return len(pks)
+
+
+class ThumbnailQuerySet(PurgeQuerySet):
+    def purge(self):
+        """
+        Delete the thumbnails and let go of their files, without touching
+        the storage. Returns the number of thumbnails deleted.
+        """
+        with transaction.atomic():
+            thumbnails = list(
+                self.select_for_update().values_list("pk", "image", "blob")
+            )
+            Thumbnail.objects.filter(
+                pk__in=[pk for pk, _, _ in thumbnails]
+            ).delete()
+            release_files((name, blob) for _, name, blob in thumbnails)
+        return len(thumbnails)
+
+
 class UserImage(models.Model):
+    class Status(models.TextChoices):
+        UPLOADING = "uploading", _("Uploading")
+        PENDING = "pending", _("Pending")
+        PROCESSING = "processing", _("Processing")
+        READY = "ready", _("Ready")
+        FAILED = "failed", _("Failed")
+
     name = models.CharField(max_length=164, null=False, blank=False)
     system_name = models.CharField()
-    image = models.ImageField(upload_to="user_images")
+    image = models.ImageField(upload_to="user_images", max_length=255)
     author = models.ForeignKey(
         CustomUser, on_delete=models.CASCADE, related_name="client_photos"
     )
+    status = models.CharField(
+        max_length=16, choices=Status.choices, default=Status.PENDING
+    )
+    # Null for images uploaded before content addressing.
+    blob = models.ForeignKey(
+        Blob, null=True, blank=True, on_delete=models.PROTECT, related_name="+"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = UserImageQuerySet.as_manager()
 
     def delete(self):
-        self.image.delete(save=False)
-        super().delete()
+        UserImage.objects.filter(pk=self.pk).purge()
 
     def save(self, *args, **kwargs):
+        blob = None
         if not self.id:
             filename = str(uuid.uuid4())
-            self.image.name = "-".join([filename, self.name])
             self.system_name = filename
-        super(UserImage, self).save(*args, **kwargs)
+            # Keep the received file, thumbnails are rendered from it instead
+            # of downloading the original back from the storage.
+            if not self.image._committed:
+                self.uploaded_file = self.image.file
+                # Identical content is stored only once.
+                blob = self.blob = Blob.objects.store(self.image)
+                self.image.name = self.blob.name
+                self.image._committed = True
+        if blob is None:
+            return super(UserImage, self).save(*args, **kwargs)
+
+        try:
+            with transaction.atomic():
+                super(UserImage, self).save(*args, **kwargs)
+        except Exception:
+            Blob.objects.release([blob.pk])
+            raise
 
     def __str__(self) -> str:
         return self.system_name
@@ -131,7 +474,12 @@ class Thumbnail(models.Model):
         validators=[MinValueValidator(1)],
     )
 
-    image = models.ImageField(upload_to="user_images/thumbnails")
+    image = models.ImageField(upload_to="user_images/thumbnails", max_length=255)
+    blob = models.ForeignKey(
+        Blob, null=True, blank=True, on_delete=models.PROTECT, related_name="+"
+    )
+
+    objects = ThumbnailQuerySet.as_manager()
 
     class Meta:
         unique_together = ["system_name", "size"]
@@ -141,5 +489,86 @@ class Thumbnail(models.Model):
         return f"Image {self.image.name} - {self.size} px"
 
     def delete(self):
-        self.image.delete(save=False)
-        super().delete()
+        Thumbnail.objects.filter(pk=self.pk).purge()
+
+
+class Job(models.Model):
+    """
+    Durable background job, claimed by `manage.py run_jobs` workers with
+    SELECT ... FOR UPDATE SKIP LOCKED.
+
+    At most one pending or running job may hold a given `dedup_key`.
+    """
+
+    class Kind(models.TextChoices):
+        RENDER_THUMBNAILS = "render_thumbnails", _("Render thumbnails")
+        IMPORT_IMAGES = "import_images", _("Import images")
+        PURGE_ACCOUNT = "purge_account", _("Purge account")
+
+    class Status(models.TextChoices):
+        PENDING = "pending", _("Pending")
+        RUNNING = "running", _("Running")
+        FAILED = "failed", _("Failed")
+
+    kind = models.CharField(max_length=32, choices=Kind.choices)
+    status = models.CharField(
+        max_length=16, choices=Status.choices, default=Status.PENDING
+    )
+    payload = models.JSONField(default=dict)
+    dedup_key = models.CharField(max_length=128, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=128, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "run_after"])]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["dedup_key"],
+                condition=models.Q(status__in=["pending", "running"])
+                & ~models.Q(dedup_key=""),
+                name="unique_active_job_dedup_key",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+
+class Checkpoint(models.Model):
+    """
+    How far a resumable management command got, e.g. the last processed id.
+    """
+
+    name = models.CharField(max_length=128, unique=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.position}"
+
+
+class UploadSession(models.Model):
+    """
+    A resumable upload of a UserImage, received in chunks and appended to an
+    S3 multipart upload. `parts` holds the [part number, ETag] pairs of the
+    parts uploaded so far.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user_image = models.OneToOneField(
+        UserImage, on_delete=models.CASCADE, related_name="upload_session"
+    )
+    content_type = models.CharField(max_length=32)
+    length = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    part_size = models.PositiveIntegerField()
+    multipart_upload_id = models.CharField(max_length=1024)
+    parts = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.user_image} @ {self.offset}/{self.length}"
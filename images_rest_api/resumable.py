@@ -0,0 +1,124 @@
+import threading
+
+from botocore.exceptions import ClientError
+from django.conf import settings
+
+from .storage import get_upload_pool
+
+UPLOAD_CONTENT_TYPE = "application/offset+octet-stream"
+
+
+def read_block(stream, size):
+    """
+    Read `size` bytes of `stream`, fewer only if it ends before.
+    """
+    block = bytearray()
+    while len(block) < size:
+        data = stream.read(size - len(block))
+        if not data:
+            break
+        block += data
+    return bytes(block)
+
+
+def upload_part(s3, session, part_number, body):
+    return s3.upload_part(
+        Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+        Key=session.user_image.image.name,
+        UploadId=session.multipart_upload_id,
+        PartNumber=part_number,
+        Body=body,
+    )["ETag"]
+
+
+def chunk_fits_parts(session, length):
+    """
+    Whether a chunk of `length` bytes at the offset of `session` is made of
+    full parts, or ends the file.
+    """
+    if session.offset + length == session.length:
+        return True
+    return length > 0 and length % session.part_size == 0
+
+
+def upload_chunk(s3, session, stream, length, check_head=None):
+    """
+    Append the `length` bytes of `stream` to the multipart upload of
+    `session`, starting at its offset.
+
+    The chunk is cut into parts of `session.part_size` bytes, up to
+    STORAGE_UPLOAD_CONCURRENCY of them are read and uploaded at a time. S3
+    needs every part but the last one to be full size, so unless the chunk
+    ends the file `length` must be a multiple of the part size (see
+    `chunk_fits_parts`). `check_head` is called with the first part of the
+    file before anything is uploaded.
+
+    Returns (bytes uploaded, [[part number, ETag], ...], error) for the parts
+    uploaded in a row from the offset. `error` is the exception a part failed
+    with, None if all of them were uploaded.
+    """
+    part_size = session.part_size
+    part_number = session.offset // part_size + 1
+    remaining = length
+
+    pool = get_upload_pool()
+    # Bounds the parts held in memory while they wait for an upload thread.
+    slots = threading.BoundedSemaphore(settings.STORAGE_UPLOAD_CONCURRENCY)
+    futures = []
+    while remaining:
+        slots.acquire()
+        size = min(part_size, remaining)
+        block = read_block(stream, size)
+        if len(block) < size:
+            # The request body ended early, its last part is incomplete.
+            break
+        remaining -= size
+
+        if part_number == 1 and check_head is not None:
+            check_head(block)
+        future = pool.submit(upload_part, s3, session, part_number, block)
+        future.add_done_callback(lambda _: slots.release())
+        futures.append((part_number, len(block), future))
+        part_number += 1
+
+    uploaded, parts, error = 0, [], None
+    for part_number, size, future in futures:
+        try:
+            etag = future.result()
+        except Exception as e:
+            error = error or e
+            continue
+        if error is None:
+            uploaded += size
+            parts.append([part_number, etag])
+
+    return uploaded, parts, error
+
+
+def complete_upload(s3, session):
+    s3.complete_multipart_upload(
+        Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+        Key=session.user_image.image.name,
+        UploadId=session.multipart_upload_id,
+        MultipartUpload={
+            "Parts": [
+                {"ETag": etag, "PartNumber": part_number}
+                for part_number, etag in session.parts
+            ]
+        },
+    )
+
+
+def abort_upload(s3, session):
+    """
+    Discard the parts uploaded so far.
+    """
+    try:
+        s3.abort_multipart_upload(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+            Key=session.user_image.image.name,
+            UploadId=session.multipart_upload_id,
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "NoSuchUpload":
+            raise
@@ -0,0 +1,154 @@
+import threading
+
+import boto3
+from botocore.config import Config
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+_s3_client = None
+_s3_resources = threading.local()
+_s3_lock = threading.Lock()
+
+
+class PoolMetrics:
+    """
+    Counters of the HTTP requests sent through the shared S3 client, to tell
+    how much of its connection pool is in use.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.failed_requests = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def request_sent(self, **kwargs):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def request_done(self, response=None, caught_exception=None, **kwargs):
+        # Returning anything but None would make botocore retry the request.
+        with self._lock:
+            self.in_flight -= 1
+            if caught_exception is not None or (
+                response is not None
+                and response[0].status_code >= 500
+            ):
+                self.failed_requests += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "max_pool_connections": settings.AWS_S3_MAX_POOL_CONNECTIONS,
+                "requests": self.requests,
+                "failed_requests": self.failed_requests,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+            }
+
+
+pool_metrics = PoolMetrics()
+
+
+def get_client_config():
+    """
+    Configuration shared by the S3 client and the storage backend.
+    """
+    return Config(
+        s3={"addressing_style": settings.AWS_S3_ADDRESSING_STYLE},
+        signature_version=settings.AWS_S3_SIGNATURE_VERSION,
+        max_pool_connections=settings.AWS_S3_MAX_POOL_CONNECTIONS,
+        tcp_keepalive=settings.AWS_S3_TCP_KEEPALIVE,
+        connect_timeout=settings.AWS_S3_CONNECT_TIMEOUT,
+        read_timeout=settings.AWS_S3_READ_TIMEOUT,
+        retries={
+            "mode": "standard",
+            "total_max_attempts": settings.AWS_S3_MAX_ATTEMPTS,
+        },
+    )
+
+
+def get_s3_client():
+    """
+    Client of the S3 API the default storage uses. With AWS_S3_ENDPOINT_URL
+    set it talks to that S3-compatible server (e.g. a local MinIO) instead
+    of AWS.
+
+    The client is created on first use and shared by all threads of the
+    process, which keeps its connections open between requests. Clients are
+    thread-safe, building one loads the service models and opens a new
+    connection pool.
+    """
+    global _s3_client
+
+    with _s3_lock:
+        if _s3_client is None:
+            client = boto3.client(
+                "s3",
+                region_name=settings.AWS_S3_REGION_NAME,
+                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+                endpoint_url=settings.AWS_S3_ENDPOINT_URL or None,
+                config=get_client_config(),
+            )
+            client.meta.events.register(
+                "before-send.s3", pool_metrics.request_sent
+            )
+            client.meta.events.register(
+                "needs-retry.s3", pool_metrics.request_done
+            )
+            _s3_client = client
+        return _s3_client
+
+
+def get_s3_resource():
+    """
+    S3 resource of the calling thread, sending its requests through the
+    client of `get_s3_client`.
+
+    Resources aren't thread-safe, so every thread gets one of its own, which
+    is pointed at the shared client.
+    """
+    client = get_s3_client()
+    resource = getattr(_s3_resources, "resource", None)
+    if resource is None or resource.meta.client is not client:
+        # A session per resource, boto3 sessions aren't thread-safe either.
+        resource = boto3.session.Session().resource(
+            "s3",
+            region_name=settings.AWS_S3_REGION_NAME,
+            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+            endpoint_url=settings.AWS_S3_ENDPOINT_URL or None,
+            config=get_client_config(),
+        )
+        # The resource comes with a client of its own, only used once.
+        resource.meta.client = client
+        _s3_resources.resource = resource
+    return resource
+
+
+def get_pool_metrics():
+    """
+    Usage of the shared client's connection pool since the process started.
+    """
+    return pool_metrics.snapshot()
+
+
+def reset_s3_client():
+    """
+    Drop the shared client, the next call of `get_s3_client` builds a new one.
+    """
+    global _s3_client
+
+    with _s3_lock:
+        _s3_client = None
+
+
+@receiver(setting_changed)
+def s3_setting_changed(setting, **kwargs):
+    if setting.startswith("AWS_"):
+        reset_s3_client()
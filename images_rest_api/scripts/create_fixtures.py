@@ -18,18 +18,21 @@ def run():
         name="Basic",
         orginal_image_link=False,
         time_limited_link=False,
+        defaults={"max_image_pixels": 25_000_000},
     )
 
     premium_account_type, created = AccountType.objects.get_or_create(
         name="Premium",
         orginal_image_link=True,
         time_limited_link=False,
+        defaults={"max_image_pixels": 50_000_000},
     )
 
     enterprise_account_type, created = AccountType.objects.get_or_create(
         name="Enterprise",
         orginal_image_link=True,
         time_limited_link=True,
+        defaults={"max_image_pixels": 300_000_000},
     )
 
     basic_account_type.thumbs.set([thumbnail_size_200])
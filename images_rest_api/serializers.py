@@ -1,8 +1,16 @@
+from django.conf import settings
 from django.contrib.auth import authenticate, get_user_model
-from PIL import Image
+from django.db import models
 from rest_framework import serializers
 
 from .models import CustomUser, Thumbnail, UserImage
+from .uploads import (
+    ALLOWED_IMAGE_CONTENT_TYPES,
+    UploadedImageField,
+    check_image_file,
+    check_image_pixels,
+    check_upload_ticket,
+)
 
 User = get_user_model()
 
@@ -104,52 +112,163 @@ class ChangePasswordSerializer(serializers.Serializer):
         instance.save()
         return instance
 
-class ThumbnailSerializer(serializers.ModelSerializer):
+class StorageURLField(serializers.ImageField):
+    """
+    URL of a stored image, built by the `storage_urls` of the serializer
+    context when there is one.
+    """
+
+    def to_representation(self, value):
+        storage_urls = self.context.get("storage_urls")
+        if not value or storage_urls is None:
+            return super().to_representation(value)
+
+        url = storage_urls.url(value.name)
+        request = self.context.get("request", None)
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+
+class StorageURLModelSerializer(serializers.ModelSerializer):
+    serializer_field_mapping = {
+        **serializers.ModelSerializer.serializer_field_mapping,
+        models.ImageField: StorageURLField,
+    }
+
+
+class ThumbnailSerializer(StorageURLModelSerializer):
     class Meta:
         model = Thumbnail
         fields = ["id", "size", "image"]
 
 class AddImageSerializer(serializers.ModelSerializer):
 
-    image = serializers.ImageField(write_only=True)
+    image = serializers.ImageField(
+        write_only=True, _DjangoImageField=UploadedImageField
+    )
+    ticket = serializers.CharField(write_only=True, required=False)
 
     class Meta:
         model = UserImage
-        fields = ["id", "name","image"]
+        fields = ["id", "name", "image", "status", "ticket"]
+        read_only_fields = ["status"]
 
     def validate_image(self, value):
         if not value:
             raise serializers.ValidationError("This field is required.")
 
-        allowed_extensions_and_formats = ["jpg", "jpeg", "png"]
-        allowed_content_type = ["image/jpg", "image/jpeg", "image/png"]
+        # Opened and verified by UploadedImageField already.
+        check_image_file(value.name, value.image.format, value.content_type)
+
+        # Set in the context when there is no request, e.g. in imports.
+        user = self.context.get("user")
+        request = self.context.get("request")
+        if user is None and request is not None:
+            user = request.user
+        if user is not None:
+            check_image_pixels(value.image.size, user.account_type)
+
+        return value
+
+    def validate(self, attrs):
+        ticket = attrs.pop("ticket", None)
+        request = self.context.get("request")
+        if ticket is not None and request is not None:
+            try:
+                check_upload_ticket(ticket, request.user, attrs["image"])
+            except serializers.ValidationError as e:
+                raise serializers.ValidationError({"ticket": e.detail})
+        return attrs
+
+
+class DirectUploadSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=164)
+    content_type = serializers.ChoiceField(choices=ALLOWED_IMAGE_CONTENT_TYPES)
+
+
+class ResumableUploadSerializer(DirectUploadSerializer):
+    length = serializers.IntegerField(min_value=1)
+
+    def validate_length(self, value):
+        if value > settings.IMAGE_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(
+                f"The file is too large. Maximum size is {settings.IMAGE_UPLOAD_MAX_SIZE} bytes."
+            )
+        return value
+
 
-        image_extension = value.name.split(".")[-1].lower()
-        content_type = value.content_type.lower()
+class UploadHandshakeSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=164)
+    sha256 = serializers.RegexField(r"^[0-9a-fA-F]{64}$")
+    size = serializers.IntegerField(min_value=1)
 
-        if image_extension not in allowed_extensions_and_formats:
+    def validate_sha256(self, value):
+        return value.lower()
+
+    def validate_size(self, value):
+        if value > settings.IMAGE_UPLOAD_MAX_SIZE:
             raise serializers.ValidationError(
-                f"{image_extension} - Invalid file extension. Only {allowed_extensions_and_formats} files are accepted."
+                f"The file is too large. Maximum size is {settings.IMAGE_UPLOAD_MAX_SIZE} bytes."
             )
+        return value
+
 
-        try:
-            img = Image.open(value)
-            if img.format.lower() not in allowed_extensions_and_formats:
-                raise serializers.ValidationError(
-                    f"{img.format.lower()} - Invalid file format. Only {allowed_extensions_and_formats} files are accepted."
-                )
-        except Exception as e:
+
+class BulkDeleteFilterSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=164, required=False)
+    status = serializers.ChoiceField(
+        choices=UserImage.Status.choices, required=False
+    )
+
+    def validate(self, attrs):
+        if not attrs:
             raise serializers.ValidationError(
-                "Cannot open the file as an image. Please check if the uploaded file is a valid image."
+                "Filter by name and/or status."
             )
-        
-        if content_type not in allowed_content_type:
+        return attrs
+
+
+class BulkDeleteSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        required=False,
+    )
+    filter = BulkDeleteFilterSerializer(required=False)
+
+    def validate_ids(self, value):
+        if len(value) > settings.BULK_DELETE_MAX_IMAGES:
             raise serializers.ValidationError(
-                f"{content_type} - Invalid file content-type. Only {allowed_content_type} files are accepted."
+                f"Too many images. Maximum is {settings.BULK_DELETE_MAX_IMAGES} per request."
             )
-            
-        return value
+        return list(dict.fromkeys(value))
 
+    def validate(self, attrs):
+        if ("ids" in attrs) == ("filter" in attrs):
+            raise serializers.ValidationError(
+                "Send either ids or a filter."
+            )
+        return attrs
+
+
+class TemporaryLinkFileSerializer(serializers.Serializer):
+    file_type = serializers.ChoiceField(choices=["image", "thumbnail"])
+    file_id = serializers.IntegerField(min_value=1)
+
+
+class TemporaryLinksSerializer(serializers.Serializer):
+    files = TemporaryLinkFileSerializer(many=True, allow_empty=False)
+    expiration_time_seconds = serializers.IntegerField(
+        min_value=300, max_value=30000, default=3600
+    )
+
+    def validate_files(self, value):
+        if len(value) > settings.TEMPORARY_LINKS_MAX_FILES:
+            raise serializers.ValidationError(
+                f"Too many files. Maximum is {settings.TEMPORARY_LINKS_MAX_FILES} per request."
+            )
+        return value
 
 
 class BasicUserImageSerializer(serializers.ModelSerializer):
@@ -157,12 +276,14 @@ class BasicUserImageSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = UserImage
-        fields = ["id", "name", "thumbnails"]
+        fields = ["id", "name", "status", "thumbnails"]
+        read_only_fields = ["status"]
 
 
-class NotBasicUserImageSerializer(serializers.ModelSerializer):
+class NotBasicUserImageSerializer(StorageURLModelSerializer):
     thumbnails = ThumbnailSerializer(many=True, read_only=True)
 
     class Meta:
         model = UserImage
-        fields = ["id", "name", "image", "thumbnails"]
+        fields = ["id", "name", "image", "status", "thumbnails"]
+        read_only_fields = ["status"]
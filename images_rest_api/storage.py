@@ -0,0 +1,118 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from storages.backends.s3boto3 import S3Boto3Storage
+from storages.utils import clean_name
+
+from .s3 import get_s3_resource
+
+logger = logging.getLogger(__name__)
+
+# Most keys a single S3 DeleteObjects request accepts.
+DELETE_OBJECTS_MAX_KEYS = 1000
+
+_upload_pool = None
+_upload_pool_lock = threading.Lock()
+
+
+def get_upload_pool():
+    """
+    Process-wide thread pool for storage transfers. Its threads live as long
+    as the process, so their storage connections are reused between uploads.
+    """
+    global _upload_pool
+
+    with _upload_pool_lock:
+        if _upload_pool is None:
+            _upload_pool = ThreadPoolExecutor(
+                max_workers=settings.STORAGE_UPLOAD_CONCURRENCY,
+                thread_name_prefix="storage-upload",
+            )
+        return _upload_pool
+
+
+class PooledS3Storage(S3Boto3Storage):
+    """
+    S3 storage sending its requests through the process-wide client of
+    `get_s3_client`, instead of building a client with a connection pool of
+    its own in every thread. Each thread still gets a resource of its own.
+    """
+
+    @property
+    def connection(self):
+        return get_s3_resource()
+
+
+def save_files(storage, files):
+    """
+    Upload every (name, content) pair of `files` to `storage` concurrently.
+    `content` is either bytes or a File.
+
+    Returns the names the storage saved the files under, in the same order.
+    If any upload fails, the ones that succeeded are removed again and the
+    error is raised.
+    """
+    files = [
+        (name, content if isinstance(content, File) else ContentFile(content))
+        for name, content in files
+    ]
+    if len(files) == 1:
+        name, content = files[0]
+        return [storage.save(name, content)]
+
+    pool = get_upload_pool()
+    futures = [pool.submit(storage.save, name, content) for name, content in files]
+
+    names, error = [], None
+    for future in futures:
+        try:
+            names.append(future.result())
+        except Exception as e:
+            error = error or e
+
+    if error is not None:
+        for name in names:
+            storage.delete(name)
+        raise error
+
+    return names
+
+
+def delete_objects(storage, names):
+    """
+    Delete the files `names` from `storage`: with a DeleteObjects request
+    per DELETE_OBJECTS_MAX_KEYS names on S3, one by one on other storages.
+
+    Returns the set of names that couldn't be deleted.
+    """
+    failed = set()
+    if isinstance(storage, S3Boto3Storage):
+        keys = {
+            storage._normalize_name(clean_name(name)): name for name in names
+        }
+        key_list = list(keys)
+        for start in range(0, len(key_list), DELETE_OBJECTS_MAX_KEYS):
+            batch = key_list[start:start + DELETE_OBJECTS_MAX_KEYS]
+            response = storage.bucket.delete_objects(
+                Delete={
+                    "Objects": [{"Key": key} for key in batch],
+                    "Quiet": True,
+                }
+            )
+            for error in response.get("Errors", []):
+                logger.warning(
+                    "Deleting %s failed: %s", error["Key"], error.get("Message")
+                )
+                failed.add(keys[error["Key"]])
+        return failed
+
+    for name in names:
+        try:
+            storage.delete(name)
+        except Exception:
+            logger.exception("Deleting %s failed.", name)
+            failed.add(name)
+    return failed
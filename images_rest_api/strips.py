@@ -0,0 +1,168 @@
+import math
+import struct
+import zlib
+
+from PIL import Image as pilimage
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Colour types of 8-bit PNGs and the bytes a pixel of each takes.
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+# Alpha images are averaged premultiplied, like Pillow's own resize does, so
+# transparent pixels don't bleed their colour into the neighbouring ones.
+PREMULTIPLIED_MODES = {"RGBA": "RGBa", "LA": "La"}
+READ_SIZE = 64 * 2**10
+
+
+def png_header(source):
+    """
+    (width, height, bytes per pixel) of a PNG that can be decoded in strips,
+    None for any other image.
+
+    Only non-interlaced 8-bit PNGs qualify: their scanlines are stored top to
+    bottom and their raw bytes are the same as Pillow's.
+    """
+    source.seek(0)
+    head = source.read(len(PNG_SIGNATURE) + 25)
+    source.seek(0)
+    if not head.startswith(PNG_SIGNATURE) or head[12:16] != b"IHDR":
+        return None
+
+    width, height, bit_depth, color_type, _, _, interlace = struct.unpack(
+        ">IIBBBBB", head[16:29]
+    )
+    if bit_depth != 8 or interlace or color_type not in PNG_CHANNELS:
+        return None
+    return width, height, PNG_CHANNELS[color_type]
+
+
+def reduce_factor(source_size, output_size, gap):
+    """
+    Largest integer factor `source_size` can be box-reduced by while staying
+    at least `gap` times bigger than `output_size`.
+    """
+    return max(
+        int(min(source / (output * gap) for source, output in
+                zip(source_size, output_size))),
+        1,
+    )
+
+
+def strip_rows(width, factor, strip_pixels):
+    """
+    Scanlines decoded at once: about `strip_pixels` pixels, rounded to whole
+    reduction boxes.
+    """
+    return max(strip_pixels // width // factor, 1) * factor
+
+
+def reduced_size(source_size, factor):
+    return tuple(math.ceil(side / factor) for side in source_size)
+
+
+def iter_idat(source):
+    """
+    Yield the compressed image data of a PNG, READ_SIZE bytes at a time.
+    """
+    source.seek(len(PNG_SIGNATURE))
+    while True:
+        header = source.read(8)
+        if len(header) < 8:
+            raise ValueError("Truncated PNG file.")
+        length, chunk_type = struct.unpack(">I4s", header)
+
+        if chunk_type == b"IEND":
+            return
+        if chunk_type != b"IDAT":
+            source.seek(length + 4, 1)
+            continue
+
+        while length:
+            data = source.read(min(length, READ_SIZE))
+            if not data:
+                raise ValueError("Truncated PNG file.")
+            length -= len(data)
+            yield data
+        # CRC
+        source.seek(4, 1)
+
+
+class ScanlineReader:
+    """
+    Inflates the image data of a PNG no further than it is read.
+    """
+
+    def __init__(self, source):
+        self.chunks = iter_idat(source)
+        self.decompressor = zlib.decompressobj()
+
+    def read(self, size):
+        data = bytearray()
+        while len(data) < size:
+            compressed = self.decompressor.unconsumed_tail or next(self.chunks, None)
+            if compressed is None:
+                raise ValueError("Truncated PNG image data.")
+            data += self.decompressor.decompress(compressed, size - len(data))
+        return bytes(data)
+
+
+def iter_strips(source, rows):
+    """
+    Yield (top, strip) decoding a PNG `rows` scanlines at a time.
+
+    Every strip is decoded by Pillow on its own. Scanline filters may refer
+    to the line above, so each strip is preceded by the previous strip's last
+    line, unfiltered, which is cropped off again after decoding.
+    """
+    header = pilimage.open(source)
+    mode = header.mode
+    width, height, channels = png_header(source)
+    reader = ScanlineReader(source)
+    line_length = 1 + width * channels
+
+    previous = None
+    for top in range(0, height, rows):
+        data = reader.read(min(rows, height - top) * line_length)
+        if previous is not None:
+            data = b"\x00" + previous + data
+
+        strip = pilimage.frombytes(
+            mode,
+            (width, len(data) // line_length),
+            zlib.compress(data, 0),
+            "zip",
+            mode,
+        )
+        previous = strip.crop((0, strip.height - 1, width, strip.height)).tobytes()
+        if top:
+            strip = strip.crop((0, 1, width, strip.height))
+
+        if mode == "P":
+            strip.putpalette(header.palette.palette, header.palette.rawmode)
+            if "transparency" in header.info:
+                strip.info["transparency"] = header.info["transparency"]
+        yield top, strip
+
+
+def reduce_in_strips(source, factor, strip_pixels):
+    """
+    Box-reduce a PNG by `factor` decoding about `strip_pixels` pixels at a
+    time.
+
+    Only one strip and the reduced image are ever held in memory. The result
+    is the same as `reduce(factor)` of the fully decoded image, palette
+    images are converted to RGB(A) first.
+    """
+    header = pilimage.open(source)
+    mode = header.mode
+    if mode == "P":
+        mode = "RGBA" if "transparency" in header.info else "RGB"
+    work_mode = PREMULTIPLIED_MODES.get(mode, mode)
+
+    width, height, _ = png_header(source)
+    reduced = pilimage.new(work_mode, reduced_size((width, height), factor))
+
+    for top, strip in iter_strips(source, strip_rows(width, factor, strip_pixels)):
+        reduced.paste(strip.convert(work_mode).reduce(factor), (0, top // factor))
+
+    source.seek(0)
+    return reduced.convert(mode)
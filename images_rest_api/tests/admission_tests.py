@@ -0,0 +1,124 @@
+import threading
+
+import pytest
+from django.urls import reverse
+from knox.auth import AuthToken
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from ..admission import DecodeBudgetExceeded, PixelBudget, get_decode_budget
+from ..models import UserImage
+from .factories import AccountTypeFactory, CustomUserFactory, UserImageFactory
+
+pytestmark = pytest.mark.django_db
+
+
+class HeldBudget:
+    """
+    Keeps `pixels` of `budget` reserved by another thread.
+    """
+
+    def __init__(self, budget, pixels):
+        self.reserved = threading.Event()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.hold, args=(budget, pixels))
+
+    def hold(self, budget, pixels):
+        with budget.reserve(pixels):
+            self.reserved.set()
+            self.done.wait(5)
+
+    def __enter__(self):
+        self.thread.start()
+        self.reserved.wait(5)
+
+    def __exit__(self, *args):
+        self.done.set()
+        self.thread.join()
+
+
+class TestPixelBudget:
+    def test_reserve_and_release(self):
+        budget = PixelBudget(100)
+
+        with HeldBudget(budget, 60):
+            assert budget.in_use == 60
+            with pytest.raises(DecodeBudgetExceeded) as e:
+                with budget.reserve(50, timeout=0.01):
+                    pass
+            assert e.value.wait == 1
+
+        assert budget.in_use == 0
+
+    def test_waiting_reservation_is_admitted_after_release(self):
+        budget = PixelBudget(100)
+        admitted = threading.Event()
+
+        def reserve():
+            with budget.reserve(80):
+                admitted.set()
+
+        with HeldBudget(budget, 80):
+            thread = threading.Thread(target=reserve)
+            thread.start()
+            assert not admitted.wait(0.05)
+
+        assert admitted.wait(5)
+        thread.join()
+
+    def test_nested_reservation_is_covered_by_outer_one(self):
+        budget = PixelBudget(100)
+
+        with budget.reserve(80):
+            with budget.reserve(60, timeout=0):
+                assert budget.in_use == 80
+            with budget.reserve(90, timeout=0):
+                assert budget.in_use == 90
+
+    def test_image_bigger_than_budget_is_admitted_alone(self):
+        budget = PixelBudget(100)
+
+        with budget.reserve(1000, timeout=0):
+            assert budget.in_use == 100
+
+
+class TestImageAdmission:
+    @pytest.fixture
+    def client(self):
+        user = CustomUserFactory(
+            account_type=AccountTypeFactory(max_image_pixels=250 * 250)
+        )
+        _, token = AuthToken.objects.create(user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION="Token " + token)
+        return client
+
+    def post_image(self, client, size):
+        return client.post(
+            reverse("userimage-list"),
+            {
+                "name": "test_picture",
+                "image": UserImageFactory.create_image("test.jpg", size),
+            },
+            format="multipart",
+        )
+
+    def test_image_over_account_limit_is_rejected(self, client):
+        response = self.post_image(client, 251)
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "251x251 - Image is too large." in response.data["image"][0]
+        assert not UserImage.objects.exists()
+
+    def test_upload_is_refused_without_decode_budget(self, client, settings):
+        settings.DECODE_BUDGET_TIMEOUT = 0.01
+        budget = get_decode_budget()
+
+        with HeldBudget(budget, budget.capacity):
+            response = self.post_image(client, 250)
+
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert response["Retry-After"] == "1"
+        assert not UserImage.objects.exists()
+
+        assert self.post_image(client, 250).status_code == status.HTTP_201_CREATED
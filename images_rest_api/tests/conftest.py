@@ -1,7 +1,11 @@
 import pytest
 from imageapp import settings 
+from knox.auth import AuthToken
 from pytest_factoryboy import register
+from rest_framework.test import APIClient
 
+from ..links import reset_link_signer
+from ..s3 import reset_s3_client
 from .factories import (AccountTypeFactory, CustomUserFactory,
                         ThumbnailSizeFactory, UserImageFactory)
 
@@ -11,3 +15,31 @@ register(ThumbnailSizeFactory)
 register(AccountTypeFactory)
 register(CustomUserFactory)
 register(UserImageFactory)
+
+
+@pytest.fixture(autouse=True)
+def s3_client():
+    # Tests mock boto3.client, so none shares the client or the cached links
+    # of another.
+    reset_s3_client()
+    reset_link_signer()
+    yield
+    reset_s3_client()
+    reset_link_signer()
+
+
+@pytest.fixture
+def api_account_type():
+    return AccountTypeFactory()
+
+
+@pytest.fixture
+def api_user(api_account_type):
+    """
+    A user of `api_account_type` and an API client authenticated as them.
+    """
+    user = CustomUserFactory(account_type=api_account_type)
+    _, token = AuthToken.objects.create(user)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION="Token " + token)
+    return user, client
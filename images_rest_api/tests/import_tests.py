@@ -0,0 +1,233 @@
+import io
+import tarfile
+import zipfile
+from io import StringIO
+
+import pytest
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.urls import reverse
+from knox.auth import AuthToken
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from ..imports import create_user_images, import_archive
+from ..models import Blob, Checkpoint, UserImage
+from .factories import CustomUserFactory, UserImageFactory
+
+pytestmark = pytest.mark.django_db
+
+MEMBERS = [
+    ("photos/first.jpg", UserImageFactory.create_image("first.jpg", 210)),
+    ("notes.txt", io.BytesIO(b"not an image")),
+    ("photos/second.jpg", UserImageFactory.create_image("second.jpg", 220)),
+    (
+        "third.png",
+        UserImageFactory.create_image("third.png", 230, format="PNG"),
+    ),
+]
+
+
+def members():
+    for name, file in MEMBERS:
+        file.seek(0)
+        yield name, file.read()
+
+
+def zip_archive(path):
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.mkdir("photos")
+        for name, content in members():
+            archive.writestr(name, content)
+    return path
+
+
+def tar_archive(path):
+    with tarfile.open(path, "w:gz") as archive:
+        for name, content in members():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    return path
+
+
+def import_images(*args):
+    out = StringIO()
+    call_command("import_images", *args, stdout=out)
+    return out.getvalue()
+
+
+@pytest.fixture
+def user():
+    return CustomUserFactory()
+
+
+class TestImportImages:
+    @pytest.mark.parametrize("make_archive", [zip_archive, tar_archive])
+    def test_import_archive(self, user, tmp_path, make_archive):
+        archive = make_archive(tmp_path / "library")
+
+        out = import_images(str(archive), "--user", user.username)
+
+        assert "Imported 3 images, skipped 1 files." in out
+        assert "Skipped notes.txt" in out
+        user_images = UserImage.objects.filter(author=user).order_by("id")
+        assert [user_image.name for user_image in user_images] == [
+            "first", "second", "third"
+        ]
+        for user_image in user_images:
+            assert user_image.status == UserImage.Status.READY
+            assert user_image.thumbnails.count() == (
+                user.account_type.thumbs.count()
+            )
+        assert not Checkpoint.objects.exists()
+
+    def test_too_large_member_is_skipped(self, user, tmp_path, settings):
+        settings.IMAGE_UPLOAD_MAX_SIZE = 1000
+        archive = zip_archive(tmp_path / "library.zip")
+
+        out = import_images(str(archive), "--user", user.username)
+
+        assert "Skipped photos/first.jpg: {'image': ['The file is too large." in out
+        assert not UserImage.objects.filter(author=user, name="first").exists()
+
+    def test_interrupted_import_resumes(self, user, tmp_path, mocker):
+        archive = zip_archive(tmp_path / "library.zip")
+        batches = []
+
+        def fail_second_batch(author, images, checkpoint):
+            batches.append(images)
+            if len(batches) == 2:
+                raise RuntimeError("Storage is down.")
+            return create_user_images(author, images, checkpoint)
+
+        mocker.patch(
+            "images_rest_api.imports.create_user_images",
+            side_effect=fail_second_batch,
+        )
+
+        with pytest.raises(RuntimeError):
+            import_images(
+                str(archive), "--user", user.username, "--batch-size", "1"
+            )
+        assert UserImage.objects.filter(author=user).count() == 1
+        assert Checkpoint.objects.get().position == 1
+
+        mocker.stopall()
+        out = import_images(
+            str(archive), "--user", user.username, "--batch-size", "1"
+        )
+
+        assert "Imported 2 images, skipped 1 files." in out
+        assert sorted(
+            UserImage.objects.filter(author=user).values_list("name", flat=True)
+        ) == ["first", "second", "third"]
+
+    def test_failed_upload_in_batch_releases_blobs(self, user, mocker):
+        existing = UserImageFactory(
+            author=user, image=UserImageFactory.create_image("first.jpg", 210)
+        )
+        blobs = Blob.objects.count()
+        storage = UserImage._meta.get_field("image").storage
+        save = storage.save
+        saved = []
+
+        def fail_png(name, content, max_length=None):
+            if name.endswith(".png"):
+                raise OSError("Connection reset.")
+            saved.append(save(name, content, max_length=max_length))
+            return saved[-1]
+
+        mocker.patch.object(storage, "save", side_effect=fail_png)
+
+        with pytest.raises(OSError):
+            create_user_images(
+                user,
+                [
+                    (name.split("/")[-1].split(".")[0], file)
+                    for name, file in MEMBERS
+                    if name != "notes.txt"
+                ],
+            )
+
+        existing.blob.refresh_from_db()
+        assert existing.blob.refcount == 1
+        assert Blob.objects.count() == blobs
+        assert UserImage.objects.filter(author=user).count() == 1
+        # The upload that went through is deleted again.
+        assert saved and not any(storage.exists(name) for name in saved)
+
+    def test_checkpoint_moves_with_its_batch(self, user, tmp_path, mocker):
+        archive = zip_archive(tmp_path / "library.zip")
+        Checkpoint.objects.create(name="import")
+        mocker.patch.object(
+            Checkpoint, "save", side_effect=RuntimeError("Database is down.")
+        )
+
+        with pytest.raises(RuntimeError), open(archive, "rb") as file:
+            import_archive(user, file, "import", batch_size=1)
+
+        # The images of the batch are rolled back with the checkpoint.
+        assert not UserImage.objects.filter(author=user).exists()
+        assert not Blob.objects.exists()
+
+    def test_batch_is_capped_by_size(self, user, tmp_path, settings, mocker):
+        settings.IMPORT_BATCH_MAX_BYTES = 1
+        archive = zip_archive(tmp_path / "library.zip")
+        batches = []
+
+        def record_batch(author, images, checkpoint):
+            batches.append(len(images))
+            return create_user_images(author, images, checkpoint)
+
+        mocker.patch(
+            "images_rest_api.imports.create_user_images",
+            side_effect=record_batch,
+        )
+
+        with open(archive, "rb") as file:
+            imported, _ = import_archive(user, file, "import", batch_size=100)
+
+        assert imported == 3
+        assert batches == [1, 1, 1]
+
+    def test_not_an_archive(self, user, tmp_path):
+        path = tmp_path / "notes.txt"
+        path.write_bytes(b"not an archive")
+
+        with pytest.raises(Exception, match="not a ZIP or TAR archive"):
+            import_images(str(path), "--user", user.username)
+
+
+class TestImportEndpoint:
+    @pytest.fixture
+    def client(self, user):
+        _, token = AuthToken.objects.create(user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION="Token " + token)
+        return client
+
+    def test_import_archive(self, user, client, tmp_path):
+        archive = zip_archive(tmp_path / "library.zip")
+
+        with open(archive, "rb") as file:
+            response = client.post(
+                reverse("userimage-import-archive"),
+                {"archive": file},
+                format="multipart",
+            )
+
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        assert UserImage.objects.filter(author=user).count() == 3
+        _, imports = default_storage.listdir("imports")
+        assert not imports
+
+    def test_not_an_archive(self, user, client):
+        response = client.post(
+            reverse("userimage-import-archive"),
+            {"archive": io.BytesIO(b"not an archive")},
+            format="multipart",
+        )
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert not UserImage.objects.filter(author=user).exists()
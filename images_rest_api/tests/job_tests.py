@@ -0,0 +1,375 @@
+from datetime import timedelta
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from knox.auth import AuthToken
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from ..jobs import (
+    claim_jobs,
+    enqueue,
+    enqueue_account_purge,
+    expire_direct_uploads,
+    run_job,
+)
+from ..models import (
+    Blob,
+    CustomUser,
+    Job,
+    StorageTombstone,
+    Thumbnail,
+    UploadSession,
+    UserImage,
+)
+from ..tombstones import drain_tombstones
+from .factories import (
+    AccountTypeFactory,
+    CustomUserFactory,
+    ThumbnailSizeFactory,
+    UserImageFactory,
+)
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def queued_jobs(settings):
+    settings.JOBS_RUN_EAGERLY = False
+
+
+class TestThumbnailJobs:
+    def test_upload_enqueues_job_instead_of_rendering(self):
+        user_image = UserImageFactory()
+
+        job = Job.objects.get()
+        assert job.kind == Job.Kind.RENDER_THUMBNAILS
+        assert job.payload == {"user_image_id": user_image.id}
+        assert user_image.status == UserImage.Status.PENDING
+        assert not Thumbnail.objects.exists()
+
+    def test_create_view_returns_pending_status(self):
+        user = CustomUserFactory()
+        _, token = AuthToken.objects.create(user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION="Token " + token)
+
+        response = client.post(
+            reverse("userimage-list"),
+            {
+                "name": "test_picture",
+                "image": UserImageFactory.create_image("test.jpg", 300),
+            },
+            format="multipart",
+        )
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data["status"] == UserImage.Status.PENDING
+        assert Job.objects.count() == 1
+
+    def test_claimed_job_is_not_claimed_twice(self):
+        UserImageFactory()
+
+        first = claim_jobs("worker-1", limit=10)
+        second = claim_jobs("worker-2", limit=10)
+
+        assert len(first) == 1
+        assert first[0].status == Job.Status.RUNNING
+        assert first[0].locked_by == "worker-1"
+        assert first[0].attempts == 1
+        assert second == []
+
+    def test_stale_job_is_reclaimed(self, settings):
+        UserImageFactory()
+        claim_jobs("worker-1")
+        Job.objects.update(
+            locked_at=timezone.now()
+            - timedelta(seconds=settings.JOBS_LEASE_SECONDS + 1)
+        )
+
+        jobs = claim_jobs("worker-2")
+
+        assert len(jobs) == 1
+        assert jobs[0].locked_by == "worker-2"
+        assert jobs[0].attempts == 2
+
+    def test_run_job_renders_thumbnails(self):
+        user_image = UserImageFactory()
+        (job,) = claim_jobs("worker-1")
+
+        assert run_job(job)
+
+        user_image.refresh_from_db()
+        assert user_image.status == UserImage.Status.READY
+        assert user_image.thumbnails.count() == (
+            user_image.author.account_type.thumbs.count()
+        )
+        assert not Job.objects.exists()
+
+    def test_failed_job_is_retried_then_marked_failed(self, settings, mocker):
+        settings.JOBS_MAX_ATTEMPTS = 2
+        mocker.patch(
+            "images_rest_api.jobs.create_thumbnails",
+            side_effect=OSError("broken"),
+        )
+        user_image = UserImageFactory()
+
+        (job,) = claim_jobs("worker-1")
+        assert not run_job(job)
+        job.refresh_from_db()
+        assert job.status == Job.Status.PENDING
+        assert job.run_after > timezone.now()
+
+        Job.objects.update(run_after=timezone.now())
+        (job,) = claim_jobs("worker-1")
+        assert not run_job(job)
+        job.refresh_from_db()
+        user_image.refresh_from_db()
+        assert job.status == Job.Status.FAILED
+        assert "broken" in job.last_error
+        assert user_image.status == UserImage.Status.FAILED
+
+    def test_failed_render_releases_shared_thumbnails(self, mocker):
+        user = CustomUserFactory(
+            account_type=AccountTypeFactory(
+                thumbs=[ThumbnailSizeFactory(size=200)]
+            )
+        )
+        first = UserImageFactory(author=user)
+        run_job(*claim_jobs("worker-1"))
+        shared = first.thumbnails.get().blob
+        user.account_type.thumbs.add(ThumbnailSizeFactory(size=100))
+        second = UserImageFactory(author=user)
+        mocker.patch(
+            "images_rest_api.thumbnails.submit_render",
+            side_effect=OSError("Render worker died."),
+        )
+
+        for _ in range(3):
+            Job.objects.update(run_after=timezone.now())
+            assert not run_job(*claim_jobs("worker-1"))
+
+        shared.refresh_from_db()
+        assert shared.refcount == 1
+        first.delete()
+        second.delete()
+        assert not Blob.objects.filter(pk=shared.pk).exists()
+
+    def test_run_jobs_command_drains_queue(self):
+        UserImageFactory()
+        UserImageFactory()
+
+        call_command("run_jobs", "--once", "--batch-size", "5")
+
+        assert not Job.objects.exists()
+        assert not UserImage.objects.exclude(
+            status=UserImage.Status.READY
+        ).exists()
+
+
+class TestWorkerHousekeeping:
+    def test_files_are_deleted_while_queue_is_busy(self, mocker):
+        UserImageFactory()
+        StorageTombstone.objects.bury(["user_images/deleted.jpg"])
+        pending = []
+
+        def drain():
+            pending.append(Job.objects.count())
+            return drain_tombstones()
+
+        mocker.patch(
+            "images_rest_api.management.commands.run_jobs.drain_tombstones",
+            side_effect=drain,
+        )
+
+        call_command("run_jobs", "--once")
+
+        assert pending[0] == 1
+        assert not StorageTombstone.objects.exists()
+
+    def test_failed_drain_does_not_stop_worker(self, mocker):
+        mocker.patch(
+            "images_rest_api.management.commands.run_jobs.drain_tombstones",
+            side_effect=OSError("S3 is down."),
+        )
+        UserImageFactory()
+
+        call_command("run_jobs", "--once")
+
+        assert not Job.objects.exists()
+
+
+    def test_abandoned_uploads_expire_while_queue_is_busy(self, mocker):
+        pending = []
+        mocker.patch(
+            "images_rest_api.management.commands.run_jobs."
+            "expire_direct_uploads",
+            side_effect=lambda: pending.append(Job.objects.count()),
+        )
+        UserImageFactory()
+
+        call_command("run_jobs", "--once")
+
+        assert pending[0] == 1
+
+    def test_failed_expiry_does_not_stop_worker(self, mocker):
+        mocker.patch(
+            "images_rest_api.management.commands.run_jobs."
+            "expire_direct_uploads",
+            side_effect=OSError("Database is down."),
+        )
+        StorageTombstone.objects.bury(["user_images/deleted.jpg"])
+        UserImageFactory()
+
+        call_command("run_jobs", "--once")
+
+        assert not Job.objects.exists()
+        assert not StorageTombstone.objects.exists()
+
+
+class TestJobDeduplication:
+    def test_active_job_with_same_key_is_reused(self):
+        first = enqueue(Job.Kind.RENDER_THUMBNAILS, {"user_image_id": 1}, "key")
+        second = enqueue(Job.Kind.RENDER_THUMBNAILS, {"user_image_id": 1}, "key")
+
+        assert first == second
+        assert Job.objects.count() == 1
+
+    def test_failed_job_does_not_block_new_one(self):
+        first = enqueue(Job.Kind.RENDER_THUMBNAILS, {"user_image_id": 1}, "key")
+        Job.objects.update(status=Job.Status.FAILED)
+
+        second = enqueue(Job.Kind.RENDER_THUMBNAILS, {"user_image_id": 1}, "key")
+
+        assert first != second
+        assert Job.objects.count() == 2
+
+
+class TestAccountPurge:
+    def test_user_is_deactivated_then_purged_in_chunks(self, settings):
+        settings.ACCOUNT_PURGE_CHUNK_SIZE = 2
+        user = CustomUserFactory()
+        AuthToken.objects.create(user)
+        for _ in range(3):
+            UserImageFactory(author=user)
+        Job.objects.all().delete()
+
+        enqueue_account_purge(user)
+
+        user.refresh_from_db()
+        assert not user.is_active
+        assert not AuthToken.objects.filter(user=user).exists()
+        assert UserImage.objects.filter(author=user).count() == 3
+
+        (job,) = claim_jobs("worker-1")
+        assert job.kind == Job.Kind.PURGE_ACCOUNT
+        assert run_job(job)
+
+        assert not CustomUser.objects.filter(pk=user.pk).exists()
+        assert not UserImage.objects.exists()
+        assert not Thumbnail.objects.exists()
+        assert StorageTombstone.objects.exists()
+
+    def test_purge_is_queued_once(self):
+        user = CustomUserFactory()
+
+        enqueue_account_purge(user)
+        enqueue_account_purge(user)
+
+        assert Job.objects.filter(kind=Job.Kind.PURGE_ACCOUNT).count() == 1
+
+
+class TestExpireDirectUploads:
+    def reserve(self, user, age, key):
+        user_image = UserImage.objects.create(
+            name="direct",
+            author=user,
+            image=f"user_images/direct/{key}.png",
+            status=UserImage.Status.UPLOADING,
+        )
+        UserImage.objects.filter(pk=user_image.pk).update(
+            created_at=timezone.now() - timedelta(seconds=age)
+        )
+        return user_image
+
+    def test_abandoned_direct_upload_is_deleted(self, settings):
+        settings.DIRECT_UPLOAD_EXPIRES = 3600
+        user = CustomUserFactory()
+        expired = self.reserve(user, 3601, "expired")
+        fresh = self.reserve(user, 3500, "fresh")
+        resumable = self.reserve(user, 7200, "resumable")
+        UploadSession.objects.create(
+            user_image=resumable,
+            content_type="image/png",
+            length=1,
+            part_size=1,
+            multipart_upload_id="upload-1",
+        )
+        completed = self.reserve(user, 7200, "completed")
+        UserImage.objects.filter(pk=completed.pk).update(
+            status=UserImage.Status.PENDING
+        )
+
+        assert expire_direct_uploads() == 1
+
+        assert set(UserImage.objects.values_list("pk", flat=True)) == {
+            fresh.pk, resumable.pk, completed.pk
+        }
+        assert list(StorageTombstone.objects.values_list("name", flat=True)) == [
+            expired.image.name
+        ]
+
+    def test_deletes_in_batches(self, settings):
+        user = CustomUserFactory()
+        for key in range(3):
+            self.reserve(user, settings.DIRECT_UPLOAD_EXPIRES + 1, key)
+
+        assert expire_direct_uploads(limit=2) == 2
+        assert expire_direct_uploads(limit=2) == 1
+        assert not UserImage.objects.exists()
+
+
+class TestMissingThumbnails:
+    @pytest.fixture
+    def client(self, user_image):
+        _, token = AuthToken.objects.create(user_image.author)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION="Token " + token)
+        return client
+
+    @pytest.fixture
+    def user_image(self):
+        user_image = UserImageFactory()
+        run_job(*claim_jobs("worker-1"))
+        return user_image
+
+    def test_viewing_image_after_upgrade_renders_missing_size(
+        self, client, user_image
+    ):
+        account_type = user_image.author.account_type
+        rendered = set(user_image.thumbnails.values_list("id", flat=True))
+        account_type.thumbs.add(ThumbnailSizeFactory(size=300))
+
+        client.get(reverse("userimage-list"))
+        client.get(reverse("userimage-detail", args=[user_image.id]))
+
+        (job,) = claim_jobs("worker-1")
+        assert run_job(job)
+        assert 300 in user_image.thumbnails.values_list("size", flat=True)
+        assert rendered < set(user_image.thumbnails.values_list("id", flat=True))
+        assert user_image.thumbnails.count() == len(rendered) + 1
+
+    def test_complete_images_are_not_rendered(self, client):
+        client.get(reverse("userimage-list"))
+
+        assert not Job.objects.exists()
+
+    def test_failed_images_are_not_rendered(self, client, user_image):
+        UserImage.objects.update(status=UserImage.Status.FAILED)
+        user_image.author.account_type.thumbs.add(ThumbnailSizeFactory(size=300))
+
+        client.get(reverse("userimage-list"))
+
+        assert not Job.objects.exists()
@@ -0,0 +1,292 @@
+import base64
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import DEFAULT_STORAGE_ALIAS, storages
+from django.core.files.storage.memory import InMemoryStorage
+from django.urls import reverse
+from django.utils import timezone
+from knox.auth import AuthToken
+from rest_framework import status
+from rest_framework.test import APIClient
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from ..links import (
+    CloudFrontLinkSigner,
+    LinkCache,
+    StorageLinkSigner,
+    StorageURLs,
+    get_link_signer,
+)
+from .factories import AccountTypeFactory, CustomUserFactory, UserImageFactory
+
+pytestmark = pytest.mark.django_db
+
+PRIVATE_KEY = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+PRIVATE_KEY_PEM = PRIVATE_KEY.private_bytes(
+    serialization.Encoding.PEM,
+    serialization.PrivateFormat.TraditionalOpenSSL,
+    serialization.NoEncryption(),
+).decode()
+
+
+def cloudfront_b64decode(value):
+    return base64.b64decode(
+        value.replace("-", "+").replace("_", "=").replace("~", "/")
+    )
+
+
+@pytest.fixture
+def cloudfront(settings):
+    settings.STORAGES = {
+        **settings.STORAGES,
+        DEFAULT_STORAGE_ALIAS: {
+            "BACKEND": "storages.backends.s3boto3.S3Boto3Storage",
+            "OPTIONS": {"bucket_name": "images"},
+        },
+    }
+    settings.TEMPORARY_LINK_SIGNER = "images_rest_api.links.CloudFrontLinkSigner"
+    settings.AWS_S3_CUSTOM_DOMAIN = "cdn.example.com"
+    settings.AWS_CLOUDFRONT_KEY_ID = "K2JCJMDEHXQW5F"
+    settings.AWS_CLOUDFRONT_KEY = PRIVATE_KEY_PEM
+
+
+class FakeSigner:
+    def __init__(self):
+        self.calls = []
+
+    def sign(self, key, expires_in):
+        self.calls.append((key, expires_in))
+        return f"https://cdn.example.com/{key}?n={len(self.calls)}"
+
+
+class TestLinkCache:
+    @pytest.fixture
+    def clock(self, mocker):
+        clock = mocker.patch("images_rest_api.links.time.time")
+        clock.return_value = 36000
+        return clock
+
+    @pytest.fixture
+    def cache(self, settings):
+        settings.TEMPORARY_LINK_CACHE_SIZE = 2
+        settings.TEMPORARY_LINK_MIN_LIFETIME = 0.9
+        return LinkCache(FakeSigner())
+
+    def test_link_is_reused_within_bucket(self, cache, clock):
+        first = cache.sign("a.jpeg", 3600)
+        clock.return_value += 359
+
+        assert cache.sign("a.jpeg", 3600) == first
+        assert cache.signer.calls == [("a.jpeg", 3600)]
+
+    def test_link_is_renewed_before_falling_below_min_lifetime(
+        self, cache, clock
+    ):
+        first = cache.sign("a.jpeg", 3600)
+        clock.return_value += 360
+
+        assert cache.sign("a.jpeg", 3600) != first
+        assert cache.signer.calls[-1] == ("a.jpeg", 3600)
+
+    def test_expiry_is_rounded_to_bucket(self, cache, clock):
+        clock.return_value += 100
+
+        cache.sign("a.jpeg", 3600)
+
+        # Expires with the links signed since the bucket started.
+        assert cache.signer.calls == [("a.jpeg", 3500)]
+
+    def test_durations_are_cached_apart(self, cache, clock):
+        cache.sign("a.jpeg", 3600)
+        cache.sign("a.jpeg", 600)
+
+        assert len(cache.signer.calls) == 2
+
+    def test_least_recently_used_link_is_evicted(self, cache, clock):
+        cache.sign("a.jpeg", 3600)
+        cache.sign("b.jpeg", 3600)
+        cache.sign("a.jpeg", 3600)
+        cache.sign("c.jpeg", 3600)
+
+        cache.sign("a.jpeg", 3600)
+        cache.sign("b.jpeg", 3600)
+
+        assert [key for key, _ in cache.signer.calls] == [
+            "a.jpeg", "b.jpeg", "c.jpeg", "b.jpeg"
+        ]
+
+
+class TestCloudFrontLinkSigner:
+    def test_signs_canned_policy_url(self, cloudfront):
+        before = int(timezone.now().timestamp())
+
+        url = get_link_signer().sign("user_images/a b.jpeg", 600)
+
+        parts = urlsplit(url)
+        assert f"{parts.scheme}://{parts.netloc}{parts.path}" == (
+            "https://cdn.example.com/user_images/a%20b.jpeg"
+        )
+        query = parse_qs(parts.query)
+        expires = int(query["Expires"][0])
+        assert before + 600 <= expires <= before + 601
+        assert query["Key-Pair-Id"] == ["K2JCJMDEHXQW5F"]
+
+        policy = (
+            '{"Statement":[{"Resource":"https://cdn.example.com/'
+            'user_images/a%20b.jpeg","Condition":{"DateLessThan":'
+            f'{{"AWS:EpochTime":{expires}}}}}}}]}}'
+        )
+        PRIVATE_KEY.public_key().verify(
+            cloudfront_b64decode(query["Signature"][0]),
+            policy.encode(),
+            padding.PKCS1v15(),
+            hashes.SHA1(),
+        )
+
+    def test_storage_signer_is_reused(self, cloudfront, mocker):
+        storage = storages[DEFAULT_STORAGE_ALIAS]
+        sign = mocker.spy(storage.cloudfront_signer, "generate_presigned_url")
+
+        CloudFrontLinkSigner().sign("a.jpeg", 600)
+
+        assert sign.call_count == 1
+
+    def test_missing_key_is_rejected(self, cloudfront, settings):
+        settings.AWS_CLOUDFRONT_KEY_ID = None
+        settings.AWS_CLOUDFRONT_KEY = None
+
+        with pytest.raises(ImproperlyConfigured):
+            get_link_signer()
+
+    def test_storage_without_cdn_is_rejected(self, settings):
+        settings.TEMPORARY_LINK_SIGNER = (
+            "images_rest_api.links.CloudFrontLinkSigner"
+        )
+
+        with pytest.raises(ImproperlyConfigured):
+            get_link_signer()
+
+    def test_temporary_link_view_uses_cloudfront(self, request, mocker):
+        user = CustomUserFactory(
+            account_type=AccountTypeFactory(time_limited_link=True)
+        )
+        user_image = UserImageFactory(author=user)
+        # The image is stored before the default storage moves to S3.
+        request.getfixturevalue("cloudfront")
+        create_client = mocker.patch("boto3.client")
+        _, token = AuthToken.objects.create(user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION="Token " + token)
+
+        response = client.get(
+            reverse("generate-temporary-link", args=("image", user_image.id))
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["temporary_url"].startswith(
+            f"https://cdn.example.com/{user_image.image.name}?Expires="
+        )
+        create_client.assert_not_called()
+
+
+class TestStorageURLs:
+    @pytest.fixture(autouse=True)
+    def s3_settings(self, settings, mocker):
+        settings.AWS_ACCESS_KEY_ID = "minio"
+        settings.AWS_SECRET_ACCESS_KEY = "minio-secret"
+        settings.AWS_S3_REGION_NAME = "us-east-1"
+        # The storages sign their URLs themselves.
+        settings.TEMPORARY_LINK_SIGNER = "images_rest_api.links.MissingSigner"
+        mocker.patch("images_rest_api.links.time.time", return_value=36000)
+
+    @pytest.fixture
+    def sign(self, mocker):
+        return mocker.spy(StorageLinkSigner, "sign")
+
+    def cdn_storage(self, **options):
+        return S3Boto3Storage(
+            bucket_name="images",
+            custom_domain="cdn.example.com",
+            querystring_auth=True,
+            querystring_expire=3600,
+            **options,
+        )
+
+    def test_bucket_urls_are_presigned_once(self, sign):
+        storage = S3Boto3Storage(
+            bucket_name="other-images",
+            querystring_auth=True,
+            querystring_expire=3600,
+        )
+        urls = StorageURLs(storage)
+
+        first = urls.url("user_images/a.jpeg")
+        urls.url("user_images/b.jpeg")
+
+        assert urls.url("user_images/a.jpeg") == first
+        assert sign.call_count == 2
+        parts = urlsplit(first)
+        assert "other-images" in f"{parts.netloc}{parts.path}"
+        assert parts.path.endswith("/user_images/a.jpeg")
+        assert "Signature" in parse_qs(parts.query)
+
+    def test_cloudfront_urls_are_shared_between_requests(self, sign):
+        storage = self.cdn_storage(
+            cloudfront_key_id="K2JCJMDEHXQW5F", cloudfront_key=PRIVATE_KEY_PEM
+        )
+
+        before = int(timezone.now().timestamp())
+
+        url = StorageURLs(storage).url("user_images/a b.jpeg")
+
+        assert StorageURLs(storage).url("user_images/a b.jpeg") == url
+        assert sign.call_count == 1
+        parts = urlsplit(url)
+        assert f"{parts.scheme}://{parts.netloc}{parts.path}" == (
+            "https://cdn.example.com/user_images/a%20b.jpeg"
+        )
+        query = parse_qs(parts.query)
+        expires = int(query["Expires"][0])
+        assert before + 3600 <= expires <= before + 3601
+        assert query["Key-Pair-Id"] == ["K2JCJMDEHXQW5F"]
+        policy = (
+            '{"Statement":[{"Resource":"https://cdn.example.com/'
+            'user_images/a%20b.jpeg","Condition":{"DateLessThan":'
+            f'{{"AWS:EpochTime":{expires}}}}}}}]}}'
+        )
+        PRIVATE_KEY.public_key().verify(
+            cloudfront_b64decode(query["Signature"][0]),
+            policy.encode(),
+            padding.PKCS1v15(),
+            hashes.SHA1(),
+        )
+
+    def test_custom_domain_without_signer_is_not_signed(self, sign):
+        storage = self.cdn_storage()
+
+        url = StorageURLs(storage).url("user_images/a b.jpeg")
+
+        assert url == storage.url("user_images/a b.jpeg")
+        assert url == "https://cdn.example.com/user_images/a%20b.jpeg"
+        assert not sign.called
+
+    def test_public_prefix_is_not_signed(self, sign, settings):
+        settings.STORAGE_PUBLIC_PREFIXES = ["user_images/thumbnails/"]
+        storage = self.cdn_storage(
+            cloudfront_key_id="K2JCJMDEHXQW5F", cloudfront_key=PRIVATE_KEY_PEM
+        )
+
+        url = StorageURLs(storage).url("user_images/thumbnails/a 100.jpeg")
+
+        assert url == "https://cdn.example.com/user_images/thumbnails/a%20100.jpeg"
+        assert not sign.called
+
+    def test_other_storages_build_their_urls(self, sign):
+        storage = InMemoryStorage(base_url="/media/")
+
+        assert StorageURLs(storage).url("a.jpeg") == "/media/a.jpeg"
+        assert not sign.called
@@ -1,11 +1,16 @@
+import threading
 import uuid
 
 import pytest
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.db.utils import IntegrityError
 from faker import Faker
 
-from ..models import AccountType, Thumbnail, UserImage
+from .. import models
+from ..models import AccountType, Blob, StorageTombstone, Thumbnail, UserImage
+from ..storage import delete_objects as delete_files
+from ..tombstones import drain_tombstones
 from .factories import (
     AccountTypeFactory,
     CustomUserFactory,
@@ -98,6 +103,20 @@ class TestCustomUser:
         with pytest.raises(get_user_model().DoesNotExist):
             get_user_model().objects.get(id=user_id)
 
+    def test_delete_user_releases_image_files(self, settings):
+        settings.ACCOUNT_PURGE_CHUNK_SIZE = 1
+        user_images = [UserImageFactory(author=self.user) for _ in range(2)]
+        storage = user_images[0].image.storage
+        user_id = self.user.id
+
+        self.user.delete()
+        drain_tombstones()
+
+        assert not UserImage.objects.filter(author_id=user_id).exists()
+        assert not Thumbnail.objects.filter(author_id=user_id).exists()
+        for user_image in user_images:
+            assert not storage.exists(user_image.image.name)
+
 
 class TestThumbnailSizeModel:
     def setup_method(self):
@@ -188,3 +207,193 @@ class TestUserImageModel:
                     "size", flat=True
                 )
             )
+
+
+
+class TestContentAddressedStorage:
+    @pytest.fixture
+    def user(self):
+        return CustomUserFactory(
+            account_type=AccountTypeFactory(
+                thumbs=[
+                    ThumbnailSizeFactory(size=50),
+                    ThumbnailSizeFactory(size=100),
+                ]
+            )
+        )
+
+    def test_identical_uploads_share_original(self, user):
+        first = UserImageFactory(author=user)
+        second = UserImageFactory(author=user)
+        other = UserImageFactory(
+            author=user, image=UserImageFactory.create_image("other.jpg", 300)
+        )
+
+        assert first.blob == second.blob != other.blob
+        assert first.image.name == second.image.name
+        assert first.image.name.startswith(f"user_images/{first.blob.digest}")
+        first.blob.refresh_from_db()
+        assert first.blob.refcount == 2
+
+    def test_identical_upload_reuses_thumbnails(self, user, mocker):
+        first = UserImageFactory(author=user)
+        render = mocker.patch("images_rest_api.thumbnails.submit_render")
+
+        second = UserImageFactory(author=user)
+
+        render.assert_not_called()
+        assert sorted(
+            second.thumbnails.values_list("size", "blob")
+        ) == sorted(first.thumbnails.values_list("size", "blob"))
+
+    def test_file_is_deleted_with_last_reference(self, user):
+        first = UserImageFactory(author=user)
+        second = UserImageFactory(author=user)
+        storage = first.image.storage
+        name = first.image.name
+
+        first.delete()
+        drain_tombstones()
+        assert storage.exists(name)
+        assert Blob.objects.filter(pk=second.blob_id).exists()
+
+        second.delete()
+        assert storage.exists(name)
+        drain_tombstones()
+        assert not storage.exists(name)
+        assert not Blob.objects.filter(pk=second.blob_id).exists()
+
+    def test_thumbnail_file_is_deleted_with_last_reference(self, user):
+        first = UserImageFactory(author=user).thumbnails.get(size=50)
+        second = UserImageFactory(author=user).thumbnails.get(size=50)
+        storage = first.image.storage
+
+        first.delete()
+        drain_tombstones()
+        assert storage.exists(second.image.name)
+
+        second.delete()
+        drain_tombstones()
+        assert not storage.exists(second.image.name)
+
+    def test_file_stored_again_is_not_deleted(self, user, mocker):
+        # Overwrite existing files like S3 does.
+        mocker.patch.object(
+            UserImage._meta.get_field("image").storage,
+            "get_available_name",
+            side_effect=lambda name, max_length=None: name,
+        )
+        first = UserImageFactory(author=user)
+        name = first.image.name
+        first.delete()
+
+        second = UserImageFactory(author=user)
+        drain_tombstones()
+
+        assert second.image.name == name
+        assert second.image.storage.exists(name)
+        assert not StorageTombstone.objects.exists()
+
+    @pytest.mark.django_db(transaction=True)
+    def test_file_stored_during_drain_is_not_deleted(self, user, mocker):
+        storage = UserImage._meta.get_field("image").storage
+        mocker.patch.object(
+            storage,
+            "get_available_name",
+            side_effect=lambda name, max_length=None: name,
+        )
+        first = UserImageFactory(author=user)
+        name = first.image.name
+        first.delete()
+        stored = []
+
+        def store_again():
+            try:
+                stored.append(UserImageFactory(author=user))
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=store_again)
+
+        def delete_objects(storage, names):
+            thread.start()
+            # The upload waits for the drain to delete the old file.
+            thread.join(timeout=0.5)
+            assert thread.is_alive()
+            return delete_files(storage, names)
+
+        mocker.patch(
+            "images_rest_api.tombstones.delete_objects",
+            side_effect=delete_objects,
+        )
+        drain_tombstones()
+        thread.join()
+
+        (second,) = stored
+        assert second.image.name == name
+        assert storage.exists(name)
+        assert not StorageTombstone.objects.filter(name=name).exists()
+
+    def test_failed_insert_releases_reference(self, user):
+        first = UserImageFactory(author=user)
+        image = UserImage(
+            author=user,
+            name=None,
+            image=UserImageFactory.create_image("a.jpg", 200),
+        )
+
+        with pytest.raises(IntegrityError):
+            image.save()
+
+        first.blob.refresh_from_db()
+        assert first.blob.refcount == 1
+
+    def test_failed_insert_buries_new_file(self, user):
+        image = UserImage(
+            author=user,
+            name=None,
+            image=UserImageFactory.create_image("a.jpg", 300),
+        )
+
+        with pytest.raises(IntegrityError):
+            image.save()
+
+        assert not Blob.objects.exists()
+        assert list(StorageTombstone.objects.values_list("name", flat=True)) == [
+            image.image.name
+        ]
+
+    def test_failed_bulk_upload_releases_references(self, user, mocker):
+        first = UserImageFactory(author=user)
+        blobs = Blob.objects.count()
+        mocker.patch(
+            "images_rest_api.models.save_files", side_effect=OSError("S3 is down")
+        )
+
+        with pytest.raises(OSError):
+            Blob.objects.store_many(
+                UserImage._meta.get_field("image"),
+                [
+                    UserImageFactory.create_image("a.jpg", 200),
+                    UserImageFactory.create_image("b.jpg", 300),
+                ],
+            )
+
+        first.blob.refresh_from_db()
+        assert first.blob.refcount == 1
+        assert Blob.objects.count() == blobs
+
+    def test_failed_registration_buries_uploads(self, user, mocker):
+        mocker.patch.object(
+            Blob.objects, "register", side_effect=IntegrityError("boom")
+        )
+        save_files = mocker.spy(models, "save_files")
+
+        with pytest.raises(IntegrityError):
+            Blob.objects.store_many(
+                UserImage._meta.get_field("image"),
+                [UserImageFactory.create_image("a.jpg", 300)],
+            )
+
+        (name,) = save_files.spy_return
+        assert StorageTombstone.objects.filter(name=name).exists()
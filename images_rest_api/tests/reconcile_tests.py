@@ -0,0 +1,113 @@
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+
+from ..jobs import claim_jobs, run_job
+from ..models import Checkpoint, Job, Thumbnail
+from ..tombstones import drain_tombstones
+from .factories import (
+    AccountTypeFactory,
+    CustomUserFactory,
+    ThumbnailSizeFactory,
+    UserImageFactory,
+)
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def queued_jobs(settings):
+    settings.JOBS_RUN_EAGERLY = False
+
+
+def run_jobs():
+    for job in claim_jobs("worker-1", limit=10):
+        assert run_job(job)
+
+
+def reconcile(*args):
+    out = StringIO()
+    call_command("reconcile_thumbnails", *args, stdout=out)
+    return out.getvalue()
+
+
+@pytest.fixture
+def user_images():
+    """
+    Two images rendered at 100 and 200 px, whose account type was then
+    changed to 100 and 300 px.
+    """
+    size_100 = ThumbnailSizeFactory(size=100)
+    size_200 = ThumbnailSizeFactory(size=200)
+    account_type = AccountTypeFactory(thumbs=[size_100, size_200])
+    user = CustomUserFactory(account_type=account_type)
+    user_images = [UserImageFactory(author=user), UserImageFactory(author=user)]
+    run_jobs()
+
+    account_type.thumbs.remove(size_200)
+    account_type.thumbs.add(ThumbnailSizeFactory(size=300))
+    return user_images
+
+
+def sizes(user_image):
+    return sorted(user_image.thumbnails.values_list("size", flat=True))
+
+
+class TestReconcileThumbnails:
+    def test_dry_run_only_counts(self, user_images):
+        out = reconcile("--dry-run")
+
+        assert "Thumbnails to delete: 2" in out
+        assert "Images to render: 2" in out
+        assert "Thumbnails to render: 2" in out
+        assert Thumbnail.objects.count() == 4
+        assert not Job.objects.exists()
+
+    def test_stale_thumbnails_are_deleted_and_missing_rendered(
+        self, user_images
+    ):
+        stale = list(Thumbnail.objects.filter(size=200))
+
+        reconcile("--chunk-size", "1")
+        drain_tombstones()
+
+        for thumbnail in stale:
+            assert not thumbnail.image.storage.exists(thumbnail.image.name)
+        assert [sizes(user_image) for user_image in user_images] == [[100]] * 2
+        assert Job.objects.count() == 2
+        assert not Checkpoint.objects.exists()
+
+        run_jobs()
+        assert [sizes(user_image) for user_image in user_images] == [
+            [100, 300]
+        ] * 2
+
+    def test_resumes_after_checkpoint(self, user_images):
+        Checkpoint.objects.create(
+            name="reconcile_thumbnails:missing", position=user_images[0].pk
+        )
+
+        reconcile()
+
+        assert [job.payload for job in Job.objects.all()] == [
+            {"user_image_id": user_images[1].pk}
+        ]
+
+    def test_restart_ignores_checkpoint(self, user_images):
+        Checkpoint.objects.create(
+            name="reconcile_thumbnails:missing", position=user_images[1].pk
+        )
+
+        reconcile("--restart")
+
+        assert Job.objects.count() == 2
+
+    def test_nothing_to_do(self, user_images):
+        reconcile()
+        run_jobs()
+
+        out = reconcile()
+
+        assert "Deleted 0 stale thumbnails, queued renders of 0 images." in out
+        assert not Job.objects.exists()
@@ -302,6 +302,18 @@ class TestAddImageSerializer:
         serializer = AddImageSerializer(data=data)
         assert serializer.is_valid()
 
+    def test_valid_image_is_opened_in_place(self):
+        image_file = UserImageFactory.create_image("example.png", 200,
+        "image/png", format="PNG")
+        data = {"name": "example.png", "image": image_file}
+        serializer = AddImageSerializer(data=data)
+
+        assert serializer.is_valid()
+        image = serializer.validated_data["image"]
+        assert image is image_file
+        assert image.image.format == "PNG"
+        assert image.tell() == 0
+
     def test_missing_image(self, user):
         token, token_instance = AuthToken.objects.create(user)
 
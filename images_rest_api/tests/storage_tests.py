@@ -0,0 +1,198 @@
+import threading
+
+import boto3
+import pytest
+from botocore.awsrequest import AWSResponse
+from botocore.stub import Stubber
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.storage.memory import InMemoryStorage
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from ..models import StorageTombstone
+from ..s3 import get_pool_metrics, get_s3_client
+from ..storage import PooledS3Storage, delete_objects, save_files
+from ..tombstones import drain_tombstones
+
+
+class BrokenUploadStorage(InMemoryStorage):
+    def _save(self, name, content):
+        if name.startswith("broken"):
+            raise OSError("Upload failed.")
+        return super()._save(name, content)
+
+
+class TestSaveFiles:
+    def test_save_files_keeps_order(self):
+        storage = InMemoryStorage()
+        files = [(f"dir/file_{i}.txt", f"content {i}".encode()) for i in range(5)]
+
+        names = save_files(storage, files)
+
+        assert names == [name for name, _ in files]
+        for name, content in files:
+            with storage.open(name) as stored:
+                assert stored.read() == content
+
+    def test_save_files_removes_uploads_on_error(self):
+        storage = BrokenUploadStorage()
+        files = [("a.txt", b"a"), ("broken.txt", b"b"), ("c.txt", b"c")]
+
+        with pytest.raises(OSError):
+            save_files(storage, files)
+
+        assert not storage.exists("a.txt")
+        assert not storage.exists("c.txt")
+
+
+class TestDeleteObjects:
+    @pytest.fixture
+    def storage(self):
+        return S3Boto3Storage(
+            bucket_name="images",
+            access_key="minio",
+            secret_key="minio-secret",
+            region_name="us-east-1",
+            endpoint_url="http://localhost:9000",
+        )
+
+    def test_deletes_in_batches_of_1000(self, storage):
+        names = [f"user_images/{i}.png" for i in range(1500)]
+
+        with Stubber(storage.connection.meta.client) as s3:
+            for batch in (names[:1000], names[1000:]):
+                s3.add_response(
+                    "delete_objects",
+                    {},
+                    {
+                        "Bucket": "images",
+                        "Delete": {
+                            "Objects": [{"Key": name} for name in batch],
+                            "Quiet": True,
+                        },
+                    },
+                )
+            failed = delete_objects(storage, names)
+            s3.assert_no_pending_responses()
+
+        assert failed == set()
+
+    def test_reports_failed_keys(self, storage):
+        with Stubber(storage.connection.meta.client) as s3:
+            s3.add_response(
+                "delete_objects",
+                {
+                    "Errors": [
+                        {"Key": "b.png", "Code": "InternalError", "Message": ""}
+                    ]
+                },
+            )
+            failed = delete_objects(storage, ["a.png", "b.png"])
+
+        assert failed == {"b.png"}
+
+
+class EmptyBody:
+    def stream(self, **kwargs):
+        yield b""
+
+
+class TestSharedS3Client:
+    @pytest.fixture(autouse=True)
+    def s3_settings(self, settings):
+        settings.AWS_ACCESS_KEY_ID = "minio"
+        settings.AWS_SECRET_ACCESS_KEY = "minio-secret"
+        settings.AWS_S3_REGION_NAME = "us-east-1"
+        settings.AWS_S3_ENDPOINT_URL = "http://localhost:9000"
+        settings.AWS_STORAGE_BUCKET_NAME = "images"
+
+    def test_client_is_created_once(self, mocker):
+        create_client = mocker.spy(boto3, "client")
+        clients = []
+        threads = [
+            threading.Thread(target=lambda: clients.append(get_s3_client()))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert create_client.call_count == 1
+        assert all(client is clients[0] for client in clients)
+        config = clients[0].meta.config
+        assert config.max_pool_connections == 50
+        assert config.tcp_keepalive
+        assert config.retries == {"mode": "standard", "total_max_attempts": 3}
+
+    def test_changed_settings_build_new_client(self, settings):
+        client = get_s3_client()
+
+        settings.AWS_S3_MAX_POOL_CONNECTIONS = 5
+
+        assert get_s3_client() is not client
+        assert get_s3_client().meta.config.max_pool_connections == 5
+
+    def test_storage_uses_shared_client(self):
+        storage = PooledS3Storage()
+
+        assert storage.connection.meta.client is get_s3_client()
+        assert storage.bucket.meta.client is get_s3_client()
+
+    def test_each_thread_gets_own_resource(self):
+        storage = PooledS3Storage()
+        resources = [storage.connection]
+        thread = threading.Thread(
+            target=lambda: resources.append(storage.connection)
+        )
+        thread.start()
+        thread.join()
+
+        assert storage.connection is resources[0]
+        assert resources[1] is not resources[0]
+        assert resources[1].meta.client is resources[0].meta.client
+        assert resources[0].meta.client is get_s3_client()
+        assert resources[1].Bucket("images").name == "images"
+
+    def test_pool_metrics_count_requests(self):
+        client = get_s3_client()
+        client.meta.events.register(
+            "before-send.s3.HeadObject",
+            lambda request, **kwargs: AWSResponse(
+                request.url, 200, {}, EmptyBody()
+            ),
+        )
+        before = get_pool_metrics()
+
+        client.head_object(Bucket="images", Key="a.png")
+        client.head_object(Bucket="images", Key="b.png")
+
+        after = get_pool_metrics()
+        assert after["requests"] - before["requests"] == 2
+        assert after["in_flight"] == 0
+        assert after["peak_in_flight"] >= 1
+        assert after["max_pool_connections"] == 50
+
+
+@pytest.mark.django_db
+class TestDrainTombstones:
+    def test_drain_deletes_buried_files(self):
+        names = [default_storage.save(f"buried/{i}.txt", ContentFile(b"x"))
+                 for i in range(3)]
+        StorageTombstone.objects.bury(names)
+
+        assert drain_tombstones(limit=2) == 2
+        assert drain_tombstones(limit=2) == 1
+        assert drain_tombstones(limit=2) == 0
+        assert not any(default_storage.exists(name) for name in names)
+
+    def test_failed_deletion_is_retried(self, mocker):
+        StorageTombstone.objects.bury(["a.txt", "b.txt"])
+        mocker.patch(
+            "images_rest_api.tombstones.delete_objects", return_value={"b.txt"}
+        )
+
+        assert drain_tombstones() == 1
+        assert list(
+            StorageTombstone.objects.values_list("name", flat=True)
+        ) == ["b.txt"]
@@ -0,0 +1,75 @@
+import io
+
+import pytest
+from PIL import Image
+
+from ..strips import iter_strips, png_header, reduce_in_strips
+from .thumbnail_tests import create_photo
+
+
+def create_png(mode, width, height):
+    image = Image.open(create_photo(width, height, "PNG"))
+    if mode == "P":
+        image = image.quantize(64)
+    elif mode in ("RGBA", "LA"):
+        alpha = Image.linear_gradient("L").rotate(90).resize((width, height))
+        image = image.convert(mode[:-1])
+        image.putalpha(alpha.point(lambda value: 0 if value < 64 else value))
+    else:
+        image = image.convert(mode)
+
+    image_io = io.BytesIO()
+    image.save(image_io, format="PNG")
+    image_io.seek(0)
+    return image_io
+
+
+class TestPngHeader:
+    def test_8_bit_png(self):
+        assert png_header(create_png("RGBA", 30, 20)) == (30, 20, 4)
+
+    @pytest.mark.parametrize(
+        "source",
+        [
+            create_photo(30, 20, "JPEG"),
+            create_png("I", 30, 20),
+            create_png("1", 30, 20),
+        ],
+    )
+    def test_other_images_are_not_decoded_in_strips(self, source):
+        assert png_header(source) is None
+        assert source.tell() == 0
+
+
+class TestReduceInStrips:
+    @pytest.mark.parametrize("mode", ["L", "RGB", "RGBA", "LA"])
+    def test_same_as_reducing_decoded_image(self, mode):
+        source = create_png(mode, 301, 257)
+
+        reduced = reduce_in_strips(source, 3, strip_pixels=301 * 20)
+
+        assert reduced.tobytes() == Image.open(source).reduce(3).tobytes()
+
+    def test_palette_image_is_reduced_in_rgb(self):
+        source = create_png("P", 301, 257)
+
+        reduced = reduce_in_strips(source, 4, strip_pixels=301 * 20)
+
+        expected = Image.open(source).convert("RGB").reduce(4)
+        assert reduced.mode == "RGB"
+        assert reduced.tobytes() == expected.tobytes()
+
+    def test_strips_cover_the_image(self):
+        source = create_png("RGB", 100, 95)
+
+        strips = list(iter_strips(source, 30))
+
+        assert [(top, strip.height) for top, strip in strips] == [
+            (0, 30), (30, 30), (60, 30), (90, 5)
+        ]
+
+    def test_truncated_image(self):
+        data = create_png("RGB", 100, 100).getvalue()
+
+        with pytest.raises(ValueError):
+            reduce_in_strips(io.BytesIO(data[:len(data) // 2]), 2, 1000)
@@ -0,0 +1,229 @@
+import io
+import math
+import multiprocessing
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from PIL import Image, ImageChops, ImageDraw, ImageStat
+
+from .. import thumbnails
+from ..models import Blob, Thumbnail
+from ..thumbnails import (
+    create_thumbnails,
+    decoded_pixels,
+    get_render_pool,
+    render_thumbnails,
+    resize_cascade,
+    save_thumbnails,
+    shutdown_render_pool,
+    submit_render,
+    thumbnail_size,
+)
+from .factories import (
+    AccountTypeFactory,
+    CustomUserFactory,
+    ThumbnailSizeFactory,
+    UserImageFactory,
+)
+
+HEIGHTS = [100, 200, 400]
+
+
+def create_photo(width, height, format):
+    """
+    Synthetic "photo" with smooth gradients, noise and hard edges.
+    """
+    red = Image.linear_gradient("L").resize((width, height))
+    green = Image.effect_noise((width, height), 40)
+    blue = Image.radial_gradient("L").resize((width, height))
+    image = Image.merge("RGB", (red, green, blue))
+    draw = ImageDraw.Draw(image)
+    for x in range(0, width, 97):
+        draw.line((x, 0, width - x, height), fill=(255, 255, 0), width=5)
+
+    image_io = io.BytesIO()
+    image.save(image_io, format=format)
+    image_io.seek(0)
+    return image_io
+
+
+def psnr(first, second):
+    stat = ImageStat.Stat(ImageChops.difference(first, second))
+    mse = sum(stat.sum2) / (len(stat.sum2) * first.width * first.height)
+    if not mse:
+        return math.inf
+    return 10 * math.log10(255**2 / mse)
+
+
+class TestResizeCascade:
+    @pytest.mark.parametrize("format", ["JPEG", "PNG"])
+    def test_renditions_match_direct_lanczos_resize(self, format):
+        source = create_photo(2400, 1600, format)
+        renditions = dict(resize_cascade(Image.open(source), HEIGHTS))
+
+        source.seek(0)
+        original = Image.open(source)
+        for height in HEIGHTS:
+            reference = original.resize(
+                thumbnail_size(original.size, height), Image.LANCZOS
+            )
+            assert renditions[height].size == reference.size
+            assert psnr(renditions[height], reference) > 35
+
+    def test_largest_size_is_rendered_first(self):
+        source = create_photo(800, 600, "PNG")
+
+        heights = [height for height, _ in
+                   resize_cascade(Image.open(source), [200, 400, 100])]
+
+        assert heights == [400, 200, 100]
+
+    def test_jpeg_is_decoded_at_reduced_scale(self):
+        image = Image.open(create_photo(3200, 1600, "JPEG"))
+
+        list(resize_cascade(image, [200]))
+
+        assert image.size == (800, 400)
+
+    def test_upscaled_size_is_not_used_as_base(self):
+        source = create_photo(300, 100, "PNG")
+        renditions = dict(resize_cascade(Image.open(source), [400, 50]))
+
+        source.seek(0)
+        reference = Image.open(source).resize((150, 50), Image.LANCZOS)
+        assert renditions[400].size == (1200, 400)
+        assert psnr(renditions[50], reference) == math.inf
+
+
+class TestRenderThumbnails:
+    def test_render_thumbnails_keeps_format(self):
+        extension, renditions = render_thumbnails(
+            create_photo(600, 400, "PNG"), [200, 200, 100]
+        )
+
+        assert extension == "png"
+        assert sorted(renditions) == [100, 200]
+        for height, content in renditions.items():
+            thumbnail = Image.open(io.BytesIO(content))
+            assert thumbnail.format == "PNG"
+            assert thumbnail.height == height
+
+    def test_giant_png_is_rendered_in_strips(self, settings, mocker):
+        settings.THUMBNAIL_STRIP_MIN_PIXELS = 0
+        settings.THUMBNAIL_STRIP_PIXELS = 100_000
+        source = create_photo(2400, 1600, "PNG")
+        reduce_in_strips = mocker.spy(thumbnails, "reduce_in_strips")
+
+        extension, renditions = render_thumbnails(source, HEIGHTS)
+
+        reduce_in_strips.assert_called_once_with(source, 2, 100_000)
+        source.seek(0)
+        original = Image.open(source)
+        for height in HEIGHTS:
+            thumbnail = Image.open(io.BytesIO(renditions[height]))
+            reference = original.resize(
+                thumbnail_size(original.size, height), Image.LANCZOS
+            )
+            assert thumbnail.size == reference.size
+            assert psnr(thumbnail, reference) > 35
+
+    def test_decoded_pixels_in_strips(self, settings):
+        source = create_photo(2400, 1600, "PNG")
+        assert decoded_pixels(source, HEIGHTS) == 2400 * 1600
+
+        settings.THUMBNAIL_STRIP_MIN_PIXELS = 0
+        settings.THUMBNAIL_STRIP_PIXELS = 100_000
+        # Reduced by 2, strips of 40 scanlines.
+        assert decoded_pixels(source, HEIGHTS) == 1200 * 800 + 2400 * 40
+
+
+class TestRenderPool:
+    @pytest.fixture
+    def render_pool(self, settings):
+        settings.THUMBNAIL_RENDER_WORKERS = 2
+        settings.THUMBNAIL_RENDER_QUEUE_SIZE = 2
+        yield
+        shutdown_render_pool()
+
+    def test_submit_render_inline_without_workers(self, settings, mocker):
+        settings.THUMBNAIL_RENDER_WORKERS = 0
+        pool = mocker.patch("images_rest_api.thumbnails.get_render_pool")
+
+        future = submit_render(create_photo(300, 200, "JPEG"), [100])
+
+        assert future.result()[0] == "jpeg"
+        pool.assert_not_called()
+
+    def test_submit_render_in_pool(self, render_pool):
+        source = create_photo(600, 400, "PNG")
+
+        futures = [submit_render(source, [100, 200]) for _ in range(4)]
+
+        for future in futures:
+            extension, renditions = future.result()
+            assert extension == "png"
+            assert sorted(renditions) == [100, 200]
+
+    def test_workers_are_forked_before_first_render(self, render_pool):
+        children = set(multiprocessing.active_children())
+
+        get_render_pool()
+
+        assert len(set(multiprocessing.active_children()) - children) == 2
+
+    def test_pool_is_shared_and_slots_are_released(self, render_pool):
+        source = create_photo(300, 200, "JPEG")
+
+        submit_render(source, [100]).result()
+        submit_render(source, [100]).result()
+
+        pool, slots = get_render_pool()
+        assert get_render_pool()[0] is pool
+        assert slots.acquire(timeout=5)
+        assert slots.acquire(timeout=5)
+        assert not slots.acquire(blocking=False)
+        slots.release()
+        slots.release()
+
+
+@pytest.mark.django_db
+class TestCreateThumbnails:
+    def test_thumbnails_are_inserted_with_one_query(self, settings):
+        settings.JOBS_RUN_EAGERLY = False
+        account_type = AccountTypeFactory(
+            thumbs=[ThumbnailSizeFactory(size=size) for size in HEIGHTS]
+        )
+        user = CustomUserFactory(account_type=account_type)
+        user_image = UserImageFactory(author=user)
+
+        with CaptureQueriesContext(connection) as queries:
+            create_thumbnails(user_image)
+
+        inserts = [
+            query for query in queries.captured_queries
+            if query["sql"].startswith('INSERT INTO "images_rest_api_thumbnail"')
+        ]
+        assert len(inserts) == 1
+        assert sorted(
+            Thumbnail.objects.filter(system_name=user_image)
+            .values_list("size", flat=True)
+        ) == HEIGHTS
+        for thumbnail in user_image.thumbnails.all():
+            assert thumbnail.image.name.startswith("user_images/thumbnails/")
+            assert Image.open(thumbnail.image).height == thumbnail.size
+
+    def test_sizes_stored_concurrently_are_not_saved_twice(self):
+        account_type = AccountTypeFactory(
+            thumbs=[ThumbnailSizeFactory(size=100)]
+        )
+        user = CustomUserFactory(account_type=account_type)
+        user_image = UserImageFactory(author=user)
+        (stored,) = user_image.thumbnails.all()
+        blobs = Blob.objects.acquire([stored.blob.digest])
+
+        assert save_thumbnails(user_image, {100: blobs[stored.blob.digest]}) == []
+
+        assert list(user_image.thumbnails.all()) == [stored]
+        stored.blob.refresh_from_db()
+        assert stored.blob.refcount == 1
@@ -0,0 +1,76 @@
+import hashlib
+
+import pytest
+from rest_framework.exceptions import ValidationError
+
+from ..uploads import ImageUploadHandler, UploadTooLarge, sniff_image_format
+from .factories import UserImageFactory
+
+
+def receive(handler, name, content, chunk_size=1000):
+    handler.new_file("image", name, "image/jpeg", len(content))
+    for start in range(0, len(content), chunk_size):
+        handler.receive_data_chunk(content[start:start + chunk_size], start)
+    return handler.file_complete(len(content))
+
+
+def image_bytes(name, format="JPEG"):
+    return UserImageFactory.create_image(name, 100, format=format).read()
+
+
+class TestSniffImageFormat:
+    @pytest.mark.parametrize(
+        "format, expected",
+        [("JPEG", "jpeg"), ("PNG", "png"), ("GIF", "gif"), ("WEBP", "webp")],
+    )
+    def test_sniff_image_format(self, format, expected):
+        assert sniff_image_format(image_bytes("a", format)[:12]) == expected
+
+    def test_sniff_not_an_image(self):
+        assert sniff_image_format(b"Test file content") is None
+
+
+class TestImageUploadHandler:
+    def test_file_is_hashed_and_measured_while_received(self):
+        content = image_bytes("photo.jpg")
+
+        uploaded = receive(ImageUploadHandler(), "photo.jpg", content, 7)
+
+        assert uploaded.sha256 == hashlib.sha256(content).hexdigest()
+        assert uploaded.size == len(content)
+        assert uploaded.sniffed_format == "jpeg"
+        assert uploaded.read() == content
+
+    def test_other_format_is_rejected_on_first_chunk(self):
+        handler = ImageUploadHandler()
+        handler.new_file("image", "photo.gif", "image/gif", None)
+
+        with pytest.raises(ValidationError) as e:
+            handler.receive_data_chunk(image_bytes("photo.gif", "GIF")[:100], 0)
+
+        assert "gif - Invalid file extension" in str(e.value.detail["image"])
+        assert handler.file.closed
+
+    def test_not_an_image_is_rejected(self):
+        with pytest.raises(ValidationError) as e:
+            receive(ImageUploadHandler(), "photo.jpg", b"Test file content")
+
+        assert "Upload a valid image" in str(e.value.detail["image"])
+
+    def test_oversized_file_is_rejected_while_received(self, settings):
+        settings.IMAGE_UPLOAD_MAX_SIZE = 1500
+        handler = ImageUploadHandler()
+        content = b"\xff\xd8\xff" + bytes(3000)
+        handler.new_file("image", "photo.jpg", "image/jpeg", None)
+        handler.receive_data_chunk(content[:1000], 0)
+
+        with pytest.raises(UploadTooLarge):
+            handler.receive_data_chunk(content[1000:2000], 1000)
+
+    def test_oversized_body_is_rejected_before_reading(self, settings):
+        settings.IMAGE_UPLOAD_MAX_SIZE = 1500
+
+        with pytest.raises(UploadTooLarge):
+            ImageUploadHandler().handle_raw_input(
+                None, {}, 10 * 2**20, b"boundary"
+            )
@@ -1,18 +1,35 @@
+import base64
+import hashlib
+import io
+import json
+import threading
+import zipfile
 from unittest.mock import MagicMock
 
 import pytest
+from botocore.response import StreamingBody
+from botocore.stub import ANY, Stubber
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ObjectDoesNotExist
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
 from knox.auth import AuthToken
+from PIL import Image
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from ..models import UserImage
+from ..models import StorageTombstone, Thumbnail, UploadSession, UserImage
+from ..links import StorageURLs
+from ..s3 import get_s3_client
 from ..serializers import UserSerializer
-from .factories import AccountTypeFactory, CustomUserFactory, UserImageFactory
+from .factories import (
+    AccountTypeFactory,
+    CustomUserFactory,
+    ThumbnailSizeFactory,
+    UserImageFactory,
+)
 
 db = get_user_model()
 
@@ -349,6 +366,20 @@ class TestUserImagesViewSet:
 
         assert response.status_code == status.HTTP_200_OK
 
+    def test_get_user_image_renders_missing_thumbnails(self, user):
+        user, token = user
+        user_image = UserImage.objects.get(author=user)
+        user.account_type.thumbs.add(ThumbnailSizeFactory(size=300))
+        url = reverse("userimage-detail", args=[user_image.id])
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION="Token " + token)
+        response = client.get(url, format="json")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert 300 in [
+            thumbnail["size"] for thumbnail in response.data["thumbnails"]
+        ]
+
     def test_create_user_image(self, user, image):
         user, token = user
         url = reverse("userimage-list")
@@ -362,6 +393,42 @@ class TestUserImagesViewSet:
         response = client.post(url, data, format="multipart")
         assert response.status_code == status.HTTP_201_CREATED
 
+    def test_create_user_image_does_not_download_original(
+        self, user, image, mocker
+    ):
+        user, token = user
+        storage = UserImage._meta.get_field("image").storage
+        storage_open = mocker.patch.object(
+            storage, "_open", side_effect=AssertionError("Original downloaded.")
+        )
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION="Token " + token)
+        response = client.post(
+            reverse("userimage-list"),
+            {"name": "test_picture", "image": image},
+            format="multipart",
+        )
+
+        assert response.status_code == status.HTTP_201_CREATED
+        storage_open.assert_not_called()
+        assert UserImage.objects.get(pk=response.data["id"]).thumbnails.exists()
+
+    def test_send_too_large_image(self, user, image, settings):
+        settings.IMAGE_UPLOAD_MAX_SIZE = 100
+        user, token = user
+        url = reverse("userimage-list")
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION="Token " + token)
+        images_count = UserImage.objects.count()
+
+        response = client.post(
+            url, {"name": "test_picture", "image": image}, format="multipart"
+        )
+
+        assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        assert UserImage.objects.count() == images_count
+
     def test_delete_user_image(self, user):
         user, token = user
         image_id = user.client_photos.first().id
@@ -372,6 +439,28 @@ class TestUserImagesViewSet:
         assert response.status_code == status.HTTP_204_NO_CONTENT
         assert not user.client_photos.exists()
 
+    def test_delete_user_image_defers_file_deletion(self, user, mocker):
+        user, token = user
+        user_image = user.client_photos.first()
+        names = [user_image.image.name] + [
+            thumbnail.image.name for thumbnail in user_image.thumbnails.all()
+        ]
+        storage = user_image.image.storage
+        delete = mocker.spy(storage, "delete")
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION="Token " + token)
+
+        response = client.delete(
+            reverse("userimage-detail", args=[user_image.id])
+        )
+
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        delete.assert_not_called()
+        assert not Thumbnail.objects.filter(system_name=user_image.id).exists()
+        assert sorted(
+            StorageTombstone.objects.values_list("name", flat=True)
+        ) == sorted(names)
+
     def test_delete_non_existent_user_image(self, user):
         user, token = user
         image_id = UserImage.objects.count() + 1000
@@ -472,6 +561,703 @@ class TestUserImagesViewSet:
 
 
 @pytest.mark.django_db
+class TestUploadHandshake:
+    def handshake(self, client, file):
+        file.seek(0)
+        content = file.read()
+        file.seek(0)
+        return client.post(
+            reverse("userimage-handshake"),
+            {
+                "name": "again",
+                "sha256": hashlib.sha256(content).hexdigest(),
+                "size": len(content),
+            },
+            format="json",
+        )
+
+    def test_file_uploaded_before_is_not_sent_again(self, api_user, mocker):
+        user, client = api_user
+        image = UserImageFactory.create_image("test.jpg", 300)
+        user_image = UserImageFactory(author=user, image=image)
+        render = mocker.patch("images_rest_api.thumbnails.submit_render")
+
+        response = self.handshake(client, image)
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data["upload_required"] is False
+        created = UserImage.objects.get(pk=response.data["image"]["id"])
+        assert created.name == "again"
+        assert created.blob == user_image.blob
+        assert created.thumbnails.count() == user_image.thumbnails.count()
+        render.assert_not_called()
+
+    def test_other_users_file_must_be_uploaded(self, api_user):
+        user, client = api_user
+        image = UserImageFactory.create_image("test.jpg", 300)
+        UserImageFactory(image=image)
+
+        response = self.handshake(client, image)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["upload_required"] is True
+        assert UserImage.objects.filter(author=user).count() == 0
+
+    def test_upload_with_ticket(self, api_user):
+        user, client = api_user
+        image = UserImageFactory.create_image("test.jpg", 300)
+        ticket = self.handshake(client, image).data["ticket"]
+
+        response = client.post(
+            reverse("userimage-list"),
+            {"name": "new", "image": image, "ticket": ticket},
+            format="multipart",
+        )
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert "ticket" not in response.data
+
+    def test_upload_not_matching_ticket(self, api_user):
+        user, client = api_user
+        ticket = self.handshake(
+            client, UserImageFactory.create_image("test.jpg", 300)
+        ).data["ticket"]
+
+        response = client.post(
+            reverse("userimage-list"),
+            {
+                "name": "new",
+                "image": UserImageFactory.create_image("other.jpg", 400),
+                "ticket": ticket,
+            },
+            format="multipart",
+        )
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data["ticket"] == [
+            "The uploaded file doesn't match the upload ticket."
+        ]
+
+    def test_upload_with_forged_ticket(self, api_user):
+        user, client = api_user
+
+        response = client.post(
+            reverse("userimage-list"),
+            {
+                "name": "new",
+                "image": UserImageFactory.create_image("test.jpg", 300),
+                "ticket": "forged",
+            },
+            format="multipart",
+        )
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data["ticket"] == ["Invalid or expired upload ticket."]
+
+    def test_invalid_handshake(self, api_user):
+        user, client = api_user
+
+        response = client.post(
+            reverse("userimage-handshake"),
+            {"name": "new", "sha256": "abc", "size": 0},
+            format="json",
+        )
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert set(response.data) == {"sha256", "size"}
+
+
+class TestBatchUpload:
+    def upload(self, client, files):
+        return client.post(
+            reverse("userimage-batch"), {"images": files}, format="multipart"
+        )
+
+    def test_batch_upload(self, api_user):
+        user, client = api_user
+        files = [
+            UserImageFactory.create_image("first.jpg", 300),
+            SimpleUploadedFile("notes.txt", b"not an image"),
+            UserImageFactory.create_image("second.png", 250, format="PNG"),
+        ]
+
+        response = self.upload(client, files)
+
+        assert response.status_code == status.HTTP_201_CREATED
+        first, notes, second = response.data["results"]
+        assert notes["file"] == "notes.txt"
+        assert "image" in notes["errors"]
+        assert [first["name"], second["name"]] == ["first", "second"]
+        assert first["status"] == UserImage.Status.READY
+        for result in (first, second):
+            user_image = UserImage.objects.get(pk=result["id"], author=user)
+            assert user_image.blob is not None
+            assert user_image.thumbnails.count() == (
+                user.account_type.thumbs.count()
+            )
+
+    def test_same_file_twice_is_stored_once(self, api_user):
+        user, client = api_user
+        content = UserImageFactory.create_image("same.jpg", 310).read()
+        files = [
+            SimpleUploadedFile("one.jpg", content, content_type="image/jpeg"),
+            SimpleUploadedFile("two.jpg", content, content_type="image/jpeg"),
+        ]
+
+        response = self.upload(client, files)
+
+        assert response.status_code == status.HTTP_201_CREATED
+        one, two = UserImage.objects.filter(author=user).order_by("id")
+        assert one.blob_id == two.blob_id
+        one.blob.refresh_from_db()
+        assert one.blob.refcount == 2
+
+    def test_file_too_large(self, api_user, settings):
+        user, client = api_user
+        small = UserImageFactory.create_image("small.jpg", 100)
+        settings.IMAGE_UPLOAD_MAX_SIZE = small.size + 1
+        files = [small, UserImageFactory.create_image("large.jpg", 2000)]
+
+        response = self.upload(client, files)
+
+        assert response.status_code == status.HTTP_201_CREATED
+        small, large = response.data["results"]
+        assert "id" in small
+        assert "too large" in str(large["errors"]["image"][0])
+
+    def test_no_valid_file(self, api_user):
+        user, client = api_user
+
+        response = self.upload(
+            client, [SimpleUploadedFile("notes.txt", b"not an image")]
+        )
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert not UserImage.objects.filter(author=user).exists()
+
+    def test_too_many_files(self, api_user, settings):
+        user, client = api_user
+        settings.BATCH_UPLOAD_MAX_FILES = 1
+        files = [
+            UserImageFactory.create_image("first.jpg", 100),
+            UserImageFactory.create_image("second.jpg", 100),
+        ]
+
+        response = self.upload(client, files)
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert not UserImage.objects.filter(author=user).exists()
+
+
+class TestImageListURLs:
+    def test_each_file_url_is_built_once(self, mocker):
+        account_type = AccountTypeFactory(
+            orginal_image_link=True,
+            thumbs=[ThumbnailSizeFactory(size=50), ThumbnailSizeFactory(size=80)],
+        )
+        user = CustomUserFactory(account_type=account_type)
+        # Identical uploads share their files.
+        UserImageFactory(author=user)
+        UserImageFactory(author=user)
+        _, token = AuthToken.objects.create(user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION="Token " + token)
+        build_url = mocker.spy(StorageURLs, "build_url")
+
+        response = client.get(reverse("userimage-list"))
+
+        assert response.status_code == status.HTTP_200_OK
+        assert build_url.call_count == 3
+        first, second = response.data["results"]
+        assert first["image"] == second["image"]
+        assert first["image"].startswith("http://testserver/")
+
+
+class TestBulkDelete:
+    def bulk_delete(self, client, data):
+        return client.post(reverse("userimage-bulk-delete"), data, format="json")
+
+    def test_bulk_delete_by_ids(self, api_user):
+        user, client = api_user
+        first, second = UserImageFactory(author=user), UserImageFactory(author=user)
+        kept = UserImageFactory(author=user)
+        other = UserImageFactory()
+        missing = other.id + 1000
+
+        response = self.bulk_delete(
+            client, {"ids": [first.id, other.id, second.id, missing]}
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == {
+            "results": [
+                {"id": first.id, "status": "deleted"},
+                {"id": other.id, "status": "not_found"},
+                {"id": second.id, "status": "deleted"},
+                {"id": missing, "status": "not_found"},
+            ],
+            "more": False,
+        }
+        assert list(user.client_photos.all()) == [kept]
+        assert UserImage.objects.filter(pk=other.id).exists()
+        assert not Thumbnail.objects.filter(
+            system_name__in=[first.id, second.id]
+        ).exists()
+
+    def test_bulk_delete_by_filter(self, api_user, settings):
+        settings.BULK_DELETE_MAX_IMAGES = 2
+        user, client = api_user
+        failed = [UserImageFactory(author=user) for _ in range(3)]
+        UserImage.objects.filter(pk__in=[i.id for i in failed]).update(
+            status=UserImage.Status.FAILED
+        )
+        ready = UserImageFactory(author=user)
+
+        response = self.bulk_delete(client, {"filter": {"status": "failed"}})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["more"] is True
+        assert [result["id"] for result in response.data["results"]] == [
+            failed[0].id, failed[1].id
+        ]
+
+        response = self.bulk_delete(client, {"filter": {"status": "failed"}})
+
+        assert response.data == {
+            "results": [{"id": failed[2].id, "status": "deleted"}],
+            "more": False,
+        }
+        assert list(user.client_photos.all()) == [ready]
+
+    @pytest.mark.parametrize(
+        "data",
+        [{}, {"ids": []}, {"filter": {}}, {"ids": [1], "filter": {"name": "a"}}],
+    )
+    def test_invalid_request(self, api_user, data):
+        user, client = api_user
+        UserImageFactory(author=user)
+
+        response = self.bulk_delete(client, data)
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert user.client_photos.exists()
+
+    def test_too_many_ids(self, api_user, settings):
+        settings.BULK_DELETE_MAX_IMAGES = 2
+        user, client = api_user
+
+        response = self.bulk_delete(client, {"ids": [1, 2, 3]})
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "ids" in response.data
+
+
+class TestExport:
+    @pytest.fixture
+    def api_account_type(self):
+        return AccountTypeFactory(
+            orginal_image_link=True, thumbs=[ThumbnailSizeFactory(size=100)]
+        )
+
+    def export(self, client, **params):
+        response = client.get(reverse("userimage-export"), params)
+        assert response.status_code == status.HTTP_200_OK
+        assert response["Content-Type"] == "application/zip"
+        return zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content)))
+
+    def test_export_library(self, api_user):
+        user, client = api_user
+        first = UserImageFactory(author=user, name="first")
+        second = UserImageFactory(author=user, name="second")
+        UserImageFactory(name="someone else's")
+
+        archive = self.export(client)
+
+        assert archive.namelist() == [
+            f"{first.id}-first.jpeg",
+            f"{second.id}-second.jpeg",
+            f"thumbnails/{first.id}-first-100.jpeg",
+            f"thumbnails/{second.id}-second-100.jpeg",
+        ]
+        assert all(
+            info.compress_type == zipfile.ZIP_STORED
+            for info in archive.infolist()
+        )
+        with first.image.open() as original:
+            assert archive.read(f"{first.id}-first.jpeg") == original.read()
+        assert archive.testzip() is None
+
+    def test_export_thumbnails(self, api_user):
+        user, client = api_user
+        user_image = UserImageFactory(author=user, name="only")
+
+        archive = self.export(client, include="thumbnails")
+
+        assert archive.namelist() == [
+            f"thumbnails/{user_image.id}-only-100.jpeg"
+        ]
+
+    def test_downloads_skip_upload_pool(self, api_user, mocker):
+        user, client = api_user
+        UserImageFactory(author=user)
+        read_file = mocker.patch(
+            "images_rest_api.exports.read_file",
+            side_effect=lambda name: threading.current_thread().name,
+        )
+        upload_pool = mocker.patch("images_rest_api.storage.get_upload_pool")
+
+        archive = self.export(client)
+
+        assert read_file.call_count == 2
+        assert all(
+            archive.read(name).startswith(b"export-download")
+            for name in archive.namelist()
+        )
+        upload_pool.assert_not_called()
+
+    def test_originals_need_access(self, api_user):
+        user, client = api_user
+        user.account_type.orginal_image_link = False
+        user.account_type.save()
+        UserImageFactory(author=user)
+
+        response = client.get(reverse("userimage-export"), {"include": "all"})
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+        archive = self.export(client)
+        assert all(
+            name.startswith("thumbnails/") for name in archive.namelist()
+        )
+
+
+class TestDirectUpload:
+    @pytest.fixture(autouse=True)
+    def local_s3(self, settings):
+        settings.AWS_ACCESS_KEY_ID = "minio"
+        settings.AWS_SECRET_ACCESS_KEY = "minio-secret"
+        settings.AWS_STORAGE_BUCKET_NAME = "images"
+        settings.AWS_S3_REGION_NAME = "us-east-1"
+        settings.AWS_S3_ENDPOINT_URL = "http://localhost:9000"
+
+    @pytest.fixture
+    def s3(self, mocker):
+        client = get_s3_client()
+        mocker.patch(
+            "images_rest_api.viewsets.get_s3_client", return_value=client
+        )
+        with Stubber(client) as stubber:
+            yield stubber
+
+    def reserve(self, client):
+        return client.post(
+            reverse("userimage-direct-upload"),
+            {"name": "direct", "content_type": "image/png"},
+            format="json",
+        )
+
+    def stub_object(self, s3, key, content, content_type):
+        s3.add_response(
+            "head_object",
+            {"ContentLength": len(content), "ContentType": content_type},
+            {"Bucket": "images", "Key": key},
+        )
+        s3.add_response(
+            "get_object",
+            {"Body": StreamingBody(io.BytesIO(content), len(content))},
+            {"Bucket": "images", "Key": key, "Range": "bytes=0-262143"},
+        )
+
+    def test_reserve_presigned_post(self, api_user):
+        user, client = api_user
+
+        response = self.reserve(client)
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data["status"] == UserImage.Status.UPLOADING
+        upload = response.data["upload"]
+        assert upload["url"].startswith("http://localhost:9000/")
+        user_image = UserImage.objects.get(pk=response.data["id"])
+        assert upload["fields"]["key"] == user_image.image.name
+        assert user_image.image.name.endswith(".png")
+        policy = json.loads(base64.b64decode(upload["fields"]["policy"]))
+        assert {"Content-Type": "image/png"} in policy["conditions"]
+        assert [
+            "content-length-range", 1, settings.IMAGE_UPLOAD_MAX_SIZE
+        ] in policy["conditions"]
+        assert not user_image.thumbnails.exists()
+
+    def test_complete_upload(self, api_user, s3):
+        user, client = api_user
+        user_image = UserImage.objects.get(pk=self.reserve(client).data["id"])
+        content = UserImageFactory.create_image(
+            "direct.png", 300, format="PNG"
+        ).read()
+        default_storage.save(user_image.image.name, io.BytesIO(content))
+        self.stub_object(s3, user_image.image.name, content, "image/png")
+
+        response = client.post(
+            reverse("userimage-complete", args=[user_image.id])
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["status"] == UserImage.Status.READY
+        assert user_image.thumbnails.count() == user.account_type.thumbs.count()
+
+        response = client.post(
+            reverse("userimage-complete", args=[user_image.id])
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_complete_before_upload(self, api_user, s3):
+        user, client = api_user
+        user_image_id = self.reserve(client).data["id"]
+        s3.add_client_error("head_object", "404", http_status_code=404)
+
+        response = client.post(
+            reverse("userimage-complete", args=[user_image_id])
+        )
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data == {"detail": "The file has not been uploaded yet."}
+        assert UserImage.objects.get(pk=user_image_id).status == (
+            UserImage.Status.UPLOADING
+        )
+
+    def test_complete_not_an_image(self, api_user, s3):
+        user, client = api_user
+        user_image = UserImage.objects.get(pk=self.reserve(client).data["id"])
+        self.stub_object(s3, user_image.image.name, b"not an image", "image/png")
+
+        response = client.post(
+            reverse("userimage-complete", args=[user_image.id])
+        )
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "image" in response.data
+        assert not UserImage.objects.filter(pk=user_image.id).exists()
+
+
+class TestResumableUpload:
+    PART_SIZE = 64 * 2**10
+
+    @pytest.fixture(autouse=True)
+    def local_s3(self, settings):
+        settings.AWS_ACCESS_KEY_ID = "minio"
+        settings.AWS_SECRET_ACCESS_KEY = "minio-secret"
+        settings.AWS_STORAGE_BUCKET_NAME = "images"
+        settings.AWS_S3_REGION_NAME = "us-east-1"
+        settings.AWS_S3_ENDPOINT_URL = "http://localhost:9000"
+        settings.RESUMABLE_UPLOAD_PART_SIZE = self.PART_SIZE
+
+    @pytest.fixture
+    def s3(self, mocker):
+        client = get_s3_client()
+        mocker.patch(
+            "images_rest_api.viewsets.get_s3_client", return_value=client
+        )
+        with Stubber(client) as stubber:
+            yield stubber
+
+    @pytest.fixture
+    def content(self):
+        # Noise doesn't compress, the PNG spans several parts.
+        image = Image.effect_noise((256, 256), 64).convert("RGB")
+        image_io = io.BytesIO()
+        image.save(image_io, format="PNG")
+        return image_io.getvalue()
+
+    def create(self, client, s3, length):
+        s3.add_response(
+            "create_multipart_upload",
+            {"UploadId": "upload-1"},
+            {"Bucket": "images", "Key": ANY, "ContentType": "image/png"},
+        )
+        return client.post(
+            reverse("userimage-resumable"),
+            {"name": "resumable", "content_type": "image/png", "length": length},
+            format="json",
+        )
+
+    def send(self, client, url, offset, chunk):
+        return client.generic(
+            "PATCH",
+            url,
+            chunk,
+            content_type="application/offset+octet-stream",
+            HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def stub_parts(self, s3, count):
+        for _ in range(count):
+            s3.add_response(
+                "upload_part",
+                {"ETag": '"etag"'},
+                {
+                    "Bucket": "images",
+                    "Key": ANY,
+                    "UploadId": "upload-1",
+                    "PartNumber": ANY,
+                    "Body": ANY,
+                },
+            )
+
+    def test_create_upload(self, api_user, s3, content):
+        user, client = api_user
+
+        response = self.create(client, s3, len(content))
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data["status"] == UserImage.Status.UPLOADING
+        assert response["Location"] == response.data["upload"]["url"]
+        assert response.data["upload"]["offset"] == 0
+        assert response.data["upload"]["part_size"] == self.PART_SIZE
+        session = UploadSession.objects.get(user_image_id=response.data["id"])
+        assert session.length == len(content)
+        assert session.multipart_upload_id == "upload-1"
+
+    def test_upload_in_chunks(self, api_user, s3, content):
+        user, client = api_user
+        parts = -(-len(content) // self.PART_SIZE)
+        assert parts > 2
+        url = self.create(client, s3, len(content)).data["upload"]["url"]
+        session = UploadSession.objects.get()
+
+        self.stub_parts(s3, 2)
+        response = self.send(client, url, 0, content[: 2 * self.PART_SIZE])
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert response["Upload-Offset"] == str(2 * self.PART_SIZE)
+
+        response = client.head(url)
+        assert response["Upload-Offset"] == str(2 * self.PART_SIZE)
+        assert response["Upload-Length"] == str(len(content))
+
+        self.stub_parts(s3, parts - 2)
+        s3.add_response(
+            "complete_multipart_upload",
+            {},
+            {
+                "Bucket": "images",
+                "Key": session.user_image.image.name,
+                "UploadId": "upload-1",
+                "MultipartUpload": {
+                    "Parts": [
+                        {"ETag": '"etag"', "PartNumber": number}
+                        for number in range(1, parts + 1)
+                    ]
+                },
+            },
+        )
+        # Assembled by S3 from the parts.
+        default_storage.save(session.user_image.image.name, io.BytesIO(content))
+        response = self.send(
+            client, url, 2 * self.PART_SIZE, content[2 * self.PART_SIZE:]
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["status"] == UserImage.Status.READY
+        assert response["Upload-Offset"] == str(len(content))
+        s3.assert_no_pending_responses()
+        assert not UploadSession.objects.exists()
+        assert session.user_image.thumbnails.count() == (
+            user.account_type.thumbs.count()
+        )
+
+    def test_chunk_at_wrong_offset(self, api_user, s3, content):
+        user, client = api_user
+        url = self.create(client, s3, len(content)).data["upload"]["url"]
+
+        response = self.send(client, url, self.PART_SIZE, content[:10])
+
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert response["Upload-Offset"] == "0"
+
+    def test_chunk_smaller_than_part(self, api_user, s3, content):
+        user, client = api_user
+        url = self.create(client, s3, len(content)).data["upload"]["url"]
+
+        response = self.send(client, url, 0, content[: self.PART_SIZE // 2])
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data["part_size"] == self.PART_SIZE
+        assert response["Upload-Offset"] == "0"
+        s3.assert_no_pending_responses()
+
+    def test_chunk_not_made_of_full_parts(self, api_user, s3, content):
+        user, client = api_user
+        url = self.create(client, s3, len(content)).data["upload"]["url"]
+
+        response = self.send(
+            client, url, 0, content[: int(1.5 * self.PART_SIZE)]
+        )
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data["part_size"] == self.PART_SIZE
+        assert UploadSession.objects.get().offset == 0
+
+    def test_not_an_image(self, api_user, s3):
+        user, client = api_user
+        url = self.create(client, s3, 100).data["upload"]["url"]
+        s3.add_response(
+            "abort_multipart_upload",
+            {},
+            {"Bucket": "images", "Key": ANY, "UploadId": "upload-1"},
+        )
+
+        response = self.send(client, url, 0, b"x" * 100)
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "image" in response.data
+        assert not UserImage.objects.exists()
+        s3.assert_no_pending_responses()
+
+    def test_other_users_upload(self, api_user, s3, content):
+        user, client = api_user
+        url = self.create(client, s3, len(content)).data["upload"]["url"]
+        _, token = AuthToken.objects.create(CustomUserFactory())
+        other = APIClient()
+        other.credentials(HTTP_AUTHORIZATION="Token " + token)
+
+        assert other.head(url).status_code == status.HTTP_404_NOT_FOUND
+        assert self.send(other, url, 0, content).status_code == (
+            status.HTTP_404_NOT_FOUND
+        )
+
+    def test_abandon_upload(self, api_user, s3, content):
+        user, client = api_user
+        url = self.create(client, s3, len(content)).data["upload"]["url"]
+        s3.add_response(
+            "abort_multipart_upload",
+            {},
+            {"Bucket": "images", "Key": ANY, "UploadId": "upload-1"},
+        )
+
+        response = client.delete(url)
+
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert not UserImage.objects.exists()
+        assert not UploadSession.objects.exists()
+
+    def test_bulk_delete_aborts_upload(self, api_user, s3, content):
+        user, client = api_user
+        user_image_id = self.create(client, s3, len(content)).data["id"]
+        s3.add_response(
+            "abort_multipart_upload",
+            {},
+            {"Bucket": "images", "Key": ANY, "UploadId": "upload-1"},
+        )
+
+        response = client.post(
+            reverse("userimage-bulk-delete"),
+            {"ids": [user_image_id]},
+            format="json",
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert not UserImage.objects.exists()
+        assert not UploadSession.objects.exists()
+        s3.assert_no_pending_responses()
+
+
 class TestGenerateTemporaryLinkView:
     @pytest.fixture
     def user(self, mocker):
@@ -489,6 +1275,8 @@ class TestGenerateTemporaryLinkView:
     def test_generate_temporary_link_for_user_image(self, mocker, user):
         user, token = user
         user_image = UserImageFactory(author=user)
+        # At the start of an expiry bucket, the link lasts the full hour.
+        mocker.patch("images_rest_api.links.time.time", return_value=36000)
         mock_s3 = mocker.patch("boto3.client")
         mock_generate_presigned_url = MagicMock()
         mock_s3.return_value.generate_presigned_url = mock_generate_presigned_url
@@ -515,6 +1303,8 @@ class TestGenerateTemporaryLinkView:
     def test_generate_temporary_link_for_user_thumbnail(self, mocker, user):
         user, token = user
         user_image = UserImageFactory(author=user)
+        # At the start of an expiry bucket, the link lasts the full hour.
+        mocker.patch("images_rest_api.links.time.time", return_value=36000)
         mock_s3 = mocker.patch("boto3.client")
         mock_generate_presigned_url = MagicMock()
         mock_s3.return_value.generate_presigned_url = mock_generate_presigned_url
@@ -559,3 +1349,136 @@ class TestGenerateTemporaryLinkView:
         response = client.get(url, {"expiration_time_seconds": 30001}, 
         format="json")
         assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+class TestGenerateTemporaryLinksView:
+    @pytest.fixture
+    def api_account_type(self):
+        return AccountTypeFactory(time_limited_link=True)
+
+    @pytest.fixture
+    def presign(self, mocker):
+        mock_s3 = mocker.patch("boto3.client")
+        presign = mock_s3.return_value.generate_presigned_url
+        presign.side_effect = lambda method, Params, ExpiresIn: (
+            f"https://s3.example.com/{Params['Key']}"
+        )
+        return presign
+
+    def post(self, client, data):
+        return client.post(
+            reverse("generate-temporary-links"), data, format="json"
+        )
+
+    def test_generate_temporary_links(self, api_user, presign):
+        user, client = api_user
+        user_image = UserImageFactory(author=user)
+        thumbnail = user_image.thumbnails.first()
+        other = UserImageFactory()
+        missing = other.id + 1000
+
+        response = self.post(
+            client,
+            {
+                "files": [
+                    {"file_type": "image", "file_id": user_image.id},
+                    {"file_type": "thumbnail", "file_id": thumbnail.id},
+                    {"file_type": "image", "file_id": other.id},
+                    {"file_type": "image", "file_id": missing},
+                ],
+                "expiration_time_seconds": 600,
+            },
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == {
+            "image": {
+                str(user_image.id): {
+                    "temporary_url": (
+                        f"https://s3.example.com/{user_image.image.name}"
+                    )
+                },
+                str(other.id): {"error": "Not found."},
+                str(missing): {"error": "Not found."},
+            },
+            "thumbnail": {
+                str(thumbnail.id): {
+                    "temporary_url": (
+                        f"https://s3.example.com/{thumbnail.image.name}"
+                    )
+                },
+            },
+        }
+        assert presign.call_count == 2
+
+    def test_account_without_time_limited_links(self, api_user, presign):
+        user, client = api_user
+        user.account_type.time_limited_link = False
+        user.account_type.save()
+
+        response = self.post(
+            client, {"files": [{"file_type": "image", "file_id": 1}]}
+        )
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+        presign.assert_not_called()
+
+    @pytest.mark.parametrize(
+        "data",
+        [
+            {"files": []},
+            {"files": [{"file_type": "video", "file_id": 1}]},
+            {
+                "files": [{"file_type": "image", "file_id": 1}],
+                "expiration_time_seconds": 299,
+            },
+        ],
+    )
+    def test_invalid_request(self, api_user, data):
+        user, client = api_user
+
+        response = self.post(client, data)
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_too_many_files(self, api_user, settings):
+        settings.TEMPORARY_LINKS_MAX_FILES = 2
+        user, client = api_user
+
+        response = self.post(
+            client,
+            {
+                "files": [
+                    {"file_type": "image", "file_id": file_id}
+                    for file_id in range(1, 4)
+                ]
+            },
+        )
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "files" in response.data
+
+
+class TestStoragePoolMetricsView:
+    def test_admin_gets_pool_metrics(self, api_user):
+        user, client = api_user
+        user.is_staff = True
+        user.save()
+
+        response = client.get(reverse("storage-metrics"))
+
+        assert response.status_code == status.HTTP_200_OK
+        assert set(response.data) == {
+            "max_pool_connections",
+            "requests",
+            "failed_requests",
+            "in_flight",
+            "peak_in_flight",
+        }
+
+    def test_other_users_are_rejected(self, api_user):
+        _, client = api_user
+
+        response = client.get(reverse("storage-metrics"))
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
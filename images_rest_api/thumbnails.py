@@ -0,0 +1,387 @@
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef
+from PIL import Image as pilimage
+
+from .admission import get_decode_budget
+from .models import Blob, StorageTombstone, Thumbnail, ThumbnailSize
+from .storage import save_files
+from .strips import (
+    png_header,
+    reduce_factor,
+    reduce_in_strips,
+    reduced_size,
+    strip_rows,
+)
+
+# Decode JPEGs at no less than DRAFT_GAP times the largest thumbnail, so the
+# final LANCZOS pass still has enough pixels to work with.
+DRAFT_GAP = 2.0
+# Let Pillow box-reduce by an integer factor first whenever the source is at
+# least REDUCING_GAP times bigger than the output.
+REDUCING_GAP = 3.0
+
+
+def thumbnail_size(source_size, height):
+    """
+    Width and height of a thumbnail `height` px high keeping the aspect ratio.
+    """
+    original_width, original_height = source_size
+    new_width = int(original_width * (height / original_height))
+    return (new_width, height)
+
+
+def draft_for(pillow_image, heights):
+    """
+    Let JPEGs decode at the smallest scale still good enough for the
+    largest of `heights`. No-op for other formats.
+    """
+    largest = thumbnail_size(pillow_image.size, max(heights))
+    pillow_image.draft(
+        pillow_image.mode,
+        (int(largest[0] * DRAFT_GAP), int(largest[1] * DRAFT_GAP)),
+    )
+
+
+def strip_factor(source, heights):
+    """
+    Factor `render_thumbnails` reduces `source` by while decoding it in
+    strips, None if it's decoded as a whole.
+
+    Only PNGs of at least THUMBNAIL_STRIP_MIN_PIXELS pixels are decoded in
+    strips, JPEGs are already decoded at a reduced scale by `draft`.
+    """
+    header = png_header(source)
+    if header is None:
+        return None
+
+    width, height, _ = header
+    if width * height < settings.THUMBNAIL_STRIP_MIN_PIXELS:
+        return None
+    largest = thumbnail_size((width, height), max(heights))
+    factor = reduce_factor((width, height), largest, DRAFT_GAP)
+    return factor if factor > 1 else None
+
+
+def decoded_pixels(source, heights):
+    """
+    Number of pixels `render_thumbnails` holds decoded at once for `source`.
+    Only the header of the image is read.
+    """
+    heights = list(heights)
+    if not heights:
+        return 0
+
+    factor = strip_factor(source, heights)
+    if factor is not None:
+        width, height, _ = png_header(source)
+        reduced_width, reduced_height = reduced_size((width, height), factor)
+        rows = strip_rows(width, factor, settings.THUMBNAIL_STRIP_PIXELS)
+        return reduced_width * reduced_height + width * rows
+
+    source.seek(0)
+    pillow_image = pilimage.open(source)
+    draft_for(pillow_image, heights)
+    width, height = pillow_image.size
+    source.seek(0)
+    return width * height
+
+
+def resize_cascade(pillow_image, heights, source_size=None):
+    """
+    Yield (height, image) for every height, largest first.
+
+    The source is decoded once. JPEGs are decoded straight at a reduced scale
+    in the DCT domain (`draft`), and each smaller size is derived from the
+    previous, already reduced, rendition instead of the full-size original.
+
+    `source_size` is the size of the original when `pillow_image` is an
+    already reduced copy of it.
+    """
+    heights = sorted(set(heights), reverse=True)
+    source_size = source_size or pillow_image.size
+    draft_for(pillow_image, heights)
+
+    base = pillow_image
+    for height in heights:
+        resized = base.resize(
+            thumbnail_size(source_size, height),
+            pilimage.LANCZOS,
+            reducing_gap=REDUCING_GAP,
+        )
+        # Upscaled renditions would only add blur to the smaller ones.
+        if resized.height < base.height:
+            base = resized
+        yield height, resized
+
+
+def render_thumbnails(source, heights):
+    """
+    Render the image file `source` at every height.
+
+    Returns the file extension and a dict mapping each height to the encoded
+    thumbnail. Giant PNGs are box-reduced strip by strip first, so the whole
+    original is never decoded at once.
+    """
+    pillow_image = pilimage.open(source)
+    file_format = pillow_image.format
+    source_size = pillow_image.size
+    renditions = {}
+
+    factor = strip_factor(source, heights)
+    if factor is not None:
+        pillow_image = reduce_in_strips(
+            source, factor, settings.THUMBNAIL_STRIP_PIXELS
+        )
+
+    for height, resized in resize_cascade(pillow_image, heights, source_size):
+        thumb_io = BytesIO()
+        resized.save(thumb_io, format=file_format)
+        renditions[height] = thumb_io.getvalue()
+
+    return file_format.lower(), renditions
+
+
+_render_pool = None
+_render_slots = None
+_render_pool_lock = threading.Lock()
+
+
+def _init_render_worker():
+    # Import every Pillow plugin once, not on the first open() of each format.
+    pilimage.init()
+
+
+def _render_in_worker(data, heights):
+    return render_thumbnails(BytesIO(data), heights)
+
+
+def _start_render_worker():
+    pass
+
+
+def get_render_pool():
+    """
+    Process-wide pool of THUMBNAIL_RENDER_WORKERS processes, created on first
+    use and shared by every thread of this process.
+
+    The executor only forks its processes on the first submit, so that is
+    done right away: call this before starting other threads, a process
+    forked while they hold locks or DB connections inherits them.
+    """
+    global _render_pool, _render_slots
+
+    with _render_pool_lock:
+        if _render_pool is None:
+            _render_pool = ProcessPoolExecutor(
+                max_workers=settings.THUMBNAIL_RENDER_WORKERS,
+                initializer=_init_render_worker,
+            )
+            for future in [
+                _render_pool.submit(_start_render_worker)
+                for _ in range(settings.THUMBNAIL_RENDER_WORKERS)
+            ]:
+                future.result()
+            _render_slots = threading.BoundedSemaphore(
+                settings.THUMBNAIL_RENDER_QUEUE_SIZE
+            )
+        return _render_pool, _render_slots
+
+
+def shutdown_render_pool():
+    global _render_pool, _render_slots
+
+    with _render_pool_lock:
+        if _render_pool is not None:
+            _render_pool.shutdown()
+        _render_pool = None
+        _render_slots = None
+
+
+def submit_render(source, heights):
+    """
+    Schedule `render_thumbnails` of the file `source` and return a Future.
+
+    At most THUMBNAIL_RENDER_QUEUE_SIZE renders are submitted at once, callers
+    above that limit block until a slot frees up. With
+    THUMBNAIL_RENDER_WORKERS = 0 the render runs in the calling thread.
+    """
+    source.seek(0)
+
+    if not settings.THUMBNAIL_RENDER_WORKERS:
+        future = Future()
+        try:
+            future.set_result(render_thumbnails(source, heights))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    pool, slots = get_render_pool()
+    slots.acquire()
+    try:
+        # Render processes need their own copy of the encoded image.
+        future = pool.submit(_render_in_worker, source.read(), list(heights))
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    return future
+
+
+def missing_thumbnail_sizes():
+    """
+    Sizes of the author's current account type a UserImage has no thumbnail
+    of, as a subquery over the outer UserImage.
+    """
+    return ThumbnailSize.objects.filter(
+        accounttype=OuterRef("author__account_type")
+    ).exclude(
+        size__in=Thumbnail.objects.filter(
+            system_name=OuterRef(OuterRef("pk"))
+        ).values("size")
+    )
+
+
+def missing_thumbnails():
+    """
+    Expression telling whether a UserImage lacks a thumbnail size of its
+    author's current account type, to be used in `annotate()`.
+    """
+    return Exists(missing_thumbnail_sizes())
+
+
+def stale_thumbnails():
+    """
+    Thumbnails of a size their author's account type no longer has.
+    """
+    return Thumbnail.objects.exclude(
+        Exists(
+            ThumbnailSize.objects.filter(
+                accounttype=OuterRef("author__account_type"),
+                size=OuterRef("size"),
+            )
+        )
+    )
+
+
+def rendition_digest(instance, height):
+    """
+    Digest of the blob of the `height` px thumbnail of `instance`. Images
+    stored before content addressing use their system name instead.
+    """
+    prefix = instance.blob.digest if instance.blob_id else instance.system_name
+    return f"{prefix}_{height}"
+
+
+def create_thumbnails(instance, source=None):
+    """
+    Store a thumbnail of every size available for the author's account type
+    which the image doesn't have yet.
+
+    Thumbnails of identical content are shared instead of rendered again.
+    Only the remaining sizes are rendered, from `source`, the original as
+    received from the client. Without it the original is read from the
+    storage, once.
+    """
+    user = instance.author
+    heights = set(
+        user.account_type.thumbs.exclude(
+            size__in=instance.thumbnails.values("size")
+        ).values_list("size", flat=True)
+    )
+    if not heights:
+        return
+
+    digests = {rendition_digest(instance, height): height for height in heights}
+    blobs = {
+        digests[digest]: blob
+        for digest, blob in Blob.objects.acquire(list(digests)).items()
+    }
+
+    missing = heights - set(blobs)
+    if missing:
+        try:
+            if source is None:
+                with instance.image.open("rb") as image:
+                    source = BytesIO(image.read())
+            with get_decode_budget().reserve(decoded_pixels(source, missing)):
+                extension, renditions = submit_render(source, missing).result()
+            # Lets go of its own blobs if it fails.
+            blobs.update(store_renditions(instance, extension, renditions))
+        except Exception:
+            Blob.objects.release([blob.pk for blob in blobs.values()])
+            raise
+
+    save_thumbnails(instance, blobs)
+
+
+def store_renditions(instance, extension, renditions):
+    """
+    Upload all renditions at once and register their blobs.
+
+    Returns a dict mapping each height to its Blob.
+    """
+    field = Thumbnail._meta.get_field("image")
+    heights = list(renditions)
+    digests = [rendition_digest(instance, height) for height in heights]
+    files = [
+        (
+            field.generate_filename(None, f"{digest}.{extension}"),
+            renditions[height],
+        )
+        for digest, height in zip(digests, heights)
+    ]
+
+    StorageTombstone.objects.unbury([name for name, _ in files])
+    blobs = {}
+    saved = []
+    try:
+        saved = save_files(field.storage, files)
+        for height, digest, name in zip(heights, digests, saved):
+            blobs[height] = Blob.objects.register(
+                digest, name, len(renditions[height]), field.storage
+            )
+    except Exception:
+        # Whatever is left under the names not registered has no blob,
+        # `release` only buries the files of blobs.
+        StorageTombstone.objects.bury(
+            {name for name, _ in files[len(blobs):]}.union(saved[len(blobs):])
+        )
+        Blob.objects.release([blob.pk for blob in blobs.values()])
+        raise
+    return blobs
+
+
+def save_thumbnails(instance, blobs):
+    """
+    Insert the Thumbnail rows of `blobs` (height -> Blob) with a single
+    query.
+
+    If a concurrent render stored some of the sizes first, the references to
+    `blobs` are dropped again and nothing is inserted.
+    """
+    thumbnails = [
+        Thumbnail(
+            system_name=instance,
+            author=instance.author,
+            size=height,
+            blob=blob,
+            image=blob.name,
+        )
+        for height, blob in blobs.items()
+    ]
+
+    try:
+        with transaction.atomic():
+            Thumbnail.objects.bulk_create(thumbnails)
+    except Exception as e:
+        Blob.objects.release([blob.pk for blob in blobs.values()])
+        if isinstance(e, IntegrityError):
+            return []
+        raise
+
+    return thumbnails
@@ -0,0 +1,48 @@
+import logging
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .models import Blob, StorageTombstone
+from .storage import delete_objects
+
+logger = logging.getLogger(__name__)
+
+
+def drain_tombstones(limit=None):
+    """
+    Delete the files of up to `limit` (TOMBSTONE_BATCH_SIZE) tombstones from
+    the storage, in a single DeleteObjects request on S3.
+
+    Tombstones are claimed with SKIP LOCKED, so any number of workers can
+    drain concurrently. Files that couldn't be deleted keep their tombstone
+    and are retried by a later drain. Returns the number of tombstones
+    cleared.
+    """
+    limit = limit or settings.TOMBSTONE_BATCH_SIZE
+
+    with transaction.atomic():
+        tombstones = list(
+            StorageTombstone.objects.select_for_update(skip_locked=True)
+            .order_by("pk")[:limit]
+        )
+        if not tombstones:
+            return 0
+
+        names = {tombstone.name for tombstone in tombstones}
+        # An identical file may have been stored again under the same name
+        # since it was buried.
+        names -= set(
+            Blob.objects.filter(name__in=names).values_list("name", flat=True)
+        )
+        failed = delete_objects(default_storage, names)
+        cleared = [
+            tombstone.pk for tombstone in tombstones
+            if tombstone.name not in failed
+        ]
+        StorageTombstone.objects.filter(pk__in=cleared).delete()
+
+    if failed:
+        logger.warning("%s files couldn't be deleted.", len(failed))
+    return len(cleared)
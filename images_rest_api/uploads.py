@@ -0,0 +1,339 @@
+import hashlib
+import tempfile
+from io import BytesIO
+
+from django import forms
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from PIL import Image
+from rest_framework import exceptions, serializers, status
+
+ALLOWED_IMAGE_EXTENSIONS = ["jpg", "jpeg", "png"]
+ALLOWED_IMAGE_CONTENT_TYPES = ["image/jpg", "image/jpeg", "image/png"]
+
+# Leading bytes of the image formats we can tell apart without Pillow.
+IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"BM", "bmp"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff"),
+]
+SIGNATURE_LENGTH = 12
+
+# Room for the other multipart fields sent along with the image.
+MULTIPART_OVERHEAD = 64 * 2**10
+
+UPLOAD_TICKET_SALT = "images_rest_api.upload_ticket"
+
+# Enough of the beginning of an image for Pillow to read its dimensions.
+IMAGE_HEADER_BYTES = 256 * 2**10
+
+
+def sniff_image_format(head):
+    """
+    Format of an image judging by its first bytes, None if it isn't one.
+    """
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    for signature, image_format in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return image_format
+    return None
+
+
+def check_image_file(name, image_format, content_type):
+    """
+    Accept only JPEG and PNG images with a matching extension.
+    """
+    image_extension = name.split(".")[-1].lower()
+
+    if image_extension not in ALLOWED_IMAGE_EXTENSIONS:
+        raise serializers.ValidationError(
+            f"{image_extension} - Invalid file extension. Only {ALLOWED_IMAGE_EXTENSIONS} files are accepted."
+        )
+
+    if not image_format or image_format.lower() not in ALLOWED_IMAGE_EXTENSIONS:
+        raise serializers.ValidationError(
+            "Cannot open the file as an image. Please check if the uploaded file is a valid image."
+        )
+
+    if content_type not in ALLOWED_IMAGE_CONTENT_TYPES:
+        raise serializers.ValidationError(
+            f"{content_type} - Invalid file content-type. Only {ALLOWED_IMAGE_CONTENT_TYPES} files are accepted."
+        )
+
+
+def check_image_pixels(size, account_type):
+    """
+    Reject images with more pixels than `account_type` accepts.
+    """
+    width, height = size
+    max_pixels = account_type.max_image_pixels
+    if width * height > max_pixels:
+        raise serializers.ValidationError(
+            f"{width}x{height} - Image is too large. Your account accepts images up to {max_pixels} pixels."
+        )
+
+
+def read_image_header(head):
+    """
+    Format and size of the image `head` is the beginning of, (None, None)
+    if Pillow can't identify it.
+    """
+    try:
+        image = Image.open(BytesIO(head))
+    except Exception:
+        return None, None
+    return image.format, image.size
+
+
+def file_sha256(file):
+    """
+    Hex SHA-256 of an uploaded file. Files received by ImageUploadHandler
+    were hashed while they were received.
+    """
+    digest = getattr(file, "sha256", None)
+    if digest:
+        return digest
+
+    sha256 = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(64 * 2**10), b""):
+        sha256.update(chunk)
+    file.seek(0)
+    return sha256.hexdigest()
+
+
+def issue_upload_ticket(user, sha256, size):
+    """
+    Signed permission for `user` to upload the file with this hash and size.
+    """
+    return signing.dumps(
+        {"user": user.pk, "sha256": sha256, "size": size},
+        salt=UPLOAD_TICKET_SALT,
+    )
+
+
+def check_upload_ticket(ticket, user, file):
+    """
+    Raise ValidationError unless `ticket` was issued to `user` for `file`
+    and hasn't expired.
+    """
+    try:
+        claims = signing.loads(
+            ticket,
+            salt=UPLOAD_TICKET_SALT,
+            max_age=settings.UPLOAD_TICKET_MAX_AGE,
+        )
+    except signing.BadSignature:
+        raise serializers.ValidationError("Invalid or expired upload ticket.")
+
+    if claims["user"] != user.pk:
+        raise serializers.ValidationError("Invalid or expired upload ticket.")
+    if claims["size"] != file.size or claims["sha256"] != file_sha256(file):
+        raise serializers.ValidationError(
+            "The uploaded file doesn't match the upload ticket."
+        )
+
+
+class UploadTooLarge(exceptions.APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = "The uploaded file is too large."
+    default_code = "upload_too_large"
+
+
+class StreamedUploadedFile(UploadedFile):
+    """
+    A file received by ImageUploadHandler, with its SHA-256 hex digest and
+    the image format found in its first bytes.
+    """
+
+    def __init__(self, file, name, content_type, size, charset,
+    content_type_extra, sha256, sniffed_format):
+        super().__init__(file, name, content_type, size, charset,
+        content_type_extra)
+        self.sha256 = sha256
+        self.sniffed_format = sniffed_format
+
+
+class ImageUploadHandler(FileUploadHandler):
+    """
+    Upload handler that hashes, measures and sniffs every file while it is
+    being received.
+
+    Files are spooled in memory up to FILE_UPLOAD_MAX_MEMORY_SIZE and to
+    disk above it. Bodies bigger than IMAGE_UPLOAD_MAX_SIZE and files which
+    are not JPEG or PNG images are rejected as soon as that is known, without
+    reading the rest of the request.
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+    encoding=None):
+        if content_length > settings.IMAGE_UPLOAD_MAX_SIZE + MULTIPART_OVERHEAD:
+            raise self.too_large()
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = tempfile.SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+        )
+        self.sha256 = hashlib.sha256()
+        self.head = b""
+        self.sniffed_format = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.IMAGE_UPLOAD_MAX_SIZE:
+            self.file.close()
+            raise self.too_large()
+
+        if len(self.head) < SIGNATURE_LENGTH:
+            self.head += raw_data[:SIGNATURE_LENGTH]
+            if len(self.head) >= SIGNATURE_LENGTH:
+                self.sniff()
+
+        self.sha256.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        if len(self.head) < SIGNATURE_LENGTH:
+            self.sniff()
+
+        self.file.seek(0)
+        return StreamedUploadedFile(
+            file=self.file,
+            name=self.file_name,
+            content_type=self.content_type,
+            size=file_size,
+            charset=self.charset,
+            content_type_extra=self.content_type_extra,
+            sha256=self.sha256.hexdigest(),
+            sniffed_format=self.sniffed_format,
+        )
+
+    def sniff(self):
+        self.sniffed_format = sniff_image_format(self.head)
+        try:
+            if self.sniffed_format is None:
+                raise serializers.ValidationError(
+                    serializers.ImageField.default_error_messages[
+                        "invalid_image"
+                    ]
+                )
+            check_image_file(
+                self.file_name,
+                self.sniffed_format,
+                Image.MIME.get(self.sniffed_format.upper()),
+            )
+        except serializers.ValidationError as e:
+            self.file.close()
+            raise serializers.ValidationError({self.field_name: e.detail})
+
+    def too_large(self):
+        return UploadTooLarge(
+            f"The uploaded file is too large. Maximum size is "
+            f"{settings.IMAGE_UPLOAD_MAX_SIZE} bytes."
+        )
+
+
+class BatchImageUploadHandler(ImageUploadHandler):
+    """
+    ImageUploadHandler for a request carrying up to BATCH_UPLOAD_MAX_FILES
+    images.
+
+    A file that is too large or isn't a JPEG or PNG image doesn't fail the
+    request: the rest of it is skipped and it comes out empty, with the
+    reason in its `errors`.
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+    encoding=None):
+        self.file_count = 0
+        if content_length > settings.BATCH_UPLOAD_MAX_SIZE + MULTIPART_OVERHEAD:
+            raise UploadTooLarge(
+                f"The request is too large. Maximum size is "
+                f"{settings.BATCH_UPLOAD_MAX_SIZE} bytes."
+            )
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file_count += 1
+        if self.file_count > settings.BATCH_UPLOAD_MAX_FILES:
+            self.file.close()
+            raise serializers.ValidationError(
+                {
+                    self.field_name: f"Only {settings.BATCH_UPLOAD_MAX_FILES} "
+                    f"files can be uploaded at once."
+                }
+            )
+        self.errors = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.errors is not None:
+            return
+        try:
+            super().receive_data_chunk(raw_data, start)
+        except UploadTooLarge as e:
+            self.errors = [e.detail]
+        except serializers.ValidationError as e:
+            self.errors = e.detail[self.field_name]
+
+    def file_complete(self, file_size):
+        if self.errors is None:
+            try:
+                return super().file_complete(file_size)
+            except serializers.ValidationError as e:
+                self.errors = e.detail[self.field_name]
+
+        file = StreamedUploadedFile(
+            file=BytesIO(),
+            name=self.file_name,
+            content_type=self.content_type,
+            size=0,
+            charset=self.charset,
+            content_type_extra=self.content_type_extra,
+            sha256=None,
+            sniffed_format=None,
+        )
+        file.errors = self.errors
+        return file
+
+
+class UploadedImageField(forms.ImageField):
+    """
+    Django's ImageField that opens the upload itself with Pillow.
+
+    The stock field validates a copy of in-memory uploads
+    (`BytesIO(data.read())`), which doubles the memory used by every upload.
+    """
+
+    def to_python(self, data):
+        f = forms.FileField.to_python(self, data)
+        if f is None:
+            return None
+
+        if hasattr(data, "temporary_file_path"):
+            file = data.temporary_file_path()
+        else:
+            file = data
+
+        try:
+            image = Image.open(file)
+            # verify() must be called immediately after the constructor.
+            image.verify()
+
+            f.image = image
+            f.content_type = Image.MIME.get(image.format)
+        except Exception as exc:
+            raise ValidationError(
+                self.error_messages["invalid_image"],
+                code="invalid_image",
+            ) from exc
+        if hasattr(f, "seek") and callable(f.seek):
+            f.seek(0)
+        return f
@@ -2,8 +2,10 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from .viewsets import (ChangePasswordView, CreateUserView,
-                       GenerateTemporaryLinkView, LoginView, LogoutAllView,
-                       LogoutView, ManageUserView, UserImagesViewSet)
+                       GenerateTemporaryLinksView, GenerateTemporaryLinkView,
+                       LoginView, LogoutAllView,
+                       LogoutView, ManageUserView, ResumableUploadView,
+                       StoragePoolMetricsView, UserImagesViewSet)
 
 router = DefaultRouter()
 router.register(r"user-images", UserImagesViewSet, basename="userimage")
@@ -14,11 +16,26 @@ urlpatterns = [
         UserImagesViewSet.as_view({'get': 'retrieve', 'delete': 'destroy'}),
         name="userimage-detail",
     ),
+    path(
+        "user-images/resumable/<uuid:upload_id>/",
+        ResumableUploadView.as_view(),
+        name="resumable-upload",
+    ),
     path(
         "generate-temporary-link/<str:file_type>/<int:file_id>/",
         GenerateTemporaryLinkView.as_view(),
         name="generate-temporary-link",
     ),
+    path(
+        "generate-temporary-links/",
+        GenerateTemporaryLinksView.as_view(),
+        name="generate-temporary-links",
+    ),
+    path(
+        "storage-metrics/",
+        StoragePoolMetricsView.as_view(),
+        name="storage-metrics",
+    ),
     path("create_user/", CreateUserView.as_view(), name="create_user"),
     path("user_profile/", ManageUserView.as_view(), name="profile"),
     path("change_password/", ChangePasswordView.as_view(), name="change_password"),
@@ -1,8 +1,12 @@
-import boto3
-from botocore.exceptions import NoCredentialsError
+import uuid
+from pathlib import Path
+
+from botocore.exceptions import ClientError, NoCredentialsError
 from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
 from django.contrib.auth import get_user_model, login
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import (
@@ -19,23 +23,64 @@ from knox.views import LogoutAllView as KnoxLogoutAllView
 from rest_framework import generics, permissions, status, views
 from rest_framework.authtoken.serializers import AuthTokenSerializer
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework.viewsets import ModelViewSet
 
-from .models import Thumbnail, UserImage
+from .models import Blob, Thumbnail, UploadSession, UserImage
 from .serializers import (
     AddImageSerializer,
     AuthSerializer,
     BasicUserImageSerializer,
+    BulkDeleteSerializer,
     ChangePasswordSerializer,
+    DirectUploadSerializer,
     NotBasicUserImageSerializer,
+    ResumableUploadSerializer,
+    TemporaryLinksSerializer,
+    UploadHandshakeSerializer,
     UserSerializer,
 )
-from rest_framework.decorators import parser_classes
+from .admission import get_decode_budget
+from .exports import EXPORT_CHOICES, export_library
+from .imports import create_user_images, is_archive
+from .jobs import enqueue_import, enqueue_render, render_missing_thumbnails
+from .links import StorageURLs, get_link_cache
+from .resumable import (
+    UPLOAD_CONTENT_TYPE,
+    abort_upload,
+    chunk_fits_parts,
+    complete_upload,
+    upload_chunk,
+)
+from .s3 import get_pool_metrics, get_s3_client
+from .thumbnails import decoded_pixels, missing_thumbnails
+from .uploads import (
+    IMAGE_HEADER_BYTES,
+    BatchImageUploadHandler,
+    ImageUploadHandler,
+    UploadTooLarge,
+    check_image_file,
+    check_image_pixels,
+    issue_upload_ticket,
+    read_image_header,
+)
+from rest_framework.serializers import ValidationError
+from rest_framework.decorators import action, parser_classes
 from rest_framework.parsers import FormParser
 
 User = get_user_model()
 
 
+def direct_upload_key(content_type):
+    """
+    Storage name of an image the client uploads straight to S3.
+    """
+    extension = "png" if content_type == "image/png" else "jpg"
+    return UserImage._meta.get_field("image").generate_filename(
+        None, f"direct/{uuid.uuid4()}.{extension}"
+    )
+
+
 class IsOwnerOrReadOnly(permissions.BasePermission):
     """
     Custom permission class to allow object access only to the owner or 
@@ -400,7 +445,24 @@ class UserImagesViewSet(ModelViewSet):
     permission_classes = [permissions.IsAuthenticated & IsOwnerOrReadOnly]
     http_method_names = ["get", "post", "delete"]
 
+    def initialize_request(self, request, *args, **kwargs):
+        action = self.action_map.get(request.method.lower())
+        if action == "batch":
+            request.upload_handlers = [BatchImageUploadHandler(request)]
+        elif action != "import_archive":
+            # Archives are received by Django's default upload handlers.
+            request.upload_handlers = [ImageUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
     def get_serializer_class(self):
+        if self.action == "handshake":
+            return UploadHandshakeSerializer
+        if self.action == "direct_upload":
+            return DirectUploadSerializer
+        if self.action == "resumable":
+            return ResumableUploadSerializer
+        if self.action == "bulk_delete":
+            return BulkDeleteSerializer
         if self.request.method == "POST":
             return AddImageSerializer
         else:
@@ -411,8 +473,36 @@ class UserImagesViewSet(ModelViewSet):
             else:
                 return BasicUserImageSerializer
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["storage_urls"] = StorageURLs()
+        return context
+
     def get_queryset(self):
-        return UserImage.objects.filter(author=self.request.user).order_by("id")
+        queryset = UserImage.objects.filter(author=self.request.user).order_by("id")
+        if self.request.method == "GET":
+            queryset = queryset.annotate(missing_thumbnails=missing_thumbnails())
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        user_images = page if page is not None else list(queryset)
+
+        # Sizes added to the account type since the upload are rendered the
+        # first time the images are viewed.
+        render_missing_thumbnails(user_images)
+
+        serializer = self.get_serializer(user_images, many=True)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        render_missing_thumbnails([instance])
+        serializer = self.get_serializer(instance)
+        return Response(serializer.data)
 
     @extend_schema(
         examples=[
@@ -474,13 +564,568 @@ class UserImagesViewSet(ModelViewSet):
         data = serializer.validated_data
         data["author"] = request.user
 
-        self.perform_create(serializer)
+        if settings.JOBS_RUN_EAGERLY:
+            # Thumbnails are rendered within this request, so it must not
+            # start decoding while the process is out of memory budget.
+            heights = request.user.account_type.thumbs.values_list(
+                "size", flat=True
+            )
+            pixels = decoded_pixels(data["image"], heights)
+            with get_decode_budget().reserve(
+                pixels, timeout=settings.DECODE_BUDGET_TIMEOUT
+            ):
+                self.perform_create(serializer)
+        else:
+            self.perform_create(serializer)
         headers = self.get_success_headers(serializer.data)
 
         return Response(
             serializer.data, status=status.HTTP_201_CREATED, headers=headers
         )
 
+    @extend_schema(
+        request={
+            "multipart/form-data": {
+                "type": "object",
+                "properties": {
+                    "images": {
+                        "type": "array",
+                        "items": {"type": "string", "format": "binary"},
+                    }
+                },
+            }
+        },
+        responses={201: OpenApiTypes.OBJECT, 400: OpenApiTypes.OBJECT},
+        examples=[
+            OpenApiExample(
+                "Valid example",
+                summary="Batch with an invalid file.",
+                description="The valid images are created, the invalid ones \
+                    are reported with their errors.",
+                value={
+                    "results": [
+                        {
+                            "file": "icon57.png",
+                            "id": 21,
+                            "name": "icon57",
+                            "status": "pending",
+                        },
+                        {
+                            "file": "notes.txt",
+                            "errors": {
+                                "image": [
+                                    "Upload a valid image. The file you \
+                                        uploaded was either not an image or \
+                                        a corrupted image."
+                                ]
+                            },
+                        },
+                    ]
+                },
+                response_only=True,
+            ),
+        ],
+    )
+    @action(detail=False, methods=["post"])
+    def batch(self, request, *args, **kwargs):
+        """
+        Upload up to BATCH_UPLOAD_MAX_FILES images in one multipart request,
+        each as an `images` file named after its file name.
+
+        Every file is validated on its own, the response has a result per
+        file in the order they were sent. Invalid files are reported with
+        their errors and don't stop the valid ones from being created.
+        """
+        files = request.FILES.getlist("images")
+        if not files:
+            return Response(
+                {"images": ["No file was submitted."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        results, valid = [], []
+        for index, file in enumerate(files):
+            errors = getattr(file, "errors", None)
+            if errors is not None:
+                errors = {"image": errors}
+            else:
+                serializer = AddImageSerializer(
+                    data={"name": Path(file.name).stem[:164], "image": file},
+                    context=self.get_serializer_context(),
+                )
+                if serializer.is_valid():
+                    valid.append((index, serializer.validated_data))
+                else:
+                    errors = serializer.errors
+            results.append({"file": file.name, "errors": errors})
+
+        user_images = create_user_images(
+            request.user,
+            [(data["name"], data["image"]) for _, data in valid],
+        )
+        ids = [user_image.pk for user_image in user_images]
+        statuses = dict(
+            UserImage.objects.filter(pk__in=ids).values_list("pk", "status")
+        )
+        for (index, _), user_image in zip(valid, user_images):
+            user_image.status = statuses[user_image.pk]
+            results[index] = {
+                "file": results[index]["file"],
+                **AddImageSerializer(user_image).data,
+            }
+
+        return Response(
+            {"results": results},
+            status=(
+                status.HTTP_201_CREATED if user_images
+                else status.HTTP_400_BAD_REQUEST
+            ),
+        )
+
+    @extend_schema(
+        responses={200: OpenApiTypes.OBJECT},
+        examples=[
+            OpenApiExample(
+                "Delete by id",
+                summary="Deleting images by their ids.",
+                value={"ids": [18, 19, 404]},
+                request_only=True,
+            ),
+            OpenApiExample(
+                "Delete by filter",
+                summary="Deleting all images whose rendering failed.",
+                value={"filter": {"status": "failed"}},
+                request_only=True,
+            ),
+            OpenApiExample(
+                "Valid example",
+                summary="Result per image.",
+                value={
+                    "results": [
+                        {"id": 18, "status": "deleted"},
+                        {"id": 19, "status": "deleted"},
+                        {"id": 404, "status": "not_found"},
+                    ],
+                    "more": False,
+                },
+                response_only=True,
+            ),
+        ],
+    )
+    @action(detail=False, methods=["post"], url_path="bulk-delete")
+    def bulk_delete(self, request, *args, **kwargs):
+        """
+        Delete the images of a list of `ids` or matching a `filter` at once.
+
+        Ownership of all of them is checked with a single query, ids of
+        missing images or images of other users are reported as not found.
+        A filter deletes up to BULK_DELETE_MAX_IMAGES images, `more` tells
+        whether further images match it.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data.get("ids")
+        limit = settings.BULK_DELETE_MAX_IMAGES
+
+        queryset = UserImage.objects.filter(author=request.user)
+        if ids is not None:
+            owned = set(
+                queryset.filter(pk__in=ids).values_list("pk", flat=True)
+            )
+            more = False
+        else:
+            ids = list(
+                queryset.filter(**serializer.validated_data["filter"])
+                .order_by("pk")
+                .values_list("pk", flat=True)[:limit + 1]
+            )
+            more = len(ids) > limit
+            ids = ids[:limit]
+            owned = set(ids)
+
+        # Resumable uploads in progress would leave their parts behind.
+        sessions = UploadSession.objects.filter(
+            user_image__in=owned
+        ).select_related("user_image")
+        if sessions:
+            s3 = get_s3_client()
+            for session in sessions:
+                abort_upload(s3, session)
+
+        # Their files are deleted from the storage later, in batches.
+        UserImage.objects.filter(pk__in=owned).purge()
+
+        return Response(
+            {
+                "results": [
+                    {
+                        "id": pk,
+                        "status": "deleted" if pk in owned else "not_found",
+                    }
+                    for pk in ids
+                ],
+                "more": more,
+            }
+        )
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="include",
+                description="Files to export: all (default with access to \
+                    originals), originals or thumbnails (default otherwise).",
+                type=OpenApiTypes.STR,
+                enum=EXPORT_CHOICES,
+                required=False,
+                location=OpenApiParameter.QUERY,
+            ),
+        ],
+        responses={(200, "application/zip"): OpenApiTypes.BINARY},
+    )
+    @action(detail=False, methods=["get"])
+    def export(self, request, *args, **kwargs):
+        """
+        Download all images as a single ZIP archive, built while it is sent.
+        Originals are only exported for account types with access to them.
+        """
+        has_originals = request.user.account_type.orginal_image_link
+        include = request.query_params.get(
+            "include", "all" if has_originals else "thumbnails"
+        )
+        if include not in EXPORT_CHOICES:
+            return Response(
+                {"include": [f"Choose one of {EXPORT_CHOICES}."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if include != "thumbnails" and not has_originals:
+            return Response(
+                {"detail": "Your account type has no access to originals."},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+
+        response = StreamingHttpResponse(
+            export_library(
+                request.user,
+                originals=include != "thumbnails",
+                thumbnails=include != "originals",
+            ),
+            content_type="application/zip",
+        )
+        response["Content-Disposition"] = 'attachment; filename="images.zip"'
+        return response
+
+    @extend_schema(
+        request={
+            "multipart/form-data": {
+                "type": "object",
+                "properties": {
+                    "archive": {"type": "string", "format": "binary"}
+                },
+            }
+        },
+        responses={202: OpenApiTypes.OBJECT},
+    )
+    @action(detail=False, methods=["post"], url_path="import")
+    def import_archive(self, request, *args, **kwargs):
+        """
+        Import every image of a ZIP or TAR archive, named after their file
+        names.
+
+        The archive is imported by a background worker, invalid images in it
+        are skipped.
+        """
+        content_length = int(request.META.get("CONTENT_LENGTH") or 0)
+        if content_length > settings.IMPORT_ARCHIVE_MAX_SIZE:
+            raise UploadTooLarge(
+                f"The archive is too large. Maximum size is "
+                f"{settings.IMPORT_ARCHIVE_MAX_SIZE} bytes."
+            )
+
+        archive = request.FILES.get("archive")
+        if archive is None:
+            return Response(
+                {"archive": ["No file was submitted."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not is_archive(archive):
+            return Response(
+                {"archive": ["The file is not a ZIP or TAR archive."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        name = default_storage.save(f"imports/{uuid.uuid4()}", archive)
+        enqueue_import(request.user, name)
+
+        return Response(
+            {"detail": "The archive is being imported."},
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+    @extend_schema(
+        responses={200: OpenApiTypes.OBJECT, 201: OpenApiTypes.OBJECT},
+        examples=[
+            OpenApiExample(
+                "Already uploaded",
+                summary="The image was created without uploading it again.",
+                description="The user uploaded the same file before, the new \
+                    image shares it.",
+                value={
+                    "upload_required": False,
+                    "image": {"id": 18, "name": "icon57", "status": "ready"},
+                },
+                response_only=True,
+                status_codes=["201"],
+            ),
+            OpenApiExample(
+                "Upload required",
+                summary="The file must be uploaded.",
+                description="Send the file to the create endpoint along with \
+                    the ticket.",
+                value={
+                    "upload_required": True,
+                    "ticket": "eyJ1c2VyIjoxLCJzaGEyNTYiOiI...:1qZ0Yb:Xk3...",
+                },
+                response_only=True,
+                status_codes=["200"],
+            ),
+        ],
+    )
+    @action(detail=False, methods=["post"])
+    def handshake(self, request, *args, **kwargs):
+        """
+        Announce an upload by the SHA-256 and size of the file.
+
+        If the user already uploaded this file, the image is created right
+        away and nothing needs to be sent. Otherwise the response carries a
+        ticket to send along with the file to the create endpoint.
+        """
+        serializer = self.get_serializer(data=request.data)
+
+        if not serializer.is_valid():
+            return Response(serializer.errors,
+            status=status.HTTP_400_BAD_REQUEST)
+
+        data = serializer.validated_data
+        # Only the user's own files are taken on trust, knowing the hash of
+        # someone else's file must not give access to it.
+        blob = None
+        if UserImage.objects.filter(
+            author=request.user,
+            blob__digest=data["sha256"],
+            blob__size=data["size"],
+        ).exists():
+            blob = Blob.objects.acquire([data["sha256"]]).get(data["sha256"])
+
+        if blob is None:
+            return Response(
+                {
+                    "upload_required": True,
+                    "ticket": issue_upload_ticket(
+                        request.user, data["sha256"], data["size"]
+                    ),
+                }
+            )
+
+        user_image = UserImage.objects.create(
+            name=data["name"], author=request.user, blob=blob, image=blob.name
+        )
+        return Response(
+            {
+                "upload_required": False,
+                "image": AddImageSerializer(user_image).data,
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+    @extend_schema(
+        responses={201: OpenApiTypes.OBJECT},
+        examples=[
+            OpenApiExample(
+                "Valid example",
+                summary="Upload reserved.",
+                description="POST the file to `url` as multipart/form-data \
+                    with all `fields` and the file last, as `file`.",
+                value={
+                    "id": 19,
+                    "name": "icon57",
+                    "status": "uploading",
+                    "upload": {
+                        "url": "https://bucket.s3.amazonaws.com/",
+                        "fields": {
+                            "Content-Type": "image/png",
+                            "key": "user_images/direct/0b4e....png",
+                            "policy": "eyJleHBpcmF0aW9uIjo...",
+                        },
+                    },
+                },
+                response_only=True,
+            ),
+        ],
+    )
+    @action(detail=False, methods=["post"], url_path="direct-upload")
+    def direct_upload(self, request, *args, **kwargs):
+        """
+        Reserve an image uploaded by the client straight to the storage.
+
+        Returns a presigned S3 POST accepting only a file of the declared
+        content type up to IMAGE_UPLOAD_MAX_SIZE bytes. Once it is uploaded,
+        call the complete endpoint of the image.
+        """
+        serializer = self.get_serializer(data=request.data)
+
+        if not serializer.is_valid():
+            return Response(serializer.errors,
+            status=status.HTTP_400_BAD_REQUEST)
+
+        content_type = serializer.validated_data["content_type"]
+        key = direct_upload_key(content_type)
+
+        post = get_s3_client().generate_presigned_post(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+            Key=key,
+            Fields={"Content-Type": content_type},
+            Conditions=[
+                {"Content-Type": content_type},
+                ["content-length-range", 1, settings.IMAGE_UPLOAD_MAX_SIZE],
+            ],
+            ExpiresIn=settings.DIRECT_UPLOAD_EXPIRES,
+        )
+        user_image = UserImage.objects.create(
+            name=serializer.validated_data["name"],
+            author=request.user,
+            image=key,
+            status=UserImage.Status.UPLOADING,
+        )
+
+        data = AddImageSerializer(user_image).data
+        data["upload"] = post
+        return Response(data, status=status.HTTP_201_CREATED)
+
+    @extend_schema(
+        responses={201: OpenApiTypes.OBJECT},
+        examples=[
+            OpenApiExample(
+                "Valid example",
+                summary="Resumable upload created.",
+                description="PATCH the file in chunks to `upload.url`.",
+                value={
+                    "id": 20,
+                    "name": "icon57",
+                    "status": "uploading",
+                    "upload": {
+                        "url": "https://example.com/users/images/resumable/\
+                            3f1c.../",
+                        "offset": 0,
+                        "length": 15728640,
+                        "part_size": 8388608,
+                    },
+                },
+                response_only=True,
+            ),
+        ],
+    )
+    @action(detail=False, methods=["post"])
+    def resumable(self, request, *args, **kwargs):
+        """
+        Reserve an image uploaded in chunks which can be resumed after a
+        failure.
+
+        Send the file with PATCH requests to the returned upload url, each
+        with the Upload-Offset header of the byte it starts at. HEAD on the
+        url returns the offset to resume from.
+        """
+        serializer = self.get_serializer(data=request.data)
+
+        if not serializer.is_valid():
+            return Response(serializer.errors,
+            status=status.HTTP_400_BAD_REQUEST)
+
+        data = serializer.validated_data
+        key = direct_upload_key(data["content_type"])
+        multipart = get_s3_client().create_multipart_upload(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+            Key=key,
+            ContentType=data["content_type"],
+        )
+        with transaction.atomic():
+            user_image = UserImage.objects.create(
+                name=data["name"],
+                author=request.user,
+                image=key,
+                status=UserImage.Status.UPLOADING,
+            )
+            session = UploadSession.objects.create(
+                user_image=user_image,
+                content_type=data["content_type"],
+                length=data["length"],
+                part_size=settings.RESUMABLE_UPLOAD_PART_SIZE,
+                multipart_upload_id=multipart["UploadId"],
+            )
+
+        url = request.build_absolute_uri(
+            reverse("resumable-upload", args=[session.id])
+        )
+        response = AddImageSerializer(user_image).data
+        response["upload"] = {
+            "url": url,
+            "offset": session.offset,
+            "length": session.length,
+            "part_size": session.part_size,
+        }
+        return Response(
+            response,
+            status=status.HTTP_201_CREATED,
+            headers={"Location": url, "Upload-Offset": str(session.offset)},
+        )
+
+    @extend_schema(request=None, responses={200: AddImageSerializer})
+    @action(detail=True, methods=["post"])
+    def complete(self, request, *args, **kwargs):
+        """
+        Finish a direct upload: check the uploaded object and queue the
+        rendering of its thumbnails. Invalid files are deleted along with
+        the image.
+        """
+        user_image = self.get_object()
+        if user_image.status != UserImage.Status.UPLOADING:
+            return Response(
+                {"detail": "The upload is already complete."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        s3 = get_s3_client()
+        bucket = settings.AWS_STORAGE_BUCKET_NAME
+        key = user_image.image.name
+        try:
+            head = s3.head_object(Bucket=bucket, Key=key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("404", "NoSuchKey"):
+                raise
+            return Response(
+                {"detail": "The file has not been uploaded yet."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        image_head = s3.get_object(
+            Bucket=bucket, Key=key, Range=f"bytes=0-{IMAGE_HEADER_BYTES - 1}"
+        )["Body"].read()
+
+        image_format, size = read_image_header(image_head)
+        try:
+            check_image_file(key, image_format, head.get("ContentType"))
+            check_image_pixels(size, request.user.account_type)
+        except ValidationError as e:
+            user_image.delete()
+            return Response(
+                {"image": e.detail}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        user_image.status = UserImage.Status.PENDING
+        user_image.save(update_fields=["status"])
+        enqueue_render(user_image)
+        user_image.refresh_from_db(fields=["status"])
+
+        return Response(AddImageSerializer(user_image).data)
+
     @extend_schema(
         parameters=[
             OpenApiParameter(
@@ -494,13 +1139,141 @@ class UserImagesViewSet(ModelViewSet):
     )
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
+        # Its files are deleted from the storage later, in batches.
+        instance.delete()
 
-        thumbnails = Thumbnail.objects.filter(system_name=instance)
-        for thumbnail in thumbnails:
-            thumbnail.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
-        instance.delete()
 
+class ResumableUploadView(views.APIView):
+    """
+    Chunks of a resumable upload, tus-style.
+
+    HEAD returns the offset the upload continues at, PATCH appends a chunk
+    at the offset and DELETE abandons the upload along with its image. The
+    image is checked once its first part arrives and its thumbnails are
+    rendered once the last chunk does.
+    """
+    # Throttled once, when the upload is created.
+    permission_classes = [permissions.IsAuthenticated]
+    http_method_names = ["head", "patch", "delete"]
+
+    def get_session(self, request, upload_id):
+        return get_object_or_404(
+            UploadSession.objects.select_related("user_image"),
+            pk=upload_id,
+            user_image__author=request.user,
+        )
+
+    def offset_headers(self, session):
+        return {
+            "Upload-Offset": str(session.offset),
+            "Upload-Length": str(session.length),
+            "Cache-Control": "no-store",
+        }
+
+    @extend_schema(request=None, responses={200: None})
+    def head(self, request, upload_id):
+        session = self.get_session(request, upload_id)
+        return Response(headers=self.offset_headers(session))
+
+    @extend_schema(request=None, responses={200: AddImageSerializer, 204: None})
+    def patch(self, request, upload_id):
+        session = self.get_session(request, upload_id)
+        user_image = session.user_image
+
+        if request.content_type != UPLOAD_CONTENT_TYPE:
+            return Response(
+                {"detail": f"Chunks must be sent as {UPLOAD_CONTENT_TYPE}."},
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            )
+        try:
+            offset = int(request.headers["Upload-Offset"])
+        except (KeyError, ValueError):
+            return Response(
+                {"detail": "Missing or invalid Upload-Offset header."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if offset != session.offset:
+            return Response(
+                {"detail": "The chunk doesn't start at the upload offset."},
+                status=status.HTTP_409_CONFLICT,
+                headers=self.offset_headers(session),
+            )
+        length = int(request.META.get("CONTENT_LENGTH") or 0)
+        if offset + length > session.length:
+            return Response(
+                {"detail": "The chunk goes past the end of the file."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not chunk_fits_parts(session, length):
+            return Response(
+                {
+                    "detail": (
+                        "Chunks must be a multiple of the part size unless "
+                        "they end the file."
+                    ),
+                    "part_size": session.part_size,
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+                headers=self.offset_headers(session),
+            )
+
+        def check_head(head):
+            image_format, size = read_image_header(head[:IMAGE_HEADER_BYTES])
+            check_image_file(
+                user_image.image.name, image_format, session.content_type
+            )
+            check_image_pixels(size, request.user.account_type)
+
+        s3 = get_s3_client()
+        try:
+            uploaded, parts, error = upload_chunk(
+                s3, session, request.stream, length, check_head
+            )
+        except ValidationError as e:
+            abort_upload(s3, session)
+            user_image.delete()
+            return Response(
+                {"image": e.detail}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # A concurrent request appending at the same offset wins or loses
+        # here as a whole.
+        if not UploadSession.objects.filter(pk=session.pk, offset=offset).update(
+            offset=offset + uploaded, parts=session.parts + parts
+        ):
+            return Response(
+                {"detail": "The chunk doesn't start at the upload offset."},
+                status=status.HTTP_409_CONFLICT,
+            )
+        if error is not None:
+            raise error
+
+        session.offset += uploaded
+        session.parts += parts
+        if session.offset < session.length:
+            return Response(
+                status=status.HTTP_204_NO_CONTENT,
+                headers=self.offset_headers(session),
+            )
+
+        complete_upload(s3, session)
+        session.delete()
+        user_image.status = UserImage.Status.PENDING
+        user_image.save(update_fields=["status"])
+        enqueue_render(user_image)
+        user_image.refresh_from_db(fields=["status"])
+
+        return Response(
+            AddImageSerializer(user_image).data,
+            headers=self.offset_headers(session),
+        )
+
+    def delete(self, request, upload_id):
+        session = self.get_session(request, upload_id)
+        abort_upload(get_s3_client(), session)
+        session.user_image.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -559,18 +1332,9 @@ class GenerateTemporaryLinkView(views.APIView):
 
         file_key = file_instance.image.name
 
-        s3 = boto3.client(
-            "s3",
-            region_name=settings.AWS_S3_REGION_NAME,
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-        )
         try:
-            temporary_url = s3.generate_presigned_url(
-                "get_object",
-                Params={"Bucket": settings.AWS_STORAGE_BUCKET_NAME, 
-                "Key": file_key},
-                ExpiresIn=expiration_time_seconds,
+            temporary_url = get_link_cache().sign(
+                file_key, expiration_time_seconds
             )
         except NoCredentialsError:
             return Response(
@@ -580,3 +1344,129 @@ class GenerateTemporaryLinkView(views.APIView):
 
         return Response({"temporary_url": temporary_url}, 
         status=status.HTTP_200_OK)
+
+
+class HasTimeLimitedLinks(permissions.BasePermission):
+    """
+    Allow access to users whose account type has the time-limited link
+    feature enabled.
+    """
+
+    def has_permission(self, request, view):
+        return request.user.account_type.time_limited_link
+
+
+class GenerateTemporaryLinksView(views.APIView):
+    """
+    Generate temporary links to many images and thumbnails at once.
+    """
+    throttle_scope = 'images'
+    permission_classes = [permissions.IsAuthenticated & HasTimeLimitedLinks]
+    http_method_names = ["post"]
+
+    @extend_schema(
+        request=TemporaryLinksSerializer,
+        responses={200: OpenApiTypes.OBJECT},
+        examples=[
+            OpenApiExample(
+                "Valid example",
+                summary="Links to an image and a thumbnail.",
+                value={
+                    "files": [
+                        {"file_type": "image", "file_id": 18},
+                        {"file_type": "thumbnail", "file_id": 404},
+                    ],
+                    "expiration_time_seconds": 3600,
+                },
+                request_only=True,
+            ),
+            OpenApiExample(
+                "Valid example",
+                summary="A link or an error per file.",
+                value={
+                    "image": {
+                        "18": {"temporary_url": "https://cdn.example.com/..."}
+                    },
+                    "thumbnail": {"404": {"error": "Not found."}},
+                },
+                response_only=True,
+            ),
+        ],
+    )
+    def post(self, request, *args, **kwargs):
+        """
+        Up to TEMPORARY_LINKS_MAX_FILES files are resolved with a query per
+        file type, files that don't exist or belong to other users are
+        reported as not found.
+        """
+        serializer = TemporaryLinksSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        expiration_time_seconds = serializer.validated_data[
+            "expiration_time_seconds"
+        ]
+
+        requested = {"image": [], "thumbnail": []}
+        for file in serializer.validated_data["files"]:
+            requested[file["file_type"]].append(file["file_id"])
+
+        links = get_link_cache()
+        results = {}
+        for file_type, model_class in (
+            ("image", UserImage),
+            ("thumbnail", Thumbnail),
+        ):
+            ids = requested[file_type]
+            if not ids:
+                continue
+            keys = dict(
+                model_class.objects.filter(
+                    author=request.user, pk__in=ids
+                ).values_list("pk", "image")
+            )
+            results[file_type] = {}
+            for file_id in ids:
+                if file_id not in keys:
+                    result = {"error": "Not found."}
+                else:
+                    try:
+                        result = {
+                            "temporary_url": links.sign(
+                                keys[file_id], expiration_time_seconds
+                            )
+                        }
+                    except NoCredentialsError:
+                        return Response(
+                            {"error": "No access to AWS resources."},
+                            status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                        )
+                results[file_type][str(file_id)] = result
+
+        return Response(results, status=status.HTTP_200_OK)
+
+
+class StoragePoolMetricsView(views.APIView):
+    """
+    Usage of the S3 connection pool of the process serving the request,
+    counted since it started. A peak_in_flight close to
+    max_pool_connections means requests wait for a free connection.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    @extend_schema(
+        responses={200: OpenApiTypes.OBJECT},
+        examples=[
+            OpenApiExample(
+                "Valid example",
+                value={
+                    "max_pool_connections": 50,
+                    "requests": 1532,
+                    "failed_requests": 2,
+                    "in_flight": 3,
+                    "peak_in_flight": 41,
+                },
+                response_only=True,
+            ),
+        ],
+    )
+    def get(self, request):
+        return Response(get_pool_metrics())